@@ -6,13 +6,13 @@ This script:
 1. Pulls latest data from GitHub
 2. Triggers Google Colab retraining
 3. Downloads new model files
-4. Restarts Django service
+4. Publishes them as a new model version (running workers hot-swap it)
 """
 
+import json
 import os
 import subprocess
 import requests
-import time
 from datetime import datetime
 
 # Configuration
@@ -20,7 +20,10 @@ GITHUB_REPO = "Baraka-Malila/tomato-market-data"
 GITHUB_TOKEN = "${os.getenv('GITHUB_TOKEN')}" 
 COLAB_NOTEBOOK_URL = "https://colab.research.google.com/drive/12UB01ezUDjN-sWjsJNFgfZ7dWNsStLH-?usp=drive_link"
 MODELS_DIR = "/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/models"
+CHANGES_FILE = "/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/automation/market_data_changes.json"
+INCOMING_DIR = os.path.join(MODELS_DIR, "incoming")
 DATA_DIR = "/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/data"
+BACKEND_DIR = "/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/nyanya_backend"
 
 def log(message):
     """Log with timestamp"""
@@ -43,6 +46,23 @@ def pull_latest_data():
     
     log("Data updated successfully")
 
+def sync_market_data():
+    """Apply only the changed weeks to MarketData; returns the change count"""
+    log("Syncing market data...")
+    
+    subprocess.run(
+        ["python", "manage.py", "sync_market_data",
+         os.path.join(DATA_DIR, "data", "combined_file.csv"),
+         "--changes-file", CHANGES_FILE],
+        cwd=BACKEND_DIR, check=True
+    )
+    
+    with open(CHANGES_FILE) as f:
+        changes = json.load(f)
+    log(f"{len(changes['inserted'])} inserted, {len(changes['updated'])} updated, "
+        f"{len(changes['deleted'])} deleted")
+    return changes['total']
+
 def trigger_colab_training():
     """Trigger Google Colab notebook execution"""
     log("Triggering Google Colab training...")
@@ -64,29 +84,24 @@ def download_model_files():
     # Option 1: From Google Drive (if shared)
     # download_from_gdrive()
     
-    # Option 2: Manual copy
-    log("Manual step: Copy model files to /home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/models/")
+    # Option 2: Manual copy into a staging folder, never over the served files
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    log(f"Manual step: Copy the 4 model files to {INCOMING_DIR}/")
     input("Press Enter after copying model files...")
 
-def restart_django():
-    """Restart Django service to load new model"""
-    log("Restarting Django service...")
+def publish_model():
+    """Publish the new files as a model version; workers hot-swap it"""
+    log("Publishing new model version...")
     
-    try:
-        # Kill existing Django process
-        subprocess.run(["pkill", "-f", "manage.py"], check=False)
-        time.sleep(2)
-        
-        # Start Django in background
-        os.chdir("/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/nyanya_backend")
-        subprocess.Popen([
-            "python", "manage.py", "runserver", "0.0.0.0:8000"
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
-        
-        log("Django restarted successfully")
-        
-    except Exception as e:
-        log(f"Error restarting Django: {e}")
+    # Copies into models/versions/<hash>/ and flips models/CURRENT atomically.
+    # Every running worker's model watcher loads it in the background and
+    # swaps it in, so in-flight requests are never dropped.
+    subprocess.run(
+        ["python", "manage.py", "publish_model", INCOMING_DIR],
+        cwd=BACKEND_DIR, check=True
+    )
+    
+    log("Model published; workers pick it up on their next watcher poll")
 
 def main():
     """Main automation workflow"""
@@ -95,6 +110,9 @@ def main():
     try:
         # Step 1: Get latest data
         pull_latest_data()
+        if sync_market_data() == 0:
+            log("No market data changed upstream; skipping retraining")
+            return 0
         
         # Step 2: Train model
         trigger_colab_training()
@@ -102,8 +120,8 @@ def main():
         # Step 3: Deploy model
         download_model_files()
         
-        # Step 4: Restart service
-        restart_django()
+        # Step 4: Publish new version (no restart)
+        publish_model()
         
         log("Weekly retraining completed successfully!")
         
@@ -6,6 +6,13 @@ set -e
 LOG_FILE="/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/automation/retrain.log"
 DATA_REPO="https://github.com/yBaraka-Malila/tomato-market-data.git"
 PROJECT_DIR="/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA"
+API_URL="http://localhost:8000/api"
+# Seconds to wait for the workers to swap in a new model (MODEL_WATCH_INTERVAL is 30 s by default)
+SWAP_TIMEOUT="${SWAP_TIMEOUT:-120}"
+# Consecutive model-info answers that must name the new version. Each request
+# lands on whichever worker is free, so one answer only speaks for one worker;
+# set this well above the number of gunicorn workers
+SWAP_CONFIRMATIONS="${SWAP_CONFIRMATIONS:-10}"
 
 # Function to log with timestamp
 log() {
@@ -30,34 +37,57 @@ fi
 cp data/combined_file.csv ../data/
 log "Data updated successfully"
 
+# Apply only the weeks that changed; the change set drives the rest
+CHANGES_FILE="$PROJECT_DIR/automation/market_data_changes.json"
+cd "$PROJECT_DIR/nyanya_backend"
+python manage.py sync_market_data "$PROJECT_DIR/data/combined_file.csv" --changes-file "$CHANGES_FILE"
+
+if [ "$(jq .total "$CHANGES_FILE")" = "0" ]; then
+    log "No market data changed upstream; skipping retraining"
+    exit 0
+fi
+log "Market data changes: $(jq -c '{inserted: (.inserted | length), updated: (.updated | length), deleted: (.deleted | length)}' "$CHANGES_FILE")"
+
 # Step 2: Notify for Colab training
 log "🚨 MANUAL STEP REQUIRED:"
 log "1. Open your Google Colab notebook"
 log "2. Upload the updated data file"
 log "3. Run all cells to train the model"
 log "4. Download the 4 .pkl files"
-log "5. Copy them to $PROJECT_DIR/models/"
+log "5. Copy them to $PROJECT_DIR/models/incoming/"
+
+mkdir -p "$PROJECT_DIR/models/incoming"
 
-# Step 3: Wait for model files and restart Django
+# Step 3: Wait for model files
 read -p "Press Enter after completing Colab training and copying model files..."
 
-# Step 4: Restart Django
-log "Restarting Django..."
+# Step 4: Publish new model version (running workers hot-swap it, no restart)
+log "Publishing new model version..."
 cd "$PROJECT_DIR/nyanya_backend"
 
-
-pkill -f "manage.py runserver" || true
-sleep 2
-
-
-nohup python manage.py runserver 0.0.0.0:8000 > /dev/null 2>&1 &
-
-log "Django restarted with new model"
+python manage.py publish_model "$PROJECT_DIR/models/incoming"
+VERSION="$(cat "$PROJECT_DIR/models/CURRENT")"
+
+# Workers swap it in on their next watcher poll; wait until every answer agrees
+log "Model $VERSION published; waiting for the API to serve it..."
+DEADLINE=$((SECONDS + SWAP_TIMEOUT))
+AGREED=0
+while [ "$AGREED" -lt "$SWAP_CONFIRMATIONS" ]; do
+    if [ "$(curl -s "$API_URL/predictions/model-info/" | jq -r .model_version)" = "$VERSION" ]; then
+        AGREED=$((AGREED + 1))
+        continue
+    fi
+    AGREED=0
+    if [ "$SECONDS" -ge "$DEADLINE" ]; then
+        log "API still not serving $VERSION after $SWAP_TIMEOUT s; check the model watcher logs"
+        exit 1
+    fi
+    sleep 2
+done
 log "Weekly retraining completed successfully!"
 
 # Step 5: Test the API
-sleep 5
-curl -s -X POST http://localhost:8000/api/predictions/run/ \
+curl -s -X POST "$API_URL/predictions/run/" \
   -H "Content-Type: application/json" \
   -d '{"week": 33, "rainfall_mm": 80, "temperature_c": 25}' | jq .
 
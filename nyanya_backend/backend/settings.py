@@ -114,6 +114,24 @@ else:
         }
     }
 
+# Cache shared by every worker on the host: a SQLite file in WAL mode
+# (backend.sqlite_cache), so no Redis/memcached is needed; entries beyond
+# CACHE_MAX_ENTRIES are evicted least recently used first
+CACHES = {
+    'default': {
+        'BACKEND': 'backend.sqlite_cache.SQLiteCache',
+        'LOCATION': config('CACHE_LOCATION', default=str(BASE_DIR / 'cache' / 'cache.sqlite3')),
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': config('CACHE_MAX_ENTRIES', default=10000, cast=int),
+            'CULL_FREQUENCY': 10,
+        },
+    }
+}
+
+# Tests use the same cache backend, in a temporary file (backend.test_runner)
+TEST_RUNNER = 'backend.test_runner.TestRunner'
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.0/ref/settings/#auth-password-validators
@@ -207,3 +225,64 @@ TIME_ZONE = config('TIME_ZONE', default='UTC')
 
 # Custom settings for the project
 GITHUB_DATA_URL = config('GITHUB_DATA_URL', default='https://github.com/username/repo/raw/main/data.csv')
+
+# Prediction model
+# MODELS_DIR holds the Colab .pkl files (flat) or the versioned registry
+MODELS_DIR = Path(config('MODELS_DIR', default=str(BASE_DIR.parent / 'models')))
+PREDICTION_ENGINE = config('PREDICTION_ENGINE', default='numpy')  # numpy | sklearn
+PREDICTION_GRID_MODE = config('PREDICTION_GRID_MODE', default='exact')  # exact | nearest | off
+MODEL_WATCH_INTERVAL = config('MODEL_WATCH_INTERVAL', default=30.0, cast=float)
+# Memory-map exported .npy model arrays instead of unpickling per process
+MODEL_ARRAYS = config('MODEL_ARRAYS', default=True, cast=bool)
+# Coalesce concurrent predictions into one forest pass (predictions.batching)
+PREDICTION_BATCHING = config('PREDICTION_BATCHING', default=True, cast=bool)
+PREDICTION_BATCH_WINDOW_MS = config('PREDICTION_BATCH_WINDOW_MS', default=2.0, cast=float)
+PREDICTION_BATCH_MAX_ROWS = config('PREDICTION_BATCH_MAX_ROWS', default=64, cast=int)
+# Memoized predictions: max rows (0 disables), TTL in seconds, and optional
+# rounding of rainfall/temperature (decimals) so near-identical rows share entries
+PREDICTION_CACHE_SIZE = config('PREDICTION_CACHE_SIZE', default=4096, cast=int)
+PREDICTION_CACHE_TTL = config('PREDICTION_CACHE_TTL', default=3600.0, cast=float)
+PREDICTION_CACHE_ROUND = config('PREDICTION_CACHE_ROUND', default=None, cast=lambda v: None if v in (None, '') else int(v))
+# Load the model in AppConfig.ready() instead of on the first prediction
+PRELOAD_MODEL = config('PRELOAD_MODEL', default=False, cast=bool)
+# DataSource fetching (market_data.fetch): parallel downloads, per-request timeout in seconds
+DATA_SOURCE_FETCH_WORKERS = config('DATA_SOURCE_FETCH_WORKERS', default=4, cast=int)
+DATA_SOURCE_FETCH_TIMEOUT = config('DATA_SOURCE_FETCH_TIMEOUT', default=30.0, cast=float)
+# Write-behind log of served predictions (predictions.prediction_log): buffer
+# bound, and rows / seconds that trigger a bulk flush
+PREDICTION_LOG = config('PREDICTION_LOG', default=True, cast=bool)
+PREDICTION_LOG_MAX_RECORDS = config('PREDICTION_LOG_MAX_RECORDS', default=10000, cast=int)
+PREDICTION_LOG_FLUSH_ROWS = config('PREDICTION_LOG_FLUSH_ROWS', default=500, cast=int)
+PREDICTION_LOG_FLUSH_INTERVAL = config('PREDICTION_LOG_FLUSH_INTERVAL', default=5.0, cast=float)
+# Prediction retention (predictions.retention): days kept in the table, and where
+# older rows are archived (use persistent storage; dyno filesystems are ephemeral)
+PREDICTION_RETENTION_DAYS = config('PREDICTION_RETENTION_DAYS', default=180, cast=int)
+PREDICTION_ARCHIVE_DIR = Path(config('PREDICTION_ARCHIVE_DIR', default=str(BASE_DIR / 'archive' / 'predictions')))
+# Dashboard response cache (predictions.response_cache): cache alias, and seconds
+# before an entry expires (writes make entries unreachable long before that)
+RESPONSE_CACHE = config('RESPONSE_CACHE', default=True, cast=bool)
+RESPONSE_CACHE_ALIAS = config('RESPONSE_CACHE_ALIAS', default='default')
+RESPONSE_CACHE_TIMEOUT = config('RESPONSE_CACHE_TIMEOUT', default=86400, cast=int)
+
+# Concurrent misses of one response: seconds a worker holds the shared-cache lock
+# while computing it (others wait for its result; 0 = no cross-worker lock), and
+# seconds after a write during which the previous response is served while the
+# new one is computed in the background (0 = always wait for fresh data)
+RESPONSE_CACHE_LOCK_TIMEOUT = config('RESPONSE_CACHE_LOCK_TIMEOUT', default=30, cast=int)
+RESPONSE_CACHE_STALE_SECONDS = config('RESPONSE_CACHE_STALE_SECONDS', default=0, cast=int)
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'predictions': {
+            'handlers': ['console'],
+            'level': config('PREDICTIONS_LOG_LEVEL', default='INFO'),
+        },
+    },
+}
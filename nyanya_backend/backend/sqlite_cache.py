@@ -0,0 +1,256 @@
+"""
+Shared SQLite Cache Backend
+
+A Django cache backend that keeps its entries in one SQLite file in WAL
+mode, so every process on a host (gunicorn workers, management commands,
+the scheduler) shares one cache without running Redis or memcached:
+    
+    CACHES = {'default': {
+        'BACKEND': 'backend.sqlite_cache.SQLiteCache',
+        'LOCATION': '/path/to/cache.sqlite3',
+        'OPTIONS': {'MAX_ENTRIES': 10000, 'CULL_FREQUENCY': 10},
+    }}
+
+- WAL lets readers run while one process writes; every thread of every
+  process opens its own connection, lazily and again after a fork
+- entries expire after their timeout; expired entries are never returned
+  and are deleted when the cache is culled
+- at most MAX_ENTRIES entries: a write that goes over deletes the
+  expired entries, then the 1/CULL_FREQUENCY least recently used ones
+  (CULL_FREQUENCY=0 clears the cache). Triggers keep a running count of
+  the entries, so writes check the limit without counting the table
+- reads update an entry's access time at most once per LRU_RESOLUTION
+  seconds, so hot keys do not turn every read into a write
+- integers are stored as SQLite integers: incr()/decr() are one atomic
+  UPDATE across processes, and add() is one atomic upsert
+"""
+
+import math
+import os
+import pickle
+import sqlite3
+import threading
+import time
+
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+
+
+# Seconds between access time updates of an entry that keeps being read
+LRU_RESOLUTION = 1.0
+
+# Keys per SELECT/DELETE of the *_many methods
+KEYS_PER_QUERY = 500
+
+# One transaction, so the count starts from the entries of an existing
+# file and every process sees the triggers that maintain it
+SCHEMA = """
+    BEGIN IMMEDIATE;
+    CREATE TABLE IF NOT EXISTS cache_entries (
+        key TEXT PRIMARY KEY,
+        value BLOB NOT NULL,
+        expires REAL NOT NULL,
+        accessed REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS cache_entries_accessed ON cache_entries (accessed);
+    CREATE TABLE IF NOT EXISTS cache_size (
+        id INTEGER PRIMARY KEY CHECK (id = 0),
+        entries INTEGER NOT NULL
+    );
+    INSERT OR IGNORE INTO cache_size (id, entries) SELECT 0, COUNT(*) FROM cache_entries;
+    CREATE TRIGGER IF NOT EXISTS cache_entries_inserted AFTER INSERT ON cache_entries
+        BEGIN UPDATE cache_size SET entries = entries + 1; END;
+    CREATE TRIGGER IF NOT EXISTS cache_entries_deleted AFTER DELETE ON cache_entries
+        BEGIN UPDATE cache_size SET entries = entries - 1; END;
+    COMMIT;
+"""
+
+UPSERT = """
+    INSERT INTO cache_entries (key, value, expires, accessed) VALUES (?, ?, ?, ?)
+    ON CONFLICT (key) DO UPDATE SET
+        value = excluded.value, expires = excluded.expires, accessed = excluded.accessed
+"""
+
+
+class SQLiteCache(BaseCache):
+    """Cache entries in a SQLite file shared by every process on the host"""
+    
+    def __init__(self, location, params):
+        super().__init__(params)
+        self._path = str(location)
+        options = params.get('OPTIONS', {})
+        self._busy_timeout = float(options.get('BUSY_TIMEOUT', 5.0))
+        self._local = threading.local()
+    
+    def get(self, key, default=None, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db, now = self._db(), time.time()
+        row = db.execute(
+            'SELECT value, expires, accessed FROM cache_entries WHERE key = ?', (key,)
+        ).fetchone()
+        if row is None or row[1] <= now:
+            return default
+        if now - row[2] > LRU_RESOLUTION:
+            db.execute('UPDATE cache_entries SET accessed = ? WHERE key = ?', (now, key))
+        return self._decode(row[0])
+    
+    def get_many(self, keys, version=None):
+        made = {self.make_and_validate_key(key, version=version): key for key in keys}
+        db, now = self._db(), time.time()
+        found, stale = {}, []
+        names = list(made)
+        for offset in range(0, len(names), KEYS_PER_QUERY):
+            chunk = names[offset:offset + KEYS_PER_QUERY]
+            rows = db.execute(
+                f'SELECT key, value, expires, accessed FROM cache_entries WHERE key IN ({",".join("?" * len(chunk))})',
+                chunk,
+            )
+            for key, value, expires, accessed in rows:
+                if expires <= now:
+                    continue
+                found[made[key]] = self._decode(value)
+                if now - accessed > LRU_RESOLUTION:
+                    stale.append((now, key))
+        if stale:
+            db.executemany('UPDATE cache_entries SET accessed = ? WHERE key = ?', stale)
+        return found
+    
+    def has_key(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return self._db().execute(
+            'SELECT 1 FROM cache_entries WHERE key = ? AND expires > ?', (key, time.time())
+        ).fetchone() is not None
+    
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db, now = self._db(), time.time()
+        db.execute(UPSERT, (key, self._encode(value), self._expiry(timeout), now))
+        self._cull(db, now)
+    
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        db, now = self._db(), time.time()
+        expires = self._expiry(timeout)
+        rows = [
+            (self.make_and_validate_key(key, version=version), self._encode(value), expires, now)
+            for key, value in data.items()
+        ]
+        with _Transaction(db):
+            db.executemany(UPSERT, rows)
+        self._cull(db, now)
+        return []
+    
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        db, now = self._db(), time.time()
+        # Replaces only an expired entry; the WHERE makes the upsert a no-op otherwise
+        added = db.execute(
+            UPSERT + ' WHERE cache_entries.expires <= ?',
+            (key, self._encode(value), self._expiry(timeout), now, now),
+        ).rowcount
+        if added:
+            self._cull(db, now)
+        return bool(added)
+    
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        return bool(self._db().execute(
+            'UPDATE cache_entries SET expires = ?, accessed = ? WHERE key = ? AND expires > ?',
+            (self._expiry(timeout), now, key, now),
+        ).rowcount)
+    
+    def incr(self, key, delta=1, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        now = time.time()
+        row = self._db().execute(
+            """
+            UPDATE cache_entries SET value = value + ?, accessed = ?
+            WHERE key = ? AND expires > ? AND typeof(value) = 'integer'
+            RETURNING value
+            """,
+            (delta, now, key, now),
+        ).fetchone()
+        if row is None:
+            raise ValueError(f"Key '{key}' not found or not an integer")
+        return row[0]
+    
+    def delete(self, key, version=None):
+        key = self.make_and_validate_key(key, version=version)
+        return bool(self._db().execute('DELETE FROM cache_entries WHERE key = ?', (key,)).rowcount)
+    
+    def delete_many(self, keys, version=None):
+        db = self._db()
+        with _Transaction(db):
+            db.executemany(
+                'DELETE FROM cache_entries WHERE key = ?',
+                [(self.make_and_validate_key(key, version=version),) for key in keys],
+            )
+    
+    def clear(self):
+        self._db().execute('DELETE FROM cache_entries')
+    
+    def _db(self):
+        """This thread's connection, reopened in a forked child"""
+        
+        local = self._local
+        if getattr(local, 'pid', None) != os.getpid():
+            local.db = self._connect()
+            local.pid = os.getpid()
+        return local.db
+    
+    def _connect(self):
+        directory = os.path.dirname(self._path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        db = sqlite3.connect(self._path, timeout=self._busy_timeout, isolation_level=None)
+        db.execute('PRAGMA journal_mode = WAL')
+        # A crash of the machine may lose the latest writes; it is a cache
+        db.execute('PRAGMA synchronous = NORMAL')
+        db.executescript(SCHEMA)
+        return db
+    
+    def _expiry(self, timeout):
+        expires = self.get_backend_timeout(timeout)
+        return math.inf if expires is None else expires
+    
+    def _cull(self, db, now):
+        count = db.execute('SELECT entries FROM cache_size').fetchone()[0]
+        if count <= self._max_entries:
+            return
+        if self._cull_frequency == 0:
+            db.execute('DELETE FROM cache_entries')
+            return
+        
+        count -= db.execute('DELETE FROM cache_entries WHERE expires <= ?', (now,)).rowcount
+        if count > self._max_entries:
+            db.execute(
+                'DELETE FROM cache_entries WHERE key IN '
+                '(SELECT key FROM cache_entries ORDER BY accessed LIMIT ?)',
+                (count // self._cull_frequency,),
+            )
+    
+    @staticmethod
+    def _encode(value):
+        # Integers stay native so incr() can add to them in SQL
+        if type(value) is int and -2 ** 63 <= value < 2 ** 63:
+            return value
+        return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+    
+    @staticmethod
+    def _decode(value):
+        if isinstance(value, int):
+            return value
+        return pickle.loads(value)
+
+
+class _Transaction:
+    """BEGIN IMMEDIATE ... COMMIT (or ROLLBACK) on an autocommit connection"""
+    
+    def __init__(self, db):
+        self.db = db
+    
+    def __enter__(self):
+        self.db.execute('BEGIN IMMEDIATE')
+        return self.db
+    
+    def __exit__(self, exc_type, exc, tb):
+        self.db.execute('ROLLBACK' if exc_type else 'COMMIT')
@@ -0,0 +1,34 @@
+"""
+Test Runner
+
+The default cache is a SQLite file shared by every process on the host
+(see backend.sqlite_cache). Tests run against the same backend in a
+throwaway directory instead, so they never read entries a running server
+wrote, or clear or fill the server's cache.
+"""
+
+import os
+import tempfile
+
+from django.conf import settings
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """DiscoverRunner with the shared cache moved to a temporary file"""
+    
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self._cache_dir = tempfile.TemporaryDirectory(prefix='nyanya-test-cache-')
+        self._cache_settings = override_settings(CACHES={
+            alias: {**config, 'LOCATION': os.path.join(self._cache_dir.name, f'{alias}.sqlite3')}
+            if config['BACKEND'] == 'backend.sqlite_cache.SQLiteCache' else config
+            for alias, config in settings.CACHES.items()
+        })
+        self._cache_settings.enable()
+    
+    def teardown_test_environment(self, **kwargs):
+        self._cache_settings.disable()
+        self._cache_dir.cleanup()
+        super().teardown_test_environment(**kwargs)
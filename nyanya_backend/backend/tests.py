@@ -0,0 +1,169 @@
+"""
+Shared Cache Backend Tests
+"""
+
+import math
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from unittest import mock
+
+from django.conf import settings
+from django.core.cache import caches
+from django.test import SimpleTestCase
+
+from . import sqlite_cache
+from .sqlite_cache import SQLiteCache
+
+
+def _increment(location, times):
+    cache = SQLiteCache(location, {})
+    for _ in range(times):
+        cache.incr('generation')
+
+
+class SQLiteCacheTests(SimpleTestCase):
+    """The SQLite cache backend, as separate workers see it"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.location = os.path.join(directory.name, 'cache.sqlite3')
+        self.cache = self.worker()
+    
+    def worker(self, **options):
+        return SQLiteCache(self.location, {'OPTIONS': options})
+    
+    def test_entries_are_shared_between_instances(self):
+        self.cache.set('payload', {'frames': [1, 2, 3]})
+        other = self.worker()
+        
+        self.assertEqual(other.get('payload'), {'frames': [1, 2, 3]})
+        self.assertEqual(other.get_many(['payload', 'missing']), {'payload': {'frames': [1, 2, 3]}})
+        other.delete('payload')
+        self.assertIsNone(self.cache.get('payload'))
+        
+        # From another thread of the same worker too
+        thread = threading.Thread(target=self.cache.set, args=('threaded', 7))
+        thread.start()
+        thread.join()
+        self.assertEqual(other.get('threaded'), 7)
+    
+    def test_expiry(self):
+        self.cache.set('brief', 'value', timeout=10)
+        self.cache.set('forever', 'value', timeout=None)
+        
+        later = time.time() + 11
+        with mock.patch.object(sqlite_cache.time, 'time', return_value=later):
+            self.assertIsNone(self.cache.get('brief'))
+            self.assertFalse(self.cache.has_key('brief'))
+            self.assertEqual(self.cache.get('forever'), 'value')
+            # An expired key can be added again
+            self.assertTrue(self.cache.add('brief', 'new'))
+        
+        self.assertFalse(self.cache.add('forever', 'other'))
+        self.assertEqual(self.cache.get('forever'), 'value')
+    
+    def test_least_recently_used_entries_are_evicted(self):
+        cache = self.worker(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        start = time.time()
+        for i in range(10):
+            with mock.patch.object(sqlite_cache.time, 'time', return_value=start + i * 2):
+                cache.set(f'key{i}', i)
+        
+        # Reading key0 makes key1..key5 the least recently used
+        with mock.patch.object(sqlite_cache.time, 'time', return_value=start + 30):
+            cache.get('key0')
+            cache.set('key10', 10)
+        
+        kept = cache.get_many([f'key{i}' for i in range(11)])
+        self.assertEqual(sorted(kept.values()), [0, 6, 7, 8, 9, 10])
+    
+    def size(self, cache):
+        db = cache._db()
+        counted = db.execute('SELECT COUNT(*) FROM cache_entries').fetchone()[0]
+        self.assertEqual(db.execute('SELECT entries FROM cache_size').fetchone()[0], counted)
+        return counted
+    
+    def test_running_count(self):
+        other = self.worker(MAX_ENTRIES=10, CULL_FREQUENCY=2)
+        
+        self.cache.set_many({f'key{i}': i for i in range(5)})
+        self.cache.set('key0', 'again')
+        other.add('key5', 5)
+        other.add('key0', 'ignored')
+        self.assertEqual(self.size(other), 6)
+        
+        other.delete('key0')
+        self.cache.delete_many(['key1', 'key2', 'missing'])
+        self.assertEqual(self.size(self.cache), 3)
+        
+        other.set_many({f'many{i}': i for i in range(8)})
+        self.assertLessEqual(self.size(other), 10)
+        
+        self.cache.clear()
+        self.assertEqual(self.size(other), 0)
+    
+    def test_writes_do_not_count_the_table(self):
+        statements = []
+        self.cache._db().set_trace_callback(statements.append)
+        
+        for i in range(20):
+            self.cache.set(f'key{i}', i)
+        
+        self.assertFalse([sql for sql in statements if 'COUNT(' in sql.upper()])
+    
+    def test_count_starts_from_an_existing_file(self):
+        # A cache file written before the count was kept
+        db = sqlite3.connect(self.location)
+        db.execute('CREATE TABLE cache_entries (key TEXT PRIMARY KEY, value BLOB, expires REAL, accessed REAL)')
+        db.executemany(
+            'INSERT INTO cache_entries VALUES (?, ?, ?, ?)',
+            [(f':1:key{i}', i, math.inf, 0.0) for i in range(3)],
+        )
+        db.commit()
+        db.close()
+        
+        self.assertEqual(self.size(self.worker()), 3)
+    
+    def test_cull_reads_the_access_time_index(self):
+        plan = self.cache._db().execute(
+            'EXPLAIN QUERY PLAN SELECT key FROM cache_entries ORDER BY accessed LIMIT 10'
+        ).fetchall()
+        
+        self.assertIn('cache_entries_accessed', ' '.join(row[-1] for row in plan))
+    
+    def test_incr_is_atomic_across_processes(self):
+        self.cache.set('generation', 0, timeout=None)
+        
+        context = multiprocessing.get_context('fork')
+        workers = [context.Process(target=_increment, args=(self.location, 100)) for _ in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        
+        self.assertEqual([worker.exitcode for worker in workers], [0] * 4)
+        self.assertEqual(self.cache.get('generation'), 400)
+        self.assertEqual(self.cache.decr('generation', 50), 350)
+    
+    def test_incr_of_missing_or_non_integer_key(self):
+        self.cache.set('text', 'ten')
+        with self.assertRaises(ValueError):
+            self.cache.incr('text')
+        with self.assertRaises(ValueError):
+            self.cache.incr('missing')
+
+
+class TestRunnerTests(SimpleTestCase):
+    """The suite never touches the cache file a running server uses"""
+    
+    def test_cache_is_a_temporary_file(self):
+        cache = caches['default']
+        
+        self.assertIsInstance(cache, SQLiteCache)
+        self.assertNotEqual(cache._path, str(settings.BASE_DIR / 'cache' / 'cache.sqlite3'))
+        self.assertTrue(cache._path.startswith(tempfile.gettempdir()))
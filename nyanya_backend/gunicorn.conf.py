@@ -0,0 +1,60 @@
+"""
+Gunicorn configuration for the Heroku web dyno.
+
+Picked up automatically by `gunicorn backend.wsgi` (see Procfile).
+
+The app (and with it the model) is loaded once in the master and the
+workers are forked from it, so the model arrays, encoders and prediction
+grid are shared copy-on-write instead of loaded per worker. Set
+GUNICORN_PRELOAD=False to go back to loading the app in each worker.
+"""
+
+import gc
+import os
+
+
+preload_app = os.environ.get('GUNICORN_PRELOAD', 'True').lower() in ('1', 'true', 'yes')
+
+if preload_app:
+    # AppConfig.ready() warms the model up while the master imports the app
+    os.environ.setdefault('PRELOAD_MODEL', 'True')
+
+# Threaded (gthread) workers, so concurrent dashboard requests in one
+# worker can share a prediction batch (predictions.batching)
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+
+
+def pre_fork(server, worker):
+    """
+    Freeze everything the master has allocated so far.
+    
+    Frozen objects are skipped by the garbage collector, whose bookkeeping
+    writes would otherwise dirty (and so copy) the shared pages in every
+    worker.
+    """
+    gc.freeze()
+
+
+def post_worker_init(worker):
+    """
+    Load the model in each worker before it accepts requests.
+    
+    Runs right after the worker has imported the Django app (the
+    post_fork hook fires before that), so the first request never pays
+    for loading the model. With preload_app the model is already there
+    and this only scores a warm-up row.
+    """
+    from predictions.model_loader import predictor
+    
+    predictor.warm_up()
+
+
+def worker_exit(server, worker):
+    """
+    Flush the predictions still buffered by the worker's write-behind log
+    (predictions.prediction_log) before it exits, so a restart or
+    max_requests recycle does not lose them.
+    """
+    from predictions.prediction_log import prediction_log
+    
+    prediction_log.close()
@@ -0,0 +1,198 @@
+"""
+DataSource Fetching
+
+Fetches the DataSources that are due on their fetch_frequency and
+ingests what they serve (CSV in the combined_file.csv layout):
+
+- the due sources are found with one query
+- downloads run concurrently in a bounded thread pool, each response
+  streamed to a temporary file, so memory does not grow with its size
+- requests are conditional (If-None-Match / If-Modified-Since with the
+  validators of the last response), so an unchanged source costs one
+  round trip answered with 304 Not Modified
+- downloaded files are ingested one at a time by the calling thread (a
+  single writer, as in ingest_files) through the streaming ingest_csv()
+- last_fetch and the new validators are saved with one bulk UPDATE
+
+A failed download or ingestion (database errors included) leaves the
+source due and its validators untouched, so the next run fetches it in
+full again; it never fails the other sources of the run, which are saved
+even if the run is cut short.
+"""
+
+import logging
+import os
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+from django.conf import settings
+from django.db import DatabaseError
+from django.db.models import Q
+from django.utils import timezone
+
+from .ingest import ingest_csv
+from .models import DataSource
+
+
+logger = logging.getLogger(__name__)
+
+# Bytes read from a response at a time
+CHUNK_BYTES = 1 << 16
+
+
+class FetchResult:
+    """Outcome of fetching one DataSource: fetched, not_modified or failed"""
+    
+    def __init__(self, source):
+        self.source = source
+        self.status = 'failed'
+        self.error = ''
+        self.report = None
+        self.elapsed = 0.0
+        self.path = None
+        self.etag = ''
+        self.last_modified = ''
+
+
+def due_sources(now=None):
+    """
+    Active sources with a URL that were never fetched or whose fetch
+    interval has passed ('manual' sources are never due).
+    
+    Args:
+        now (datetime): Reference time (default: timezone.now())
+    
+    Returns:
+        QuerySet: The due sources, evaluated with a single query
+    """
+    
+    now = now or timezone.now()
+    
+    due = Q(last_fetch__isnull=True)
+    for frequency, interval in DataSource.FETCH_INTERVALS.items():
+        due |= Q(fetch_frequency=frequency, last_fetch__lte=now - interval)
+    
+    return (
+        DataSource.objects
+        .filter(due, is_active=True, fetch_frequency__in=list(DataSource.FETCH_INTERVALS))
+        .exclude(url__isnull=True)
+        .exclude(url='')
+    )
+
+
+def fetch_sources(sources=None, workers=None, timeout=None, mode='upsert'):
+    """
+    Download and ingest sources concurrently.
+    
+    Args:
+        sources (iterable): DataSources to fetch (default: due_sources())
+        workers (int): Concurrent downloads (default: settings.DATA_SOURCE_FETCH_WORKERS)
+        timeout (float): Connect/read timeout per request in seconds
+            (default: settings.DATA_SOURCE_FETCH_TIMEOUT)
+        mode (str): Ingest mode, 'upsert' or 'insert-only'
+    
+    Returns:
+        list: A FetchResult per source, in completion order
+    """
+    
+    if workers is None:
+        workers = getattr(settings, 'DATA_SOURCE_FETCH_WORKERS', 4)
+    if timeout is None:
+        timeout = getattr(settings, 'DATA_SOURCE_FETCH_TIMEOUT', 30.0)
+    
+    sources = list(due_sources() if sources is None else sources)
+    if not sources:
+        return []
+    
+    results = []
+    done = []
+    futures = []
+    
+    try:
+        with ThreadPoolExecutor(max_workers=min(workers, len(sources))) as pool:
+            futures = [pool.submit(_download, source, timeout) for source in sources]
+            
+            for future in as_completed(futures):
+                result = _ingest(future.result(), mode)
+                if result.status == 'failed':
+                    logger.warning("Fetching data source %s failed: %s", result.source.name, result.error)
+                else:
+                    source = result.source
+                    source.last_fetch = source.updated_at = timezone.now()
+                    if result.status == 'fetched':
+                        source.etag = result.etag
+                        source.last_modified = result.last_modified
+                    done.append(source)
+                results.append(result)
+    finally:
+        # Downloads left over when an unexpected error stopped the loop
+        for future in futures:
+            if future.done() and future.exception() is None and future.result().path:
+                os.remove(future.result().path)
+                future.result().path = None
+        
+        # Sources ingested before any error keep their new validators
+        DataSource.objects.bulk_update(done, ['last_fetch', 'etag', 'last_modified', 'updated_at'])
+    
+    return results
+
+
+def _ingest(result, mode):
+    """Ingest a downloaded file and remove it; a failure only fails this source"""
+    
+    if not result.path:
+        return result
+    
+    try:
+        result.report = ingest_csv(result.path, mode=mode, source=f'datasource:{result.source.name}')
+    except (OSError, ValueError, DatabaseError) as e:
+        # e.g. "database is locked" while the web workers are writing
+        result.status = 'failed'
+        result.error = str(e)
+    finally:
+        os.remove(result.path)
+        result.path = None
+    
+    return result
+
+
+def _download(source, timeout):
+    """
+    Conditional GET of one source into a temporary file (runs in the pool).
+    
+    No database access here; the caller ingests result.path and removes it.
+    """
+    
+    start = time.perf_counter()
+    result = FetchResult(source)
+    
+    headers = {}
+    if source.etag:
+        headers['If-None-Match'] = source.etag
+    if source.last_modified:
+        headers['If-Modified-Since'] = source.last_modified
+    
+    try:
+        with requests.get(source.url, headers=headers, stream=True, timeout=timeout) as response:
+            if response.status_code == 304:
+                result.status = 'not_modified'
+            else:
+                response.raise_for_status()
+                with tempfile.NamedTemporaryFile('wb', suffix='.csv', delete=False) as f:
+                    result.path = f.name
+                    for block in response.iter_content(CHUNK_BYTES):
+                        f.write(block)
+                result.status = 'fetched'
+                result.etag = response.headers.get('ETag', '')
+                result.last_modified = response.headers.get('Last-Modified', '')
+    except (requests.RequestException, OSError) as e:
+        result.status = 'failed'
+        result.error = str(e)
+        if result.path:
+            os.remove(result.path)
+            result.path = None
+    
+    result.elapsed = time.perf_counter() - start
+    return result
@@ -0,0 +1,569 @@
+"""
+Bulk Market Data Ingestion
+
+CSV rows (combined_file.csv layout) are converted and validated column by
+column in pandas, then written in chunks with one bulk INSERT per chunk,
+keyed on (year, week):
+
+- upsert:      new weeks are inserted, existing weeks are overwritten
+- insert-only: new weeks are inserted, existing weeks are left untouched
+
+Each chunk runs in its own transaction, so a failure only rolls back the
+chunk being written.
+
+CSV files are streamed: ingest_csv() reads a fixed number of rows at a
+time, parses and validates the next chunk in a background thread while
+the current one is written, and records the last committed row in a
+checkpoint file so an interrupted load resumes where it stopped. Memory
+stays flat whatever the file size.
+
+Folders of CSV drops go through ingest_files(): files are parsed and
+validated in a process pool while this process, the single writer,
+bulk-writes them one at a time. Every written file is recorded by content
+hash (IngestedFile), and recorded files are skipped on the next run.
+"""
+
+import calendar
+import collections
+import glob
+import hashlib
+import io
+import itertools
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import django
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .models import IngestedFile, MarketData
+from .signals import market_data_loaded
+
+
+MODES = ('upsert', 'insert-only')
+
+# CSV column -> MarketData field
+CSV_COLUMNS = {
+    'Week': 'week',
+    'Year': 'year',
+    'Month': 'month',
+    'Rainfall_mm': 'rainfall_mm',
+    'Temperature_C': 'temperature_c',
+    'Market_Day': 'market_day',
+    'School_Open': 'school_open',
+    'Disease_Alert': 'disease_alert',
+    'Last_Week_Demand': 'last_week_demand',
+    'Market_Demand': 'market_demand',
+}
+
+# Fields overwritten when an upsert hits an existing (year, week)
+UPDATE_FIELDS = [
+    'month', 'rainfall_mm', 'temperature_c', 'market_day', 'school_open',
+    'disease_alert', 'last_week_demand', 'market_demand', 'source', 'updated_at',
+]
+
+BOOLEAN_VALUES = {'yes': True, 'true': True, '1': True, 'no': False, 'false': False, '0': False}
+DEMAND_LEVELS = ('Low', 'Medium', 'High')
+DISEASE_ALERTS = ('Presence', 'Absence')
+MONTHS = tuple(calendar.month_name[1:])
+
+
+class IngestReport:
+    """Counts and timing of one ingestion run"""
+    
+    # Rejected rows kept with their reason (the count covers all of them)
+    MAX_REJECTIONS = 100
+    
+    def __init__(self):
+        self.inserted = 0
+        self.updated = 0
+        self.skipped = 0
+        self.rejected = 0
+        self.rejections = []
+        self.elapsed = 0.0
+        self.rows_read = 0
+        self.resumed_from = 1
+        # (path, status, detail) per file, filled by ingest_files()
+        self.files = []
+    
+    @property
+    def processed(self):
+        return self.inserted + self.updated + self.skipped + self.rejected
+    
+    @property
+    def rows_per_second(self):
+        """Throughput of this run (rows skipped by a resume don't count)"""
+        
+        return self.rows_read / self.elapsed if self.elapsed else 0.0
+    
+    def reject(self, row_numbers, reasons):
+        self.rejected += len(row_numbers)
+        room = self.MAX_REJECTIONS - len(self.rejections)
+        self.rejections.extend(list(zip(row_numbers, reasons))[:max(room, 0)])
+    
+    def merge(self, other, label=None):
+        """
+        Add the counts of another report (e.g. one chunk's or one file's).
+        
+        Args:
+            other (IngestReport): Report to add
+            label (str): Prefix for the other report's rejected row numbers
+                (e.g. its file name), as 'label:row'
+        """
+        
+        self.inserted += other.inserted
+        self.updated += other.updated
+        self.skipped += other.skipped
+        self.rows_read += other.rows_read
+        rows = [row if label is None else f'{label}:{row}' for row, _ in other.rejections]
+        self.reject(rows, [reason for _, reason in other.rejections])
+        self.rejected += other.rejected - len(other.rejections)
+    
+    def as_dict(self):
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'skipped': self.skipped,
+            'rejected': self.rejected,
+            'resumed_from': self.resumed_from,
+            'files': len(self.files),
+            'elapsed_seconds': round(self.elapsed, 3),
+            'rows_per_second': round(self.rows_per_second, 1),
+        }
+
+
+def prepare_frame(df, report, first_row=1):
+    """
+    Convert and validate CSV columns into MarketData field values.
+    
+    Every check runs on whole columns; each rejected row is reported once,
+    with the first check it failed. When a (year, week) appears more than
+    once the last row wins.
+    
+    Args:
+        df (pd.DataFrame): Raw CSV rows
+        report (IngestReport): Receives the rejected rows
+        first_row (int): Data row number of df's first row, for reporting
+    
+    Returns:
+        pd.DataFrame: Valid rows, one column per MarketData field
+    """
+    
+    missing = [column for column in CSV_COLUMNS if column not in df.columns]
+    if missing:
+        raise ValueError(f"Missing CSV columns: {', '.join(missing)}")
+    
+    frame = pd.DataFrame(index=df.index)
+    checks = []
+    
+    for column in ('Week', 'Year'):
+        values = pd.to_numeric(df[column], errors='coerce')
+        checks.append((f'{column} must be a positive integer', values.notna() & (values % 1 == 0) & (values >= 1)))
+        frame[CSV_COLUMNS[column]] = values
+    
+    rainfall = pd.to_numeric(df['Rainfall_mm'], errors='coerce').round(2)
+    checks.append(('Rainfall_mm must be a number between 0 and 999999.99', rainfall.between(0, 999999.99)))
+    frame['rainfall_mm'] = rainfall
+    
+    temperature = pd.to_numeric(df['Temperature_C'], errors='coerce').round(2)
+    checks.append(('Temperature_C must be a number between -999.99 and 999.99', temperature.between(-999.99, 999.99)))
+    frame['temperature_c'] = temperature
+    
+    for column in ('Market_Day', 'School_Open'):
+        values = df[column].astype(str).str.strip().str.lower().map(BOOLEAN_VALUES)
+        checks.append((f'{column} must be yes/no', values.notna()))
+        frame[CSV_COLUMNS[column]] = values
+    
+    for column, allowed in (
+        ('Month', MONTHS),
+        ('Disease_Alert', DISEASE_ALERTS),
+        ('Last_Week_Demand', DEMAND_LEVELS),
+        ('Market_Demand', DEMAND_LEVELS),
+    ):
+        values = df[column].astype(str).str.strip()
+        checks.append((f"{column} must be one of {', '.join(allowed)}", values.isin(allowed)))
+        frame[CSV_COLUMNS[column]] = values
+    
+    # First failing check per row
+    valid = pd.Series(True, index=df.index)
+    reasons = pd.Series('', index=df.index)
+    for reason, passed in checks:
+        failed = valid & ~passed.fillna(False).astype(bool)
+        reasons[failed] = reason
+        valid &= ~failed
+    
+    duplicated = valid & frame[['year', 'week']].where(valid).duplicated(keep='last')
+    reasons[duplicated] = 'Duplicate (year, week), a later row wins'
+    valid &= ~duplicated
+    
+    rejected = ~valid
+    report.reject((np.flatnonzero(rejected.to_numpy()) + first_row).tolist(), reasons[rejected].tolist())
+    
+    frame = frame[valid]
+    return frame.astype({'week': int, 'year': int, 'market_day': bool, 'school_open': bool})
+
+
+def ingest_frame(df, mode='upsert', chunk_size=500, source='csv_import'):
+    """
+    Validate and bulk-write CSV rows into MarketData.
+    
+    Args:
+        df (pd.DataFrame): Raw CSV rows (combined_file.csv columns)
+        mode (str): 'upsert' or 'insert-only'
+        chunk_size (int): Rows per bulk INSERT and transaction
+        source (str): Value stored in MarketData.source
+    
+    Returns:
+        IngestReport: Inserted, updated, skipped and rejected counts
+    """
+    
+    if mode not in MODES:
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    
+    start = time.perf_counter()
+    report = IngestReport()
+    report.rows_read = len(df)
+    frame = prepare_frame(df, report)
+    
+    for offset in range(0, len(frame), chunk_size):
+        with transaction.atomic():
+            _write_batch(frame.iloc[offset:offset + chunk_size], mode, source, report)
+            _announce(report)
+    
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def ingest_csv(path, mode='upsert', chunk_size=10000, batch_size=500,
+               source='csv_import', checkpoint=None):
+    """
+    Stream a CSV file into MarketData in constant memory.
+    
+    Rows are read chunk_size at a time. While one chunk is written (one
+    transaction, batch_size rows per bulk INSERT) the next is parsed and
+    validated in a background thread, so at most two chunks are in memory.
+    
+    After every committed chunk the row count is saved to the checkpoint
+    file. A later call with the same checkpoint skips the rows already
+    committed, unless the CSV changed in the meantime. The checkpoint is
+    removed once the whole file is in.
+    
+    Args:
+        path (str): CSV file (combined_file.csv columns)
+        mode (str): 'upsert' or 'insert-only'
+        chunk_size (int): Rows per read chunk and transaction
+        batch_size (int): Rows per bulk INSERT
+        source (str): Value stored in MarketData.source
+        checkpoint (str): Checkpoint file path (None: no resuming)
+    
+    Returns:
+        IngestReport: Counts for the whole file, including rows committed
+            before a resume; report.resumed_from is the first row read
+    """
+    
+    if mode not in MODES:
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    
+    start = time.perf_counter()
+    report = IngestReport()
+    fingerprint = _file_fingerprint(path)
+    committed = 0
+    
+    state = _read_checkpoint(checkpoint)
+    if state and state['fingerprint'] == fingerprint and state['mode'] == mode:
+        committed = state['rows']
+        for name in ('inserted', 'updated', 'skipped', 'rejected'):
+            setattr(report, name, state[name])
+    report.resumed_from = committed + 1
+    
+    # A callable keeps skipping constant-memory (a range would become a set);
+    # bind the count now, the reader calls it lazily as chunks are read
+    reader = pd.read_csv(
+        path, chunksize=chunk_size,
+        skiprows=lambda line, skip=committed: 0 < line <= skip
+    )
+    
+    def next_chunk(first_row):
+        """Parse and validate the next chunk (runs in the background thread)"""
+        
+        df = next(reader, None)
+        if df is None:
+            return None
+        chunk_report = IngestReport()
+        return prepare_frame(df, chunk_report, first_row), chunk_report, len(df)
+    
+    with reader, ThreadPoolExecutor(max_workers=1) as pool:
+        pending = pool.submit(next_chunk, committed + 1)
+        
+        while True:
+            prepared = pending.result()
+            if prepared is None:
+                break
+            frame, chunk_report, n_rows = prepared
+            pending = pool.submit(next_chunk, committed + n_rows + 1)
+            
+            with transaction.atomic():
+                for offset in range(0, len(frame), batch_size):
+                    _write_batch(frame.iloc[offset:offset + batch_size], mode, source, chunk_report)
+                _announce(chunk_report)
+            
+            committed += n_rows
+            chunk_report.rows_read = n_rows
+            report.merge(chunk_report)
+            _write_checkpoint(checkpoint, {
+                'fingerprint': fingerprint,
+                'mode': mode,
+                'rows': committed,
+                **{name: getattr(report, name) for name in ('inserted', 'updated', 'skipped', 'rejected')},
+            })
+    
+    if checkpoint and os.path.exists(checkpoint):
+        os.remove(checkpoint)
+    
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def expand_paths(target):
+    """
+    CSV files named by a file path, a directory or a glob pattern.
+    
+    Args:
+        target (str): A file, a directory (its *.csv files) or a pattern
+            such as 'drops/2025-*/*.csv' ('**' recurses)
+    
+    Returns:
+        list: Matching file paths, sorted
+    """
+    
+    if os.path.isdir(target):
+        paths = glob.glob(os.path.join(target, '*.csv'))
+    elif glob.has_magic(target):
+        paths = glob.glob(target, recursive=True)
+    else:
+        return [target]
+    return sorted(path for path in paths if os.path.isfile(path))
+
+
+def ingest_files(paths, mode='upsert', workers=None, batch_size=500,
+                 source='csv_import', force=False):
+    """
+    Ingest many CSV files: parse in parallel, write from one process.
+    
+    Files are hashed first and those whose hash is already recorded in
+    IngestedFile are skipped without being parsed. The rest are parsed
+    and validated in a pool of worker processes, a few files ahead of the
+    writer, and written in path order, each in one transaction together
+    with its IngestedFile record. So when two files carry the same
+    (year, week) the later path wins, and a file is either fully written
+    and recorded or not at all.
+    
+    A file that cannot be parsed (unreadable, missing columns) is reported
+    as failed and the others still go in.
+    
+    Args:
+        paths (list): CSV files (see expand_paths)
+        mode (str): 'upsert' or 'insert-only'
+        workers (int): Parser processes (None: one per CPU; 1: no pool)
+        batch_size (int): Rows per bulk INSERT
+        source (str): Value stored in MarketData.source
+        force (bool): Ingest files again even if their hash is recorded
+    
+    Returns:
+        IngestReport: Combined counts; report.files holds a
+            (path, status, detail) entry per file, status being
+            'ingested', 'skipped' or 'failed'
+    """
+    
+    if mode not in MODES:
+        raise ValueError(f"Unknown ingest mode: {mode}")
+    
+    start = time.perf_counter()
+    report = IngestReport()
+    
+    hashes = {path: _file_sha256(path) for path in paths}
+    recorded = set() if force else set(
+        IngestedFile.objects.filter(sha256__in=set(hashes.values())).values_list('sha256', flat=True)
+    )
+    
+    todo = []
+    for path in paths:
+        if hashes[path] in recorded:
+            report.files.append((path, 'skipped', 'already ingested'))
+        else:
+            # The same content twice in one run is written once
+            recorded.add(hashes[path])
+            todo.append(path)
+    
+    for path, parsed in _parse_files(todo, workers):
+        if isinstance(parsed, Exception):
+            report.files.append((path, 'failed', str(parsed)))
+            continue
+        
+        sha256, size, frame, file_report = parsed
+        with transaction.atomic():
+            for offset in range(0, len(frame), batch_size):
+                _write_batch(frame.iloc[offset:offset + batch_size], mode, source, file_report)
+            IngestedFile.objects.update_or_create(sha256=sha256, defaults={
+                'name': os.path.basename(path),
+                'size': size,
+                'mode': mode,
+                'source': source,
+                'rows': file_report.rows_read,
+                **{name: getattr(file_report, name) for name in ('inserted', 'updated', 'skipped', 'rejected')},
+            })
+            _announce(file_report)
+        
+        report.merge(file_report, label=os.path.basename(path))
+        report.files.append((
+            path, 'ingested',
+            f'{file_report.inserted} inserted, {file_report.updated} updated, '
+            f'{file_report.skipped} skipped, {file_report.rejected} rejected',
+        ))
+    
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def _parse_files(paths, workers=None):
+    """
+    Yield (path, parsed) in path order, parsing in worker processes.
+    
+    At most two files per worker are parsed ahead of the caller, so memory
+    is bounded by the files in flight, not the whole folder. parsed is
+    _parse_file()'s result or the exception it raised.
+    """
+    
+    workers = min(workers or os.cpu_count() or 1, len(paths))
+    
+    if workers <= 1:
+        for path in paths:
+            try:
+                yield path, _parse_file(path)
+            except Exception as e:
+                yield path, e
+        return
+    
+    # django.setup() makes the workers importable under any start method
+    with ProcessPoolExecutor(max_workers=workers, initializer=django.setup) as pool:
+        todo = iter(paths)
+        pending = collections.deque(
+            (path, pool.submit(_parse_file, path)) for path in itertools.islice(todo, workers * 2)
+        )
+        while pending:
+            path, future = pending.popleft()
+            following = next(todo, None)
+            if following is not None:
+                pending.append((following, pool.submit(_parse_file, following)))
+            try:
+                yield path, future.result()
+            except Exception as e:
+                yield path, e
+
+
+def _parse_file(path):
+    """
+    Read, hash and validate one CSV file (runs in a pool process).
+    
+    The hash is taken from the bytes parsed, so the record always matches
+    what was written even if the file changed after the first hashing.
+    
+    Returns:
+        tuple: (sha256, size, frame, report) with report holding the
+            rows read and rejected
+    """
+    
+    with open(path, 'rb') as f:
+        data = f.read()
+    
+    report = IngestReport()
+    df = pd.read_csv(io.BytesIO(data))
+    report.rows_read = len(df)
+    frame = prepare_frame(df, report)
+    return hashlib.sha256(data).hexdigest(), len(data), frame, report
+
+
+def _file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _file_fingerprint(path):
+    """Size plus a hash of the first MB; enough to notice a replaced file"""
+    
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        digest.update(f.read(1 << 20))
+    return f'{os.path.getsize(path)}:{digest.hexdigest()[:16]}'
+
+
+def _read_checkpoint(path):
+    if not path:
+        return None
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_checkpoint(path, state):
+    """Replace the checkpoint atomically so a crash never leaves half a file"""
+    
+    if not path:
+        return
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'w') as f:
+        json.dump(state, f)
+    os.replace(temp_path, path)
+
+
+def _announce(report):
+    """Send market_data_loaded once the caller's transaction commits"""
+    
+    transaction.on_commit(lambda: market_data_loaded.send(sender=MarketData, report=report))
+
+
+def _write_batch(batch, mode, source, report):
+    """One bulk INSERT; the caller provides the transaction"""
+    
+    records = batch.to_dict('records')
+    keys = {(record['year'], record['week']) for record in records}
+    
+    # bulk_create cannot tell inserts from updates, so look the keys up first
+    existing = {
+        key for key in MarketData.objects.filter(
+            year__in={year for year, _ in keys},
+            week__in={week for _, week in keys},
+        ).values_list('year', 'week')
+        if key in keys
+    }
+    
+    objects = [
+        MarketData(source=source, **record)
+        for record in records
+        if mode == 'upsert' or (record['year'], record['week']) not in existing
+    ]
+    
+    if mode == 'upsert':
+        MarketData.objects.bulk_create(
+            objects,
+            update_conflicts=True,
+            unique_fields=['year', 'week'],
+            update_fields=UPDATE_FIELDS,
+        )
+    else:
+        # A concurrent writer may still insert one of these weeks first
+        MarketData.objects.bulk_create(objects, ignore_conflicts=True)
+    
+    report.inserted += len(keys) - len(existing)
+    if mode == 'upsert':
+        report.updated += len(existing)
+    else:
+        report.skipped += len(existing)
@@ -0,0 +1,41 @@
+"""
+Management command to dump MarketData to a compressed columnar snapshot.
+
+A much smaller and faster alternative to
+`dumpdata market_data.marketdata > marketdata_backup.json`; restore it
+with restore_market_snapshot. See market_data.snapshot.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from market_data.snapshot import dump_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Dump all market data to a compressed columnar snapshot (.npz)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            type=str,
+            nargs='?',
+            default='marketdata_snapshot.npz',
+            help='Snapshot file to write (default: marketdata_snapshot.npz)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Rows fetched per database round trip (default: 10000)'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            result = dump_snapshot(options['file'], chunk_size=options['chunk_size'])
+        except OSError as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Dumped {result['rows']} rows to {options['file']} "
+            f"({result['size'] / 1024:,.1f} KB) in {result['elapsed']:.2f}s"
+        ))
+        self.stdout.write(f"sha256 {result['sha256']}")
@@ -0,0 +1,94 @@
+"""
+Management command to fetch the DataSources that are due.
+
+Finds active sources due on their fetch_frequency, downloads them
+concurrently with conditional GETs and ingests the CSVs that changed.
+Run it from cron, or with --loop to keep it running as a scheduler.
+See market_data.fetch.
+"""
+
+import logging
+import time
+
+from django.core.management.base import BaseCommand
+from market_data.fetch import due_sources, fetch_sources
+from market_data.ingest import MODES
+from market_data.models import DataSource
+
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Fetch and ingest the data sources that are due on their fetch frequency'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Concurrent downloads (default: settings.DATA_SOURCE_FETCH_WORKERS)'
+        )
+        parser.add_argument(
+            '--timeout',
+            type=float,
+            help='Per-request timeout in seconds (default: settings.DATA_SOURCE_FETCH_TIMEOUT)'
+        )
+        parser.add_argument(
+            '--mode',
+            type=str,
+            choices=MODES,
+            default='upsert',
+            help='Ingest mode (default: upsert)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Fetch every active source with a URL, due or not'
+        )
+        parser.add_argument(
+            '--loop',
+            type=float,
+            metavar='SECONDS',
+            help='Keep running, checking for due sources every SECONDS'
+        )
+    
+    def handle(self, *args, **options):
+        while True:
+            if not options['loop']:
+                self._fetch(options)
+                break
+            
+            # A scheduler outlives a failed pass (e.g. the database is locked)
+            try:
+                self._fetch(options)
+            except Exception:
+                logger.exception("Data source fetch failed; next pass in %s s", options['loop'])
+            time.sleep(options['loop'])
+    
+    def _fetch(self, options):
+        if options['all']:
+            sources = DataSource.objects.filter(is_active=True).exclude(url__isnull=True).exclude(url='')
+        else:
+            sources = due_sources()
+        
+        results = fetch_sources(
+            sources,
+            workers=options['workers'],
+            timeout=options['timeout'],
+            mode=options['mode'],
+        )
+        
+        for result in results:
+            line = f'{result.status:<13}{result.source.name} ({result.elapsed:.2f}s)'
+            if result.status == 'failed':
+                self.stdout.write(self.style.ERROR(f'{line}: {result.error}'))
+            elif result.report:
+                report = result.report
+                self.stdout.write(self.style.SUCCESS(
+                    f'{line}: {report.inserted} inserted, {report.updated} updated, '
+                    f'{report.skipped} skipped, {report.rejected} rejected'
+                ))
+            else:
+                self.stdout.write(line)
+        
+        self.stdout.write(f'{len(results)} sources checked')
@@ -0,0 +1,143 @@
+"""
+Management command to bulk-ingest market data from CSV files.
+
+Validates the CSV column by column and writes it in chunked bulk INSERTs
+keyed on (year, week) instead of one query per row. A single file is
+streamed in constant memory and progress is checkpointed after every
+chunk, so rerunning an interrupted load resumes it. A directory or glob
+pattern is parsed in parallel worker processes and written by this one,
+skipping files already ingested. See market_data.ingest.
+"""
+
+import collections
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from market_data.ingest import MODES, expand_paths, ingest_csv, ingest_files
+
+
+class Command(BaseCommand):
+    help = 'Bulk-ingest market data from a CSV file, directory or glob (upsert or insert-only)'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            type=str,
+            help="CSV file (combined_file.csv layout), directory of CSVs or glob such as 'drops/*.csv'"
+        )
+        parser.add_argument(
+            '--mode',
+            type=str,
+            choices=MODES,
+            default='upsert',
+            help='upsert overwrites existing weeks, insert-only keeps them (default: upsert)'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='Rows read, validated and committed at a time (default: 10000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows per bulk INSERT (default: 500)'
+        )
+        parser.add_argument(
+            '--checkpoint',
+            type=str,
+            help='Checkpoint file (default: <file>.checkpoint)'
+        )
+        parser.add_argument(
+            '--restart',
+            action='store_true',
+            help='Ignore an existing checkpoint and start from the first row'
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            default='csv_import',
+            help='Value stored in MarketData.source (default: csv_import)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            help='Parser processes for a directory or glob (default: one per CPU)'
+        )
+        parser.add_argument(
+            '--force',
+            action='store_true',
+            help='Ingest files from a directory or glob even if already ingested'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write(f"Ingesting {options['file']} ({options['mode']})...")
+        
+        if os.path.isfile(options['file']):
+            report = self._ingest_file(options)
+        else:
+            report = self._ingest_files(options)
+        
+        for row, reason in report.rejections:
+            self.stdout.write(self.style.WARNING(f'Rejected row {row}: {reason}'))
+        if report.rejected > len(report.rejections):
+            self.stdout.write(self.style.WARNING(
+                f'... and {report.rejected - len(report.rejections)} more rejected rows'
+            ))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f'{report.inserted} inserted, {report.updated} updated, '
+            f'{report.skipped} skipped, {report.rejected} rejected '
+            f'in {report.elapsed:.2f}s ({report.rows_per_second:,.0f} rows/s)'
+        ))
+    
+    def _ingest_file(self, options):
+        checkpoint = options['checkpoint'] or f"{options['file']}.checkpoint"
+        
+        try:
+            if options['restart'] and os.path.exists(checkpoint):
+                os.remove(checkpoint)
+            
+            report = ingest_csv(
+                options['file'],
+                mode=options['mode'],
+                chunk_size=options['chunk_size'],
+                batch_size=options['batch_size'],
+                source=options['source'],
+                checkpoint=checkpoint,
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        if report.resumed_from > 1:
+            self.stdout.write(f'Resumed from row {report.resumed_from}')
+        return report
+    
+    def _ingest_files(self, options):
+        paths = expand_paths(options['file'])
+        if not paths:
+            raise CommandError(f"No CSV files match {options['file']}")
+        
+        try:
+            report = ingest_files(
+                paths,
+                mode=options['mode'],
+                workers=options['workers'],
+                batch_size=options['batch_size'],
+                source=options['source'],
+                force=options['force'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        styles = {'ingested': self.style.SUCCESS, 'skipped': str, 'failed': self.style.ERROR}
+        for path, status, detail in report.files:
+            self.stdout.write(styles[status](f'{status:<9}{path}: {detail}'))
+        
+        counts = collections.Counter(status for _, status, _ in report.files)
+        self.stdout.write(
+            f"{len(report.files)} files: {counts['ingested']} ingested, "
+            f"{counts['skipped']} already ingested, {counts['failed']} failed"
+        )
+        return report
@@ -0,0 +1,39 @@
+"""
+Management command to restore MarketData from a snapshot.
+
+Verifies the snapshot's checksum, then replaces every MarketData row with
+the snapshot's in one transaction, using batched INSERTs instead of
+loaddata's one save() per object. See market_data.snapshot.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from market_data.snapshot import restore_snapshot
+
+
+class Command(BaseCommand):
+    help = 'Replace all market data with a snapshot written by dump_market_snapshot'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            type=str,
+            help='Snapshot file (.npz)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows per INSERT batch (default: 5000)'
+        )
+    
+    def handle(self, *args, **options):
+        self.stdout.write(f"Restoring market data from {options['file']}...")
+        
+        try:
+            result = restore_snapshot(options['file'], batch_size=options['batch_size'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(
+            f"Restored {result['rows']} rows in {result['elapsed']:.2f}s"
+        ))
@@ -0,0 +1,70 @@
+"""
+Management command to sync MarketData with the upstream data CSV.
+
+Hashes every row by (year, week) and content, compares with the table
+and applies only the inserts, updates and deletes, instead of reloading
+every row. The change set can be written to a JSON file for the rest of
+the pipeline (see automation/weekly_retrain.sh). See market_data.sync.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from market_data.sync import sync_csv
+
+
+class Command(BaseCommand):
+    help = 'Apply only the rows that changed in the upstream market data CSV'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'file',
+            type=str,
+            help='Upstream CSV file (combined_file.csv layout), the complete data set'
+        )
+        parser.add_argument(
+            '--source',
+            type=str,
+            default='upstream_sync',
+            help='Value stored in MarketData.source on written rows (default: upstream_sync)'
+        )
+        parser.add_argument(
+            '--keep-missing',
+            action='store_true',
+            help='Keep weeks that are no longer in the CSV instead of deleting them'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Only report what would change'
+        )
+        parser.add_argument(
+            '--changes-file',
+            type=str,
+            help='Write the change set to this JSON file'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            changes = sync_csv(
+                options['file'],
+                source=options['source'],
+                delete=not options['keep_missing'],
+                dry_run=options['dry_run'],
+            )
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        if options['changes_file']:
+            changes.save(options['changes_file'])
+        
+        for row, reason in changes.report.rejections:
+            self.stdout.write(self.style.WARNING(f'Rejected row {row}: {reason}'))
+        
+        summary = (
+            f'{len(changes.inserted)} inserted, {len(changes.updated)} updated, '
+            f'{len(changes.deleted)} deleted, {changes.unchanged} unchanged, '
+            f'{changes.report.rejected} rejected in {changes.report.elapsed:.2f}s'
+        )
+        if options['dry_run']:
+            self.stdout.write(f'Dry run, nothing written: {summary}')
+        else:
+            self.stdout.write(self.style.SUCCESS(summary))
@@ -2,6 +2,8 @@
 Market Data Models
 """
 
+from datetime import timedelta
+
 from django.db import models
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
@@ -57,7 +59,7 @@ class MarketData(models.Model):
     class Meta:
         ordering = ['-year', '-week']
         unique_together = ['year', 'week']
-        
+    
     def __str__(self):
         return f"Week {self.week}, {self.year} - {self.market_demand} Demand"
     
@@ -79,9 +81,40 @@ class MarketData(models.Model):
             return 'Stable'
 
 
+class IngestedFile(models.Model):
+    """CSV file already written into MarketData, keyed on its content hash"""
+    
+    sha256 = models.CharField(max_length=64, unique=True)
+    name = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    
+    mode = models.CharField(max_length=20)
+    source = models.CharField(max_length=100)
+    rows = models.PositiveIntegerField(default=0)
+    inserted = models.PositiveIntegerField(default=0)
+    updated = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    
+    ingested_at = models.DateTimeField(auto_now_add=True)
+    
+    class Meta:
+        ordering = ['-ingested_at']
+    
+    def __str__(self):
+        return f"{self.name} ({self.sha256[:12]})"
+
+
 class DataSource(models.Model):
     """Model to track different data sources"""
     
+    # Time between scheduled fetches ('manual' sources are never scheduled)
+    FETCH_INTERVALS = {
+        'daily': timedelta(days=1),
+        'weekly': timedelta(weeks=1),
+        'monthly': timedelta(days=30),
+    }
+    
     name = models.CharField(max_length=100, unique=True)
     url = models.URLField(blank=True, null=True)
     description = models.TextField(blank=True)
@@ -97,13 +130,16 @@ class DataSource(models.Model):
         ],
         default='weekly'
     )
+    # Validators from the last response, sent back to make the next fetch conditional
+    etag = models.CharField(max_length=255, blank=True)
+    last_modified = models.CharField(max_length=64, blank=True)
     
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
     class Meta:
         ordering = ['name']
-        
+    
     def __str__(self):
         return f"{self.name} ({'Active' if self.is_active else 'Inactive'})"
     
@@ -111,18 +147,9 @@ class DataSource(models.Model):
     def needs_update(self):
         if not self.is_active or not self.last_fetch:
             return True
-            
-        from datetime import timedelta
-        now = timezone.now()
-        
-        frequency_map = {
-            'daily': timedelta(days=1),
-            'weekly': timedelta(weeks=1),
-            'monthly': timedelta(days=30),
-        }
         
-        if self.fetch_frequency in frequency_map:
-            time_since_last_fetch = now - self.last_fetch
-            return time_since_last_fetch >= frequency_map[self.fetch_frequency]
+        if self.fetch_frequency in self.FETCH_INTERVALS:
+            time_since_last_fetch = timezone.now() - self.last_fetch
+            return time_since_last_fetch >= self.FETCH_INTERVALS[self.fetch_frequency]
         
         return False
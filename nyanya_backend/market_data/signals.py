@@ -0,0 +1,28 @@
+"""
+Market Data Signals
+
+market_data_changed is sent after a transaction that changed MarketData
+rows commits, with the change set, so consumers (caches, feature
+matrices, retraining) only redo work for the weeks that changed:
+    
+    from market_data.signals import market_data_changed
+    
+    def on_change(sender, changes, **kwargs):
+        for year, week in changes.weeks:
+            ...
+    
+    market_data_changed.connect(on_change)
+
+market_data_loaded is sent when a transaction of a bulk load that does
+not work out a change set (ingestion, snapshot restore) commits, for
+consumers that only need to know that something changed.
+"""
+
+from django.dispatch import Signal
+
+
+# Sent with changes=ChangeSet (see market_data.sync)
+market_data_changed = Signal()
+
+# Sent with report=IngestReport, or report=None for a snapshot restore
+market_data_loaded = Signal()
@@ -0,0 +1,180 @@
+"""
+Incremental Market Data Sync
+
+Mirrors an upstream CSV (the data repository's combined_file.csv) into
+MarketData by applying only what changed. Both sides are keyed on
+(year, week) and every row's content is hashed, so the sync knows which
+weeks are:
+
+- inserted:  in the CSV, not in the table
+- updated:   in both, with different content
+- deleted:   in the table, no longer in the CSV
+- unchanged: in both, identical (never written)
+
+The changes are applied in one transaction and the resulting ChangeSet
+is sent with the market_data_changed signal once it commits.
+"""
+
+import json
+import time
+
+import numpy as np
+import pandas as pd
+from django.db import transaction
+
+from .ingest import IngestReport, _write_batch, prepare_frame
+from .models import MarketData
+from .signals import market_data_changed
+
+
+# Fields compared between the CSV and the table (source and timestamps aren't)
+CONTENT_FIELDS = [
+    'month', 'rainfall_mm', 'temperature_c', 'market_day', 'school_open',
+    'disease_alert', 'last_week_demand', 'market_demand',
+]
+
+
+class ChangeSet:
+    """(year, week) keys a sync inserted, updated and deleted"""
+    
+    def __init__(self, inserted=(), updated=(), deleted=(), unchanged=0):
+        self.inserted = sorted(inserted)
+        self.updated = sorted(updated)
+        self.deleted = sorted(deleted)
+        self.unchanged = unchanged
+        self.report = IngestReport()
+    
+    def __bool__(self):
+        return bool(self.inserted or self.updated or self.deleted)
+    
+    def __len__(self):
+        return len(self.inserted) + len(self.updated) + len(self.deleted)
+    
+    @property
+    def weeks(self):
+        """Every changed (year, week), sorted"""
+        
+        return sorted(self.inserted + self.updated + self.deleted)
+    
+    def as_dict(self):
+        return {
+            'total': len(self),
+            'inserted': [list(key) for key in self.inserted],
+            'updated': [list(key) for key in self.updated],
+            'deleted': [list(key) for key in self.deleted],
+            'unchanged': self.unchanged,
+            'rejected': self.report.rejected,
+        }
+    
+    def save(self, path):
+        """Write the change set as JSON for scripts further down the pipeline"""
+        
+        with open(path, 'w') as f:
+            json.dump(self.as_dict(), f, indent=2)
+
+
+def sync_csv(path, **kwargs):
+    """Sync MarketData with a CSV file; see sync_frame for the arguments"""
+    
+    return sync_frame(pd.read_csv(path), **kwargs)
+
+
+def sync_frame(df, source='upstream_sync', delete=True, dry_run=False, batch_size=500):
+    """
+    Make MarketData match CSV rows, writing only the differences.
+    
+    Invalid CSV rows are rejected as in ingestion, and the weeks they name
+    are never deleted, so one bad line upstream cannot drop a week.
+    
+    Args:
+        df (pd.DataFrame): The complete upstream data (combined_file.csv columns)
+        source (str): Value stored in MarketData.source on written rows
+        delete (bool): Delete weeks that are no longer in the CSV
+        dry_run (bool): Work out the change set without writing anything
+        batch_size (int): Rows per bulk INSERT / DELETE
+    
+    Returns:
+        ChangeSet: What changed (or would change, for a dry run);
+            changes.report holds the rejected rows and timing
+    """
+    
+    start = time.perf_counter()
+    report = IngestReport()
+    report.rows_read = len(df)
+    incoming = prepare_frame(df, report)
+    
+    current = pd.DataFrame.from_records(
+        MarketData.objects.values_list('id', 'year', 'week', *CONTENT_FIELDS),
+        columns=['id', 'year', 'week', *CONTENT_FIELDS],
+    )
+    
+    incoming['hash'] = _content_hashes(incoming)
+    current['hash'] = _content_hashes(current)
+    merged = incoming[['year', 'week', 'hash']].merge(
+        current[['id', 'year', 'week', 'hash']].astype({'year': int, 'week': int}),
+        on=['year', 'week'], how='outer', suffixes=('', '_current'), indicator=True,
+    )
+    
+    is_insert = (merged['_merge'] == 'left_only').to_numpy()
+    is_update = ((merged['_merge'] == 'both') & (merged['hash'] != merged['hash_current']).fillna(False)).to_numpy()
+    is_delete = (merged['_merge'] == 'right_only').to_numpy()
+    if delete:
+        # Weeks named by rejected rows are kept
+        named = set(zip(
+            pd.to_numeric(df['Year'], errors='coerce').tolist(),
+            pd.to_numeric(df['Week'], errors='coerce').tolist(),
+        ))
+        is_delete = is_delete & ~np.array([key in named for key in zip(merged['year'], merged['week'])], dtype=bool)
+    else:
+        is_delete = np.zeros_like(is_delete)
+    
+    def keys(mask):
+        return list(zip(merged['year'][mask].tolist(), merged['week'][mask].tolist()))
+    
+    changes = ChangeSet(
+        inserted=keys(is_insert),
+        updated=keys(is_update),
+        deleted=keys(is_delete),
+        unchanged=int(((merged['_merge'] == 'both') & ~is_update).sum()),
+    )
+    changes.report = report
+    
+    if changes and not dry_run:
+        written = incoming.merge(
+            pd.DataFrame(changes.inserted + changes.updated, columns=['year', 'week'], dtype=np.int64)
+        )
+        written = written.drop(columns='hash')
+        deleted_ids = merged['id'][is_delete].astype(int).tolist()
+        
+        with transaction.atomic():
+            for offset in range(0, len(written), batch_size):
+                _write_batch(written.iloc[offset:offset + batch_size], 'upsert', source, report)
+            for offset in range(0, len(deleted_ids), batch_size):
+                MarketData.objects.filter(id__in=deleted_ids[offset:offset + batch_size]).delete()
+            
+            transaction.on_commit(lambda: market_data_changed.send(sender=MarketData, changes=changes))
+    
+    report.elapsed = time.perf_counter() - start
+    return changes
+
+
+def _content_hashes(frame):
+    """
+    One 64-bit hash per row over CONTENT_FIELDS (nullable, so it survives
+    an outer merge without turning into floats).
+    
+    Values are put in the same form on both sides first: decimals as
+    integer hundredths, booleans as booleans, everything else as text.
+    """
+    
+    canonical = pd.DataFrame({
+        field: (
+            np.rint(frame[field].astype(float) * 100).astype(np.int64)
+            if field in ('rainfall_mm', 'temperature_c')
+            else frame[field].astype(bool) if field in ('market_day', 'school_open')
+            else frame[field].astype(str)
+        )
+        for field in CONTENT_FIELDS
+    }, index=frame.index)
+    hashes = pd.util.hash_pandas_object(canonical, index=False).to_numpy()
+    return pd.array(hashes.view(np.int64), dtype='Int64')
@@ -1,3 +1,432 @@
+"""
+Market Data Tests
+"""
+
+import io
+import json
+import os
+import tempfile
+import threading
+from datetime import timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+import numpy as np
+import pandas as pd
+from django.core.management import call_command
+from django.db import OperationalError
 from django.test import TestCase
+from django.utils import timezone
+
+from . import fetch
+from .fetch import due_sources, fetch_sources
+from .ingest import _file_fingerprint, expand_paths, ingest_csv, ingest_files, ingest_frame
+from .models import DataSource, IngestedFile, MarketData
+from .signals import market_data_changed
+from .snapshot import dump_snapshot, restore_snapshot
+from .sync import sync_frame
+
+
+def csv_rows(*overrides):
+    """CSV rows in the combined_file.csv layout, one per override dict"""
+    
+    base = {
+        'Week': 1, 'Rainfall_mm': 98.0, 'Temperature_C': 21.6, 'Market_Day': 'yes',
+        'School_Open': 'yes', 'Disease_Alert': 'Presence', 'Last_Week_Demand': 'Medium',
+        'Market_Demand': 'Medium', 'Month': 'January', 'Year': 2025,
+    }
+    return pd.DataFrame([{**base, **override} for override in overrides])
+
+
+class IngestTests(TestCase):
+    """Bulk CSV ingestion counts, validation and upsert semantics"""
+    
+    def test_insert_then_upsert(self):
+        report = ingest_frame(csv_rows({'Week': 1}, {'Week': 2}))
+        self.assertEqual((report.inserted, report.updated), (2, 0))
+        
+        report = ingest_frame(csv_rows({'Week': 2, 'Market_Demand': 'High'}, {'Week': 3}))
+        self.assertEqual((report.inserted, report.updated), (1, 1))
+        
+        self.assertEqual(MarketData.objects.count(), 3)
+        self.assertEqual(MarketData.objects.get(year=2025, week=2).market_demand, 'High')
+    
+    def test_insert_only_keeps_existing_weeks(self):
+        ingest_frame(csv_rows({'Week': 1}))
+        
+        report = ingest_frame(csv_rows({'Week': 1, 'Market_Demand': 'Low'}, {'Week': 2}), mode='insert-only')
+        
+        self.assertEqual((report.inserted, report.skipped), (1, 1))
+        self.assertEqual(MarketData.objects.get(year=2025, week=1).market_demand, 'Medium')
+    
+    def test_converts_values(self):
+        ingest_frame(csv_rows({'Market_Day': 'No', 'School_Open': 'Yes', 'Rainfall_mm': 12.346}), source='test')
+        
+        week = MarketData.objects.get()
+        self.assertFalse(week.market_day)
+        self.assertTrue(week.school_open)
+        self.assertEqual(week.rainfall_mm, Decimal('12.35'))
+        self.assertEqual(week.source, 'test')
+    
+    def test_rejects_invalid_rows(self):
+        report = ingest_frame(csv_rows(
+            {'Week': 1},
+            {'Week': 2, 'Rainfall_mm': -5},
+            {'Week': 3, 'Market_Day': 'maybe'},
+            {'Week': 4, 'Month': 'Smarch'},
+            {'Week': 'x'},
+        ))
+        
+        self.assertEqual((report.inserted, report.rejected), (1, 4))
+        self.assertEqual([row for row, _ in report.rejections], [2, 3, 4, 5])
+        self.assertIn('Rainfall_mm', report.rejections[0][1])
+    
+    def test_duplicate_weeks_keep_last_row(self):
+        report = ingest_frame(csv_rows({'Week': 1, 'Market_Demand': 'Low'}, {'Week': 1, 'Market_Demand': 'High'}))
+        
+        self.assertEqual((report.inserted, report.rejected), (1, 1))
+        self.assertEqual(MarketData.objects.get().market_demand, 'High')
+    
+    def test_chunks(self):
+        report = ingest_frame(csv_rows(*({'Week': week} for week in range(1, 8))), chunk_size=3)
+        
+        self.assertEqual(report.inserted, 7)
+        self.assertEqual(MarketData.objects.count(), 7)
+
+
+class StreamingIngestTests(TestCase):
+    """Chunked CSV streaming with checkpoint and resume"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'market.csv')
+        self.checkpoint = self.path + '.checkpoint'
+        csv_rows(*({'Week': week} for week in range(1, 8)), {'Week': 8, 'Month': 'Smarch'}).to_csv(self.path, index=False)
+    
+    def test_streams_in_chunks(self):
+        report = ingest_csv(self.path, chunk_size=3, batch_size=2, checkpoint=self.checkpoint)
+        
+        self.assertEqual((report.inserted, report.rejected, report.rows_read), (7, 1, 8))
+        self.assertEqual(report.rejections[0][0], 8)
+        self.assertEqual(MarketData.objects.count(), 7)
+        self.assertFalse(os.path.exists(self.checkpoint))
+    
+    def test_resumes_after_last_committed_chunk(self):
+        ingest_frame(csv_rows(*({'Week': week} for week in range(1, 4))))
+        with open(self.checkpoint, 'w') as f:
+            json.dump({
+                'fingerprint': _file_fingerprint(self.path), 'mode': 'upsert', 'rows': 3,
+                'inserted': 3, 'updated': 0, 'skipped': 0, 'rejected': 0,
+            }, f)
+        
+        report = ingest_csv(self.path, chunk_size=3, checkpoint=self.checkpoint)
+        
+        self.assertEqual((report.resumed_from, report.rows_read), (4, 5))
+        self.assertEqual((report.inserted, report.updated, report.rejected), (7, 0, 1))
+        self.assertEqual(report.rejections[0][0], 8)
+    
+    def test_changed_file_starts_over(self):
+        with open(self.checkpoint, 'w') as f:
+            json.dump({
+                'fingerprint': 'stale', 'mode': 'upsert', 'rows': 3,
+                'inserted': 3, 'updated': 0, 'skipped': 0, 'rejected': 0,
+            }, f)
+        
+        report = ingest_csv(self.path, chunk_size=3, checkpoint=self.checkpoint)
+        
+        self.assertEqual((report.resumed_from, report.inserted), (1, 7))
+
+
+class MultiFileIngestTests(TestCase):
+    """Folder ingestion: parallel parsing, one writer, content-hash skipping"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = directory.name
+        csv_rows({'Week': 1}, {'Week': 2, 'Market_Demand': 'Low'}).to_csv(self.path('a.csv'), index=False)
+        csv_rows({'Week': 2, 'Market_Demand': 'High'}, {'Week': 3}).to_csv(self.path('b.csv'), index=False)
+        csv_rows({'Week': 4}, {'Week': 5, 'Rainfall_mm': -1}).to_csv(self.path('c.csv'), index=False)
+    
+    def path(self, name):
+        return os.path.join(self.directory, name)
+    
+    def test_ingests_folder_in_path_order(self):
+        report = ingest_files(expand_paths(self.directory), workers=2)
+        
+        self.assertEqual([status for _, status, _ in report.files], ['ingested'] * 3)
+        self.assertEqual((report.inserted, report.updated, report.rejected), (4, 1, 1))
+        self.assertEqual(report.rejections[0][0], 'c.csv:2')
+        self.assertEqual(MarketData.objects.get(week=2).market_demand, 'High')
+        self.assertEqual(IngestedFile.objects.get(name='c.csv').rejected, 1)
+    
+    def test_skips_recorded_files(self):
+        ingest_files(expand_paths(self.directory), workers=1)
+        csv_rows({'Week': 6}).to_csv(self.path('d.csv'), index=False)
+        
+        report = ingest_files(expand_paths(os.path.join(self.directory, '*.csv')), workers=1)
+        
+        self.assertEqual([status for _, status, _ in report.files], ['skipped'] * 3 + ['ingested'])
+        self.assertEqual((report.inserted, report.updated), (1, 0))
+        
+        report = ingest_files([self.path('a.csv')], workers=1, force=True)
+        self.assertEqual((report.files[0][1], report.updated), ('ingested', 2))
+        self.assertEqual(IngestedFile.objects.count(), 4)
+    
+    def test_unparseable_file_fails_alone(self):
+        with open(self.path('bad.csv'), 'w') as f:
+            f.write('not,a,market,file\n')
+        
+        report = ingest_files(expand_paths(self.directory), workers=1)
+        
+        self.assertEqual(dict((os.path.basename(path), status) for path, status, _ in report.files)['bad.csv'], 'failed')
+        self.assertEqual(IngestedFile.objects.count(), 3)
+        self.assertEqual(MarketData.objects.count(), 4)
+
+
+class SnapshotTests(TestCase):
+    """Columnar snapshot dump and restore"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'market.npz')
+        ingest_frame(csv_rows(
+            {'Week': 1, 'Rainfall_mm': 12.34, 'Temperature_C': -1.5},
+            {'Week': 2, 'Market_Day': 'no', 'Month': 'March', 'Market_Demand': 'High'},
+        ), source='test')
+    
+    def rows(self):
+        return list(MarketData.objects.order_by('id').values())
+    
+    def test_round_trip(self):
+        before = self.rows()
+        self.assertEqual(dump_snapshot(self.path)['rows'], 2)
+        
+        MarketData.objects.filter(week=1).update(market_demand='Low')
+        MarketData.objects.create(week=3, month='May', rainfall_mm=0, temperature_c=20,
+                                  last_week_demand='Low', market_demand='Low')
+        
+        self.assertEqual(restore_snapshot(self.path, batch_size=1)['rows'], 2)
+        self.assertEqual(self.rows(), before)
+    
+    def test_rejects_modified_snapshot(self):
+        dump_snapshot(self.path)
+        with np.load(self.path) as archive:
+            arrays = dict(archive)
+        arrays['week'] = arrays['week'] + 1
+        with open(self.path, 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        
+        with self.assertRaisesRegex(ValueError, 'checksum'):
+            restore_snapshot(self.path)
+        self.assertEqual(MarketData.objects.count(), 2)
+
+
+class SyncTests(TestCase):
+    """Diff-based sync against the upstream CSV"""
+    
+    def setUp(self):
+        self.upstream = csv_rows({'Week': 1}, {'Week': 2}, {'Week': 3, 'Rainfall_mm': 10.5})
+        sync_frame(self.upstream)
+        
+        self.received = []
+        handler = lambda sender, changes, **kwargs: self.received.append(changes)
+        market_data_changed.connect(handler)
+        self.addCleanup(market_data_changed.disconnect, handler)
+    
+    def test_unchanged_data_writes_nothing(self):
+        with self.captureOnCommitCallbacks(execute=True), self.assertNumQueries(1):
+            changes = sync_frame(self.upstream)
+        
+        self.assertFalse(changes)
+        self.assertEqual(changes.unchanged, 3)
+        self.assertEqual(self.received, [])
+    
+    def test_applies_only_differences(self):
+        upstream = csv_rows({'Week': 1}, {'Week': 3, 'Rainfall_mm': 10.6}, {'Week': 4})
+        
+        with self.captureOnCommitCallbacks(execute=True):
+            changes = sync_frame(upstream)
+        
+        self.assertEqual((changes.inserted, changes.updated, changes.deleted), ([(2025, 4)], [(2025, 3)], [(2025, 2)]))
+        self.assertEqual(changes.unchanged, 1)
+        self.assertEqual(self.received, [changes])
+        self.assertEqual(sorted(MarketData.objects.values_list('week', flat=True)), [1, 3, 4])
+        self.assertEqual(MarketData.objects.get(week=3).rainfall_mm, Decimal('10.60'))
+    
+    def test_rejected_rows_are_not_deleted(self):
+        changes = sync_frame(csv_rows({'Week': 1}, {'Week': 2, 'Market_Day': 'maybe'}, {'Week': 3, 'Rainfall_mm': 10.5}))
+        
+        self.assertEqual((len(changes), changes.report.rejected), (0, 1))
+        self.assertEqual(MarketData.objects.count(), 3)
+    
+    def test_dry_run_and_keep_missing(self):
+        changes = sync_frame(csv_rows({'Week': 1}), dry_run=True)
+        self.assertEqual(changes.deleted, [(2025, 2), (2025, 3)])
+        self.assertEqual(MarketData.objects.count(), 3)
+        
+        changes = sync_frame(csv_rows({'Week': 1}), delete=False)
+        self.assertFalse(changes)
+
+
+class UpstreamHandler(BaseHTTPRequestHandler):
+    """Stand-in data source: /market.csv and /second.csv with an ETag, anything else 404"""
+    
+    body = csv_rows({'Week': 1}, {'Week': 2}).to_csv(index=False).encode()
+    etag = '"v1"'
+    
+    def do_GET(self):
+        self.server.requests.append((self.path, self.headers.get('If-None-Match')))
+        if self.path not in ('/market.csv', '/second.csv'):
+            self.send_error(404)
+        elif self.headers.get('If-None-Match') == self.etag:
+            self.send_response(304)
+            self.end_headers()
+        else:
+            self.send_response(200)
+            self.send_header('ETag', self.etag)
+            self.send_header('Content-Length', str(len(self.body)))
+            self.end_headers()
+            self.wfile.write(self.body)
+    
+    def log_message(self, *args):
+        pass
+
 
-# Create your tests here.
+class FetchTests(TestCase):
+    """Scheduled DataSource fetching against a local HTTP server"""
+    
+    def setUp(self):
+        server = ThreadingHTTPServer(('127.0.0.1', 0), UpstreamHandler)
+        server.requests = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        self.server = server
+        self.base_url = f'http://127.0.0.1:{server.server_port}'
+    
+    def test_due_sources(self):
+        now = timezone.now()
+        for name, frequency, age in (
+            ('new', 'weekly', None),
+            ('stale', 'daily', timedelta(days=2)),
+            ('fresh', 'weekly', timedelta(days=2)),
+            ('manual', 'manual', None),
+        ):
+            DataSource.objects.create(
+                name=name, url=f'{self.base_url}/{name}', fetch_frequency=frequency,
+                last_fetch=now - age if age else None,
+            )
+        DataSource.objects.create(name='inactive', url=f'{self.base_url}/x', is_active=False)
+        DataSource.objects.create(name='no-url')
+        
+        with self.assertNumQueries(1):
+            names = sorted(source.name for source in due_sources(now))
+        self.assertEqual(names, ['new', 'stale'])
+    
+    def test_needs_update_follows_fetch_intervals(self):
+        now = timezone.now()
+        source = DataSource(name='weekly', fetch_frequency='weekly', last_fetch=now - timedelta(days=6))
+        self.assertFalse(source.needs_update)
+        
+        source.last_fetch = now - DataSource.FETCH_INTERVALS['weekly']
+        self.assertTrue(source.needs_update)
+        
+        source.fetch_frequency = 'manual'
+        self.assertFalse(source.needs_update)
+    
+    def test_fetch_ingests_then_revalidates(self):
+        market = DataSource.objects.create(name='market', url=f'{self.base_url}/market.csv')
+        DataSource.objects.create(name='broken', url=f'{self.base_url}/missing.csv')
+        
+        with self.assertLogs('market_data.fetch', 'WARNING'):
+            results = {result.source.name: result for result in fetch_sources(workers=2)}
+        
+        self.assertEqual(results['market'].status, 'fetched')
+        self.assertEqual(results['market'].report.inserted, 2)
+        self.assertEqual(results['broken'].status, 'failed')
+        self.assertEqual(MarketData.objects.filter(source='datasource:market').count(), 2)
+        market.refresh_from_db()
+        self.assertEqual(market.etag, '"v1"')
+        self.assertIsNotNone(market.last_fetch)
+        self.assertIsNone(DataSource.objects.get(name='broken').last_fetch)
+        
+        # Not due any more; forced, it is revalidated with one 304
+        self.assertEqual([source.name for source in due_sources()], ['broken'])
+        results = fetch_sources([market])
+        self.assertEqual(results[0].status, 'not_modified')
+        self.assertEqual(self.server.requests[-1], ('/market.csv', '"v1"'))
+    
+    def downloads(self):
+        """Patch the downloader to record every temporary file it creates"""
+        
+        paths = []
+        download = fetch._download
+        
+        def recorded(source, timeout):
+            result = download(source, timeout)
+            paths.append(result.path)
+            return result
+        
+        patcher = mock.patch.object(fetch, '_download', side_effect=recorded)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return paths
+    
+    def test_database_error_only_fails_its_source(self):
+        market = DataSource.objects.create(name='market', url=f'{self.base_url}/market.csv')
+        second = DataSource.objects.create(name='second', url=f'{self.base_url}/second.csv')
+        paths = self.downloads()
+        
+        def locked(path, mode, source):
+            if source == 'datasource:second':
+                raise OperationalError('database is locked')
+            return ingest_csv(path, mode=mode, source=source)
+        
+        with mock.patch.object(fetch, 'ingest_csv', side_effect=locked):
+            with self.assertLogs('market_data.fetch', 'WARNING'):
+                results = {result.source.name: result for result in fetch_sources(workers=2)}
+        
+        self.assertEqual((results['market'].status, results['second'].status), ('fetched', 'failed'))
+        self.assertIn('database is locked', results['second'].error)
+        market.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((market.etag, second.etag), ('"v1"', ''))
+        self.assertIsNone(second.last_fetch)
+        self.assertEqual([source.name for source in due_sources()], ['second'])
+        self.assertFalse([path for path in paths if os.path.exists(path)])
+    
+    def test_unexpected_error_keeps_earlier_sources(self):
+        market = DataSource.objects.create(name='market', url=f'{self.base_url}/market.csv')
+        second = DataSource.objects.create(name='second', url=f'{self.base_url}/second.csv')
+        paths = self.downloads()
+        
+        def broken(path, mode, source):
+            if source == 'datasource:second':
+                raise RuntimeError('bug')
+            return ingest_csv(path, mode=mode, source=source)
+        
+        # One worker: market is downloaded, and ingested, first
+        with mock.patch.object(fetch, 'ingest_csv', side_effect=broken):
+            with self.assertRaises(RuntimeError):
+                fetch_sources([market, second], workers=1)
+        
+        market.refresh_from_db()
+        self.assertEqual(market.etag, '"v1"')
+        self.assertFalse([path for path in paths if os.path.exists(path)])
+    
+    def test_loop_outlives_a_failed_pass(self):
+        class Stop(Exception):
+            pass
+        
+        command = 'market_data.management.commands.fetch_data_sources'
+        with mock.patch(f'{command}.fetch_sources', side_effect=[OperationalError('database is locked'), []]) as fetched, \
+                mock.patch(f'{command}.time') as clock:
+            clock.sleep.side_effect = [None, Stop]
+            with self.assertLogs(command, 'ERROR'), self.assertRaises(Stop):
+                call_command('fetch_data_sources', loop=60, stdout=io.StringIO())
+        
+        self.assertEqual(fetched.call_count, 2)
@@ -1,6 +1,16 @@
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class PredictionsConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'predictions'
+    
+    def ready(self):
+        # Connects the signal receivers that invalidate cached dashboard responses
+        from . import response_cache  # noqa: F401
+        
+        # Opt-in so management commands like migrate don't unpickle the model
+        if settings.PRELOAD_MODEL:
+            from .model_loader import predictor
+            predictor.warm_up()
@@ -0,0 +1,270 @@
+"""
+Prediction Micro-Batching
+
+Concurrent prediction calls in one process are queued and scored
+together. A dispatcher thread drains the queue into batches of up to
+max_rows rows, waiting at most window_ms after the oldest queued call for
+others to join (only under concurrency), and scores each batch with one
+predict_batch() call.
+Every caller gets its own rows back through a concurrent.futures.Future:
+blocking callers (threaded gunicorn workers) wait on it, async callers
+(the ASGI app) await it.
+"""
+
+import asyncio
+import collections
+import logging
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+from django.conf import settings
+
+from .model_loader import predictor
+
+
+logger = logging.getLogger(__name__)
+
+
+class BatchMetrics:
+    """
+    Batch size and queue wait counters.
+    
+    Totals cover the process lifetime; means and percentiles cover the
+    most recent RECENT batches.
+    """
+    
+    RECENT = 1000
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+    
+    def reset(self):
+        with self._lock:
+            self.batches = 0
+            self.requests = 0
+            self.rows = 0
+            self.failed_batches = 0
+            self.max_batch_rows = 0
+            self._batch_rows = collections.deque(maxlen=self.RECENT)
+            self._batch_requests = collections.deque(maxlen=self.RECENT)
+            self._waits = collections.deque(maxlen=self.RECENT)
+    
+    def record(self, rows, waits, failed=False):
+        """
+        Count one scored batch.
+        
+        Args:
+            rows (int): Rows scored together
+            waits (list): Seconds each call in the batch spent queued
+            failed (bool): The batched call failed and rows were rescored per call
+        """
+        
+        with self._lock:
+            self.batches += 1
+            self.requests += len(waits)
+            self.rows += rows
+            self.failed_batches += failed
+            self.max_batch_rows = max(self.max_batch_rows, rows)
+            self._batch_rows.append(rows)
+            self._batch_requests.append(len(waits))
+            self._waits.extend(waits)
+    
+    def snapshot(self):
+        """JSON-safe view of the counters"""
+        
+        with self._lock:
+            waits = np.array(self._waits) * 1000
+            return {
+                'batches': self.batches,
+                'requests': self.requests,
+                'rows': self.rows,
+                'failed_batches': self.failed_batches,
+                'max_batch_rows': self.max_batch_rows,
+                'mean_batch_rows': round(float(np.mean(self._batch_rows)), 2) if self._batch_rows else 0.0,
+                'mean_requests_per_batch': round(float(np.mean(self._batch_requests)), 2) if self._batch_requests else 0.0,
+                'queue_wait_ms': {
+                    'mean': round(float(waits.mean()), 3),
+                    'p50': round(float(np.percentile(waits, 50)), 3),
+                    'p95': round(float(np.percentile(waits, 95)), 3),
+                    'max': round(float(waits.max()), 3),
+                } if len(waits) else None,
+            }
+
+
+class PredictionBatcher:
+    """
+    Coalesces concurrent prediction calls into batched forest passes.
+    
+    Drop-in for the predictor's predict()/predict_batch(), plus awaitable
+    apredict()/apredict_batch(). A call is never split across batches,
+    and if a batch fails each call in it is rescored on its own, so a bad
+    row only fails the call that sent it.
+    
+    Configured by settings.PREDICTION_BATCHING, PREDICTION_BATCH_WINDOW_MS
+    and PREDICTION_BATCH_MAX_ROWS. Disabled, every call is scored inline.
+    """
+    
+    def __init__(self, loader=None, enabled=None, window_ms=None, max_rows=None):
+        if enabled is None:
+            enabled = getattr(settings, 'PREDICTION_BATCHING', True)
+        if window_ms is None:
+            window_ms = getattr(settings, 'PREDICTION_BATCH_WINDOW_MS', 2.0)
+        if max_rows is None:
+            max_rows = getattr(settings, 'PREDICTION_BATCH_MAX_ROWS', 64)
+        
+        self.loader = loader or predictor
+        self.enabled = enabled
+        self.window_ms = window_ms
+        self.max_rows = max_rows
+        self.metrics = BatchMetrics()
+        
+        self._reset()
+        # The dispatcher thread does not survive fork(); each worker
+        # starts its own on first use
+        os.register_at_fork(after_in_child=self._reset)
+    
+    def _reset(self):
+        self._queue = queue.SimpleQueue()
+        self._lock = threading.Lock()
+        self._dispatcher_pid = None
+        self._last_batch_requests = 0
+    
+    def submit(self, scenarios):
+        """
+        Queue scenarios for the next batch.
+        
+        Args:
+            scenarios (list): Scenario dicts (see TomatoModelLoader.encode_batch)
+        
+        Returns:
+            Future: Resolves to the (predicted_demand, confidence_score)
+                tuples for these scenarios, in order
+        """
+        
+        scenarios = list(scenarios)
+        future = Future()
+        
+        if not self.enabled or not scenarios:
+            self._resolve(future, scenarios)
+            return future
+        
+        self._start_dispatcher()
+        self._queue.put((scenarios, future, time.perf_counter()))
+        return future
+    
+    def predict(self, **scenario):
+        """Blocking single prediction; same arguments as predictor.predict()"""
+        
+        return self.submit([scenario]).result()[0]
+    
+    def predict_batch(self, scenarios):
+        """Blocking batch prediction; same contract as predictor.predict_batch()"""
+        
+        return self.submit(scenarios).result()
+    
+    async def apredict(self, **scenario):
+        """Awaitable predict() for async views"""
+        
+        return (await asyncio.wrap_future(self.submit([scenario])))[0]
+    
+    async def apredict_batch(self, scenarios):
+        """Awaitable predict_batch() for async views"""
+        
+        return await asyncio.wrap_future(self.submit(scenarios))
+    
+    def _start_dispatcher(self):
+        if self._dispatcher_pid == os.getpid():
+            return
+        
+        with self._lock:
+            if self._dispatcher_pid == os.getpid():
+                return
+            threading.Thread(target=self._dispatch, name='prediction-batcher', daemon=True).start()
+            self._dispatcher_pid = os.getpid()
+    
+    def _dispatch(self):
+        while True:
+            batch = self._collect()
+            try:
+                self._run(batch)
+            except Exception as e:
+                logger.error("Prediction batcher error: %s", e)
+                for _, future, _ in batch:
+                    if not future.done():
+                        future.set_exception(e)
+    
+    def _collect(self):
+        """
+        Block for the first queued call, then gather more until the batch
+        holds max_rows rows or window_ms has passed since the first call
+        was queued. While calls arrive one at a time there is no wait.
+        """
+        
+        first = self._queue.get()
+        batch = [first]
+        rows = len(first[0])
+        
+        # A lone caller after a lone batch means there is no concurrency
+        # to wait for; score it right away instead of paying the window
+        window = self.window_ms
+        if self._last_batch_requests <= 1 and self._queue.empty():
+            window = 0
+        deadline = first[2] + window / 1000
+        
+        while rows < self.max_rows:
+            timeout = deadline - time.perf_counter()
+            try:
+                item = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            batch.append(item)
+            rows += len(item[0])
+        
+        self._last_batch_requests = len(batch)
+        return batch
+    
+    def _run(self, batch):
+        # Callers that gave up (e.g. a cancelled async request) are dropped
+        batch = [item for item in batch if item[1].set_running_or_notify_cancel()]
+        if not batch:
+            return
+        
+        started = time.perf_counter()
+        waits = [started - queued for _, _, queued in batch]
+        
+        scenarios = [scenario for item in batch for scenario in item[0]]
+        failed = False
+        
+        try:
+            results = self.loader.predict_batch(scenarios)
+        except Exception:
+            failed = True
+            for item_scenarios, future, _ in batch:
+                self._resolve(future, item_scenarios, running=True)
+        else:
+            offset = 0
+            for item_scenarios, future, _ in batch:
+                future.set_result(results[offset:offset + len(item_scenarios)])
+                offset += len(item_scenarios)
+        
+        self.metrics.record(len(scenarios), waits, failed=failed)
+    
+    def _resolve(self, future, scenarios, running=False):
+        """Score one call on its own and settle its future"""
+        
+        if not running and not future.set_running_or_notify_cancel():
+            return
+        
+        try:
+            future.set_result(self.loader.predict_batch(scenarios) if scenarios else [])
+        except Exception as e:
+            future.set_exception(e)
+
+
+# Global batcher in front of the global predictor
+batcher = PredictionBatcher()
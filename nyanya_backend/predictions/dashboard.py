@@ -0,0 +1,543 @@
+"""
+Dashboard Payloads
+
+Builds the sections the Streamlit dashboard shows. Each section's
+endpoint serves one of them; /api/predictions/dashboard/ serves any set
+of them in one response, computed from shared query results:
+
+- one query for the latest MarketData weeks, sliced by every section
+  that looks at them (chart, status, market insights, business
+  insights, tips)
+- one aggregate over the prediction rollup for the cards and the tips
+- one prediction pass scoring the current week and the simulation weeks
+  together
+"""
+
+from datetime import datetime, timedelta
+
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .batching import batcher
+from .models import PredictionRollup
+from market_data.models import MarketData
+
+
+# In the order the dashboard lays them out
+SECTIONS = (
+    'cards', 'current', 'chart', 'simulation', 'status',
+    'market_insights', 'business_insights', 'tips',
+)
+
+# Most recent weeks any section looks at (market insights)
+RECENT_WEEKS = 20
+
+
+def build(sections=SECTIONS, start=1, end=20, year=2025):
+    """
+    Payloads of the requested sections.
+    
+    Args:
+        sections (iterable): Names from SECTIONS
+        start, end, year: Simulation range, as for the simulate endpoint
+    
+    Returns:
+        tuple: ({section: payload}, {section: error message}) - a failing
+            section is reported without failing the others
+    """
+    
+    sections = set(sections)
+    payloads = {}
+    errors = {}
+    
+    recent = recent_market_data() if sections & {'chart', 'status', 'market_insights', 'business_insights', 'tips'} else []
+    counts = rollup_counts() if sections & {'cards', 'tips'} else {}
+    
+    # One prediction pass for the current week and the simulation
+    scenarios = []
+    if 'current' in sections:
+        week, current = current_week_scenario()
+        scenarios.append(current)
+    if 'simulation' in sections:
+        market_data, simulated = simulation_scenarios(start, end, year)
+        scenarios.extend(simulated)
+    results = score(scenarios)
+    if 'current' in sections:
+        if results[0] is None:
+            errors['current'] = 'Prediction failed'
+        else:
+            payloads['current'] = current_week(week, results[0])
+        results = results[1:]
+    if 'simulation' in sections:
+        payloads['simulation'] = simulation(market_data, results)
+    
+    builders = {
+        'cards': lambda: cards(counts),
+        'chart': lambda: chart(recent),
+        'status': lambda: status(recent),
+        'market_insights': lambda: market_insights(recent),
+        'business_insights': lambda: business_insights(recent),
+        'tips': lambda: tips(recent, counts),
+    }
+    for section, builder in builders.items():
+        if section in sections:
+            payloads[section] = builder()
+    
+    return {section: payloads[section] for section in SECTIONS if section in payloads}, errors
+
+
+def recent_market_data(limit=RECENT_WEEKS):
+    """The latest weeks of market data, newest first"""
+    
+    return list(MarketData.objects.order_by('-year', '-week')[:limit])
+
+
+def rollup_counts():
+    """
+    Prediction counts for the cards and the tips, in one query over the
+    per-day rollup, whose size grows with days, not with predictions.
+    Windows are whole days, today included.
+    """
+    
+    today = timezone.localdate()
+    week_ago = today - timedelta(days=7)
+    two_weeks_ago = today - timedelta(days=14)
+    month_ago = today - timedelta(days=30)
+    two_months_ago = today - timedelta(days=60)
+    
+    return PredictionRollup.objects.aggregate(
+        total=Coalesce(Sum('count'), 0),
+        this_week=Coalesce(Sum('count', filter=Q(day__gt=week_ago)), 0),
+        prev_week=Coalesce(Sum('count', filter=Q(day__gt=two_weeks_ago, day__lte=week_ago)), 0),
+        high_demand=Coalesce(Sum('count', filter=Q(predicted_demand='High')), 0),
+        last_month=Coalesce(Sum('count', filter=Q(day__gt=month_ago)), 0),
+        prev_month=Coalesce(Sum('count', filter=Q(day__gt=two_months_ago, day__lte=month_ago)), 0),
+        week_high=Coalesce(Sum('count', filter=Q(day__gt=week_ago, predicted_demand='High')), 0),
+        week_confidence_sum=Coalesce(Sum('confidence_sum', filter=Q(day__gt=week_ago)), 0.0),
+    )
+
+
+def score(scenarios):
+    """
+    Score scenarios in one forest pass; fall back to row by row so a
+    single bad row is skipped (None) instead of failing them all
+    """
+    
+    if not scenarios:
+        return []
+    
+    try:
+        return batcher.predict_batch(scenarios)
+    except Exception:
+        results = []
+        for scenario in scenarios:
+            try:
+                results.append(batcher.predict(**scenario))
+            except Exception:
+                results.append(None)
+        return results
+
+
+def cards(counts):
+    """Data for the 4 dashboard metric cards"""
+    
+    total_predictions = counts['total']
+    weekly_predictions = counts['this_week']
+    prev_weekly = counts['prev_week']
+    
+    weekly_change = "+0%" if prev_weekly == 0 else f"{((weekly_predictions - prev_weekly) / prev_weekly * 100):+.0f}%"
+    
+    # Use actual model accuracy (95% based on training/testing)
+    # avg_confidence represents prediction confidence, not model accuracy
+    model_accuracy = 95  # Your actual model accuracy from training/validation
+    
+    high_demand_count = counts['high_demand']
+    
+    # Calculate real total change (last 30 days vs previous 30)
+    last_month = counts['last_month']
+    prev_month = counts['prev_month']
+    
+    total_change = "+0%" if prev_month == 0 else f"{((last_month - prev_month) / prev_month * 100):+.0f}%"
+    
+    return {
+        'total_predictions': {
+            'value': f"{total_predictions:,}",
+            'change': total_change,
+            'trend': 'up' if '+' in total_change else 'down',
+            'label': 'TOTAL PREDICTIONS'
+        },
+        'weekly_predictions': {
+            'value': f"{weekly_predictions:,}",
+            'change': weekly_change,
+            'trend': 'up' if '+' in weekly_change else 'down',
+            'label': 'THIS WEEK'
+        },
+        'model_performance': {
+            'value': f"{model_accuracy}%",
+            'change': '+2.6%',  # Keep this mock as we don't track historical performance
+            'trend': 'up',
+            'label': 'ACCURACY'
+        },
+        'high_demand_weeks': {
+            'value': f"{high_demand_count:,}",
+            'change': '+5.8%',  # Keep this mock for now
+            'trend': 'up',
+            'label': 'HIGH DEMAND'
+        }
+    }
+
+
+def current_week_scenario():
+    """(week, scenario) of the current week's default conditions"""
+    
+    now = datetime.now()
+    current_week = now.isocalendar()[1]
+    
+    return current_week, {
+        'rainfall_mm': 75.0,
+        'temperature_c': 23.0,
+        'market_day': True,
+        'school_open': True,
+        'disease_alert': 'Absence',
+        'last_week_demand': 'Medium',
+        'week': current_week,
+        'month': now.strftime('%B')
+    }
+
+
+def current_week(week, result):
+    """Current week's tomato demand prediction"""
+    
+    prediction, confidence = result
+    colors = {'High': 'red', 'Medium': 'orange', 'Low': 'green'}
+    
+    return {
+        'week': week,
+        'predicted_demand': prediction,
+        'confidence': round(confidence, 2),
+        'status_color': colors[prediction],
+        'confidence_percentage': f"{int(confidence * 100)}%"
+    }
+
+
+def simulation_scenarios(start_week, end_week, year):
+    """(market data rows, scenarios) for the simulated weeks"""
+    
+    market_data = list(MarketData.objects.filter(
+        year=year,
+        week__gte=start_week,
+        week__lte=end_week
+    ).order_by('week'))
+    
+    scenarios = [
+        {
+            'rainfall_mm': week_data.rainfall_mm,
+            'temperature_c': week_data.temperature_c,
+            'market_day': week_data.market_day,
+            'school_open': week_data.school_open,
+            'disease_alert': week_data.disease_alert,
+            'last_week_demand': week_data.last_week_demand,
+            'week': week_data.week,
+            'month': week_data.month
+        }
+        for week_data in market_data
+    ]
+    return market_data, scenarios
+
+
+def simulation(market_data, results):
+    """Interactive simulation data for week-by-week playback"""
+    
+    simulation_frames = []
+    
+    for week_data, result in zip(market_data, results):
+        if result is None:
+            continue
+        
+        prediction, confidence = result
+        simulation_frames.append({
+            'week': week_data.week,
+            'month': week_data.month,
+            'predicted_demand': prediction,
+            'actual_demand': week_data.market_demand,
+            'confidence': round(confidence, 2),
+            'match': prediction == week_data.market_demand
+        })
+    
+    return {
+        'frames': simulation_frames,
+        'total_frames': len(simulation_frames),
+        'play_speed': 500
+    }
+
+
+def chart(recent):
+    """Historical data for dashboard charts"""
+    
+    recent_data = recent[:12]
+    
+    chart_points = []
+    demand_counts = {'High': 0, 'Medium': 0, 'Low': 0}
+    
+    for data in reversed(recent_data):
+        chart_points.append({
+            'week': f"W{data.week}",
+            'demand_level': data.market_demand,
+            'demand_value': {'High': 3, 'Medium': 2, 'Low': 1}[data.market_demand],
+            'rainfall': data.rainfall_mm,
+            'temperature': data.temperature_c
+        })
+        demand_counts[data.market_demand] += 1
+    
+    return {
+        'trend_data': chart_points,
+        'demand_distribution': demand_counts,
+        'total_weeks': len(chart_points)
+    }
+
+
+def status(recent):
+    """Real data for health and weather status cards"""
+    
+    if not recent:
+        return {
+            'weather': {'status': 'No data', 'details': 'Weather data unavailable'},
+            'health': {'status': 'No data', 'details': 'Health data unavailable'}
+        }
+    
+    latest_data = recent[0]
+    
+    # Weather status based on real data
+    temp = float(latest_data.temperature_c)
+    rainfall = float(latest_data.rainfall_mm)
+    
+    if temp > 30:
+        weather_status = "Hot"
+        weather_color = "#ef4444"
+    elif temp < 15:
+        weather_status = "Cold"
+        weather_color = "#3b82f6"
+    else:
+        weather_status = "Moderate"
+        weather_color = "#10b981"
+    
+    weather_details = f"{temp}°C, {rainfall}mm rain"
+    
+    # Health status based on disease alert
+    disease_status = latest_data.disease_alert
+    if disease_status == 'Presence':
+        health_status = "Disease Alert"
+        health_color = "#ef4444"
+        health_details = "Disease detected in area"
+    else:
+        health_status = "Healthy"
+        health_color = "#10b981"
+        health_details = "No disease reported"
+    
+    return {
+        'weather': {
+            'status': weather_status,
+            'details': weather_details,
+            'color': weather_color,
+            'temperature': temp,
+            'rainfall': rainfall
+        },
+        'health': {
+            'status': health_status,
+            'details': health_details,
+            'color': health_color,
+            'disease_alert': disease_status
+        }
+    }
+
+
+def market_insights(recent):
+    """Small donut chart for Market Insights card"""
+    
+    # Get demand distribution from recent data
+    demand_counts = {'High': 0, 'Medium': 0, 'Low': 0}
+    
+    for data in recent[:20]:
+        demand_counts[data.market_demand] += 1
+    
+    total = sum(demand_counts.values())
+    if total == 0:
+        # Fallback data
+        demand_counts = {'High': 30, 'Medium': 50, 'Low': 20}
+        total = 100
+    
+    percentages = {k: round((v/total)*100) for k, v in demand_counts.items()}
+    
+    return {
+        'chart_type': 'donut',
+        'title': 'Demand Distribution',
+        'data': [
+            {'label': 'High Demand', 'value': percentages['High'], 'color': '#ef4444'},
+            {'label': 'Medium Demand', 'value': percentages['Medium'], 'color': '#f59e0b'},
+            {'label': 'Low Demand', 'value': percentages['Low'], 'color': '#10b981'}
+        ],
+        'center_text': f"{percentages['High']}%",
+        'center_label': 'High Demand'
+    }
+
+
+def business_insights(recent):
+    """Data for Business Insights card"""
+    
+    # Calculate profit potential based on demand levels
+    recent_data = recent[:12]
+    
+    if not recent_data:
+        return {
+            'current_profit_potential': 'Medium',
+            'weekly_revenue_estimate': '450,000',
+            'best_selling_days': 'Tuesday, Friday',
+            'market_trend': 'Stable',
+            'insights': [
+                'High demand expected next week',
+                'Market day sales up 15%',
+                'Weather conditions favorable'
+            ]
+        }
+    
+    high_demand_weeks = len([d for d in recent_data if d.market_demand == 'High'])
+    market_days = len([d for d in recent_data if d.market_day])
+    
+    # Calculate profit potential
+    if high_demand_weeks >= 4:
+        profit_potential = 'High'
+        revenue_estimate = '650,000'
+    elif high_demand_weeks >= 2:
+        profit_potential = 'Medium'
+        revenue_estimate = '450,000'
+    else:
+        profit_potential = 'Low'
+        revenue_estimate = '280,000'
+    
+    # Market trend
+    latest_3 = recent_data[:3]
+    high_recent = len([d for d in latest_3 if d.market_demand == 'High'])
+    if high_recent >= 2:
+        trend = 'Growing'
+    elif high_recent == 1:
+        trend = 'Stable'
+    else:
+        trend = 'Declining'
+    
+    return {
+        'current_profit_potential': profit_potential,
+        'weekly_revenue_estimate': revenue_estimate,
+        'best_selling_days': 'Tuesday, Friday' if market_days > 6 else 'Friday, Saturday',
+        'market_trend': trend,
+        'insights': [
+            f'{high_demand_weeks} high-demand weeks recorded',
+            f'Market days show {market_days}/12 activity',
+            f'Trend is {trend.lower()} this month'
+        ]
+    }
+
+
+def tips(recent, counts):
+    """Smart agricultural tips based on real market data and conditions"""
+    
+    # Get latest market data for contextual tips
+    latest_data = recent[0] if recent else None
+    
+    # Analyze recent market trends: the last 7 days of the prediction rollup
+    total = counts['this_week']
+    # High-demand share of recent predictions, out of 10
+    high_demand_weeks = round(10 * counts['week_high'] / total) if total else 0
+    avg_confidence = counts['week_confidence_sum'] / total if total else 0.5
+    
+    # Base tips that are always relevant
+    base_tips = [
+        {
+            'icon': '💡',
+            'text': 'Plant tomatoes during dry season for better yields',
+            'priority': 'high'
+        },
+        {
+            'icon': '🌱',
+            'text': 'Use organic fertilizers to improve soil health',
+            'priority': 'medium'
+        }
+    ]
+    
+    # Contextual tips based on data
+    contextual_tips = []
+    
+    if latest_data:
+        # Temperature-based tips
+        if hasattr(latest_data, 'temperature_c') and latest_data.temperature_c:
+            if float(latest_data.temperature_c) > 25:
+                contextual_tips.append({
+                    'icon': '🌡️',
+                    'text': f'High temperature ({latest_data.temperature_c}°C) - increase irrigation frequency',
+                    'priority': 'high'
+                })
+            elif float(latest_data.temperature_c) < 20:
+                contextual_tips.append({
+                    'icon': '❄️',
+                    'text': 'Cool weather detected - protect young plants from cold',
+                    'priority': 'medium'
+                })
+        
+        # Rainfall-based tips
+        if hasattr(latest_data, 'rainfall_mm') and latest_data.rainfall_mm:
+            if float(latest_data.rainfall_mm) > 100:
+                contextual_tips.append({
+                    'icon': '🌧️',
+                    'text': 'Heavy rainfall detected - ensure proper drainage',
+                    'priority': 'high'
+                })
+            elif float(latest_data.rainfall_mm) < 20:
+                contextual_tips.append({
+                    'icon': '💧',
+                    'text': 'Low rainfall - implement water conservation techniques',
+                    'priority': 'high'
+                })
+        
+        # Disease-based tips
+        if hasattr(latest_data, 'disease_alert') and latest_data.disease_alert == 'Presence':
+            contextual_tips.append({
+                'icon': '🦠',
+                'text': 'Disease alert active - apply preventive treatments immediately',
+                'priority': 'critical'
+            })
+    
+    # Market-based tips
+    if high_demand_weeks >= 3:
+        contextual_tips.append({
+            'icon': '📈',
+            'text': f'High demand trend ({high_demand_weeks}/10 recent predictions) - consider expanding production',
+            'priority': 'high'
+        })
+    elif high_demand_weeks <= 1:
+        contextual_tips.append({
+            'icon': '📉',
+            'text': 'Low demand period - focus on quality over quantity',
+            'priority': 'medium'
+        })
+    
+    # Confidence-based tips
+    if avg_confidence > 0.8:
+        contextual_tips.append({
+            'icon': '🎯',
+            'text': f'High prediction confidence ({int(avg_confidence*100)}%) - good time for planning',
+            'priority': 'medium'
+        })
+    
+    # Combine and prioritize tips
+    all_tips = base_tips + contextual_tips
+    
+    # Sort by priority (critical > high > medium > low)
+    priority_order = {'critical': 0, 'high': 1, 'medium': 2, 'low': 3}
+    sorted_tips = sorted(all_tips, key=lambda x: priority_order.get(x['priority'], 3))
+    
+    # Return top 4 most relevant tips
+    return {
+        'tips': sorted_tips[:4],
+        'last_updated': datetime.now().isoformat(),
+        'data_source': 'real_time_analysis'
+    }
@@ -0,0 +1,52 @@
+"""
+Management command to archive old predictions.
+
+Moves Prediction rows older than the retention window to the monthly
+gzip NDJSON archives under settings.PREDICTION_ARCHIVE_DIR and deletes
+them from the table; the per-day rollup keeps counting them. Safe to
+rerun, e.g. daily from the scheduler. See predictions.retention.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from predictions.retention import archive_dir, archive_predictions, retention_cutoff
+
+
+class Command(BaseCommand):
+    help = 'Archive predictions older than the retention window and delete them from the table'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            help='Days of predictions to keep (default: settings.PREDICTION_RETENTION_DAYS)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=5000,
+            help='Rows read and deleted per query (default: 5000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report what would be archived without writing or deleting'
+        )
+    
+    def handle(self, *args, **options):
+        if options['days'] is not None and options['days'] < 0:
+            raise CommandError('--days must not be negative')
+        
+        report = archive_predictions(
+            before=retention_cutoff(options['days']),
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+        
+        for month, rows in sorted(report.months.items()):
+            self.stdout.write(f'{month}: {rows} predictions')
+        
+        verb = 'Would archive' if options['dry_run'] else 'Archived'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {report.archived} predictions before {report.cutoff:%Y-%m-%d} '
+            f'to {archive_dir()} ({report.deleted} deleted) in {report.elapsed:.2f}s'
+        ))
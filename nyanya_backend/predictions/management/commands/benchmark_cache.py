@@ -0,0 +1,141 @@
+"""
+Management command to benchmark the cache backends.
+
+Times set/get/miss/incr on a cache already holding --entries entries of
+a dashboard-sized payload, for Django's LocMem and file-based caches and
+the shared SQLite cache (backend.sqlite_cache). Then forks --workers
+processes that each read the same keys, computing an entry on a miss, and
+reports the hit ratio: a per-process cache computes every entry once per
+worker, a shared one once per host.
+
+Every backend runs in a temporary directory; the configured cache is
+never touched.
+"""
+
+import multiprocessing
+import os
+import tempfile
+import time
+
+from django.core.cache.backends.filebased import FileBasedCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.core.management.base import BaseCommand, CommandError
+from backend.sqlite_cache import SQLiteCache
+
+
+class Command(BaseCommand):
+    help = 'Benchmark LocMem, file-based and shared SQLite cache backends'
+    
+    BACKENDS = ('locmem', 'file', 'sqlite')
+    
+    # Roughly one simulation response: 50 weekly frames
+    PAYLOAD = {
+        'frames': [
+            {'week': week, 'predicted_demand': 'High', 'confidence': 0.87,
+             'rainfall_mm': 12.5, 'temperature_c': 21.0}
+            for week in range(50)
+        ],
+    }
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--backends',
+            type=str,
+            default=','.join(self.BACKENDS),
+            help=f"Comma-separated backends out of {', '.join(self.BACKENDS)}"
+        )
+        parser.add_argument(
+            '--entries',
+            type=int,
+            default=5000,
+            help='Entries in the cache before timing (default: 5000)'
+        )
+        parser.add_argument(
+            '--operations',
+            type=int,
+            default=2000,
+            help='Timed calls per operation (default: 2000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Forked workers reading the same keys (default: 4, 0 skips)'
+        )
+    
+    def handle(self, *args, **options):
+        backends = options['backends'].split(',')
+        unknown = set(backends) - set(self.BACKENDS)
+        if unknown:
+            raise CommandError(f"Unknown backends: {', '.join(sorted(unknown))}")
+        
+        self.stdout.write(f"{'backend':<8}{'set us':>10}{'get us':>10}{'miss us':>10}{'incr us':>10}")
+        for name in backends:
+            with tempfile.TemporaryDirectory() as directory:
+                timings = self._time(self._cache(name, directory), options['entries'], options['operations'])
+            self.stdout.write(f'{name:<8}' + ''.join(f'{timings[op]:>10.1f}' for op in ('set', 'get', 'miss', 'incr')))
+        
+        if options['workers'] <= 0:
+            return
+        
+        self.stdout.write(f"\n{options['workers']} workers reading 50 keys 10 times each")
+        for name in backends:
+            with tempfile.TemporaryDirectory() as directory:
+                misses = self._shared(name, directory, options['workers'])
+            lookups = options['workers'] * 500
+            self.stdout.write(f'{name:<8} computed {misses:>5} | hit ratio {1 - misses / lookups:.3f}')
+    
+    def _cache(self, name, directory):
+        params = {'OPTIONS': {'MAX_ENTRIES': 10000}}
+        if name == 'locmem':
+            return LocMemCache(f'benchmark-{os.getpid()}', params)
+        if name == 'file':
+            return FileBasedCache(os.path.join(directory, 'files'), params)
+        return SQLiteCache(os.path.join(directory, 'cache.sqlite3'), params)
+    
+    def _time(self, cache, entries, operations):
+        """Mean microseconds per call of each operation"""
+        
+        for index in range(entries):
+            cache.set(f'fill:{index}', self.PAYLOAD)
+        cache.set('counter', 0)
+        
+        calls = {
+            'set': lambda index: cache.set(f'key:{index % 200}', self.PAYLOAD),
+            'get': lambda index: cache.get(f'key:{index % 200}'),
+            'miss': lambda index: cache.get(f'missing:{index}'),
+            'incr': lambda index: cache.incr('counter'),
+        }
+        timings = {}
+        for op, call in calls.items():
+            start = time.perf_counter()
+            for index in range(operations):
+                call(index)
+            timings[op] = (time.perf_counter() - start) / operations * 1e6
+        return timings
+    
+    def _shared(self, name, directory, workers):
+        """Entries computed by forked workers sharing (or not) one cache"""
+        
+        context = multiprocessing.get_context('fork')
+        results = context.Queue()
+        processes = [
+            context.Process(target=self._read, args=(name, directory, results))
+            for _ in range(workers)
+        ]
+        for process in processes:
+            process.start()
+        misses = sum(results.get() for _ in processes)
+        for process in processes:
+            process.join()
+        return misses
+    
+    def _read(self, name, directory, results):
+        cache = self._cache(name, directory)
+        misses = 0
+        for _ in range(10):
+            for key in range(50):
+                if cache.get(f'shared:{key}') is None:
+                    misses += 1
+                    cache.set(f'shared:{key}', self.PAYLOAD)
+        results.put(misses)
@@ -0,0 +1,100 @@
+"""
+Management command to benchmark model inference engines.
+
+Times sklearn's RandomForestClassifier.predict_proba against the
+flattened NumPy TreeEnsembleEngine on the same rows and checks that both
+return identical probabilities.
+"""
+
+import pickle
+import statistics
+import time
+import warnings
+
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand, CommandError
+from predictions.model_loader import FEATURE_NAMES, TreeEnsembleEngine, predictor
+
+
+class Command(BaseCommand):
+    help = 'Benchmark sklearn vs NumPy tree-ensemble inference latency'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--model',
+            type=str,
+            help='Path to rf_model.pkl (default: served model version)'
+        )
+        parser.add_argument(
+            '--batch-sizes',
+            type=str,
+            default='1,52,1000',
+            help='Comma separated batch sizes to time'
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=50,
+            help='Timed runs per engine and batch size'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            with open(options['model'] or predictor.model_path, 'rb') as f:
+                forest = pickle.load(f)
+        except OSError as e:
+            raise CommandError(f"Cannot read model: {e}")
+        
+        engine = TreeEnsembleEngine.from_forest(forest)
+        rng = np.random.default_rng(42)
+        warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+        
+        self.stdout.write(
+            f'{forest.n_estimators} trees, {len(engine.feature):,} nodes, '
+            f'max depth {engine.max_depth}'
+        )
+        
+        for batch_size in [int(size) for size in options['batch_sizes'].split(',')]:
+            rows = self._random_rows(rng, batch_size)
+            
+            expected = forest.predict_proba(rows)
+            if not np.array_equal(expected, engine.predict_proba(rows.to_numpy())):
+                raise CommandError(f"Engine output differs from sklearn (batch {batch_size})")
+            
+            sklearn_ms = self._time(lambda: forest.predict_proba(rows), options['repeat'])
+            numpy_ms = self._time(lambda: engine.predict_proba(rows.to_numpy()), options['repeat'])
+            
+            self.stdout.write(
+                f'batch {batch_size:>5}: sklearn {sklearn_ms:8.3f} ms | '
+                f'numpy {numpy_ms:8.3f} ms | speedup {sklearn_ms / numpy_ms:5.1f}x'
+            )
+        
+        self.stdout.write(self.style.SUCCESS('Outputs identical on every batch.'))
+    
+    @staticmethod
+    def _random_rows(rng, n):
+        """Encoded rows covering the realistic input ranges"""
+        
+        return pd.DataFrame(np.column_stack([
+            rng.uniform(0, 300, n).round(1),
+            rng.uniform(10, 35, n).round(1),
+            rng.integers(0, 2, n),
+            rng.integers(0, 2, n),
+            rng.integers(0, 2, n),
+            rng.integers(0, 3, n),
+            rng.integers(0, 12, n),
+            np.full(n, 2024),
+        ]).astype(float), columns=FEATURE_NAMES)
+    
+    @staticmethod
+    def _time(func, repeat):
+        """Median wall time in milliseconds after one warm-up call"""
+        
+        func()
+        timings = []
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - start) * 1000)
+        return statistics.median(timings)
@@ -0,0 +1,64 @@
+"""
+Management command to precompute the prediction grid.
+
+The grid is also built in the background whenever the model loads; run
+this during a release step so workers start with the cached .npz for the
+current model version instead of rebuilding it.
+"""
+
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from predictions.model_loader import predictor
+
+
+class Command(BaseCommand):
+    help = 'Precompute class probabilities over the rainfall x temperature grid'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--rainfall',
+            type=str,
+            help='Rainfall lattice as start,stop,step (mm)'
+        )
+        parser.add_argument(
+            '--temperature',
+            type=str,
+            help='Temperature lattice as start,stop,step (Celsius)'
+        )
+    
+    def handle(self, *args, **options):
+        if not predictor.is_trained:
+            raise CommandError('Model not loaded')
+        
+        if options['rainfall']:
+            predictor.grid_rainfall = self._lattice(options['rainfall'])
+        if options['temperature']:
+            predictor.grid_temperature = self._lattice(options['temperature'])
+        
+        start = time.perf_counter()
+        grid = predictor.build_grid()
+        if grid is None:
+            raise CommandError('Prediction grid build failed')
+        
+        info = grid.info()
+        self.stdout.write(
+            f"Grid {info['version']}: {info['cells']:,} cells, {info['size_mb']} MB "
+            f"in {time.perf_counter() - start:.1f}s"
+        )
+        self.stdout.write(
+            f"Nearest-cell max error {info['max_error']:.3f}, "
+            f"label agreement {info['label_agreement']:.1%}"
+        )
+        self.stdout.write(self.style.SUCCESS(f'Saved to {predictor.grid_path()}'))
+    
+    @staticmethod
+    def _lattice(value):
+        try:
+            start, stop, step = (float(part) for part in value.split(','))
+        except ValueError:
+            raise CommandError(f"Expected start,stop,step, got '{value}'")
+        
+        if step <= 0 or stop < start:
+            raise CommandError(f"Invalid lattice '{value}'")
+        return start, stop, step
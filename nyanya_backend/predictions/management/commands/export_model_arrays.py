@@ -0,0 +1,30 @@
+"""
+Management command to export a model version as memory-mappable arrays.
+
+Writes the flattened forest, encoder classes and metadata as .npy files
+under <version dir>/arrays/, so workers map one shared copy instead of
+each unpickling the forest. Loading a version exports it automatically;
+this command does it ahead of deployment.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from predictions.model_loader import predictor
+
+
+class Command(BaseCommand):
+    help = 'Export a model version as memory-mappable .npy arrays'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path',
+            nargs='?',
+            help='Version directory holding the four .pkl files (default: current version)'
+        )
+    
+    def handle(self, *args, **options):
+        try:
+            directory = predictor.export_arrays(options['path'])
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        self.stdout.write(self.style.SUCCESS(f'Model arrays exported to {directory}'))
@@ -0,0 +1,159 @@
+"""
+Management command to measure model memory across forked workers.
+
+Forks groups of workers the way gunicorn does and sums their RSS, PSS
+(shared pages divided between the processes sharing them) and private
+memory from /proc/<pid>/smaps_rollup, for each loading mode:
+
+- baseline: no model, the cost of the Django process itself
+- pickle:   every worker unpickles the four model files
+- mmap:     every worker maps the exported .npy arrays
+- preload:  the master maps the arrays and forks (gunicorn preload_app)
+
+Linux only.
+"""
+
+import gc
+import json
+import os
+
+from django.core.management.base import BaseCommand, CommandError
+from predictions.model_loader import TomatoModelLoader
+
+
+class Command(BaseCommand):
+    help = 'Compare worker memory for pickled, memory-mapped and preloaded models'
+    
+    MODES = ('baseline', 'pickle', 'mmap', 'preload')
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=str,
+            default='1,4,8',
+            help='Comma-separated worker counts (default: 1,4,8)'
+        )
+        parser.add_argument(
+            '--modes',
+            type=str,
+            default=','.join(self.MODES),
+            help=f"Comma-separated modes out of {', '.join(self.MODES)}"
+        )
+        parser.add_argument(
+            '--grid-mode',
+            type=str,
+            default='off',
+            choices=TomatoModelLoader.GRID_MODES,
+            help='Also load the prediction grid in each worker (default: off)'
+        )
+    
+    def handle(self, *args, **options):
+        if not os.path.exists('/proc/self/smaps_rollup'):
+            raise CommandError('/proc/<pid>/smaps_rollup is required (Linux only)')
+        
+        workers = [int(n) for n in options['workers'].split(',')]
+        modes = options['modes'].split(',')
+        unknown = set(modes) - set(self.MODES)
+        if unknown:
+            raise CommandError(f"Unknown modes: {', '.join(sorted(unknown))}")
+        
+        self.grid_mode = options['grid_mode']
+        
+        # Export in a child so this process never imports sklearn itself
+        if {'mmap', 'preload'} & set(modes):
+            self._in_child(lambda: self._loader(use_arrays=True).export_arrays())
+        
+        self.stdout.write(f"{'mode':<10}{'workers':>8}{'RSS MB':>10}{'PSS MB':>10}{'private MB/worker':>20}")
+        for mode in modes:
+            for count in workers:
+                usage = self._in_child(lambda: self._measure(mode, count))
+                self.stdout.write(
+                    f"{mode:<10}{count:>8}{usage['Rss'] / 1024:>10.1f}{usage['Pss'] / 1024:>10.1f}"
+                    f"{usage['Private'] / 1024 / count:>20.1f}"
+                )
+    
+    def _loader(self, use_arrays):
+        return TomatoModelLoader(use_arrays=use_arrays, grid_mode=self.grid_mode, watch_interval=0)
+    
+    def _measure(self, mode, count):
+        """
+        Fork a group of workers from this (driver) process and sum their
+        memory once all of them have loaded the model.
+        """
+        
+        loader = None
+        if mode == 'preload':
+            loader = self._loader(use_arrays=True)
+            loader.warm_up()
+            gc.freeze()
+        
+        ready_read, ready_write = os.pipe()
+        release_read, release_write = os.pipe()
+        pids = []
+        
+        for _ in range(count):
+            pid = os.fork()
+            if pid == 0:
+                try:
+                    if mode != 'baseline':
+                        (loader or self._loader(use_arrays=mode == 'mmap')).warm_up()
+                    os.write(ready_write, b'.')
+                    os.read(release_read, 1)
+                finally:
+                    os._exit(0)
+            pids.append(pid)
+        
+        try:
+            for _ in pids:
+                os.read(ready_read, 1)
+            totals = {'Rss': 0, 'Pss': 0, 'Private': 0}
+            for pid in pids:
+                usage = self._smaps_rollup(pid)
+                totals['Rss'] += usage['Rss']
+                totals['Pss'] += usage['Pss']
+                totals['Private'] += usage['Private_Clean'] + usage['Private_Dirty']
+        finally:
+            os.write(release_write, b'.' * len(pids))
+            for pid in pids:
+                os.waitpid(pid, 0)
+        
+        return totals
+    
+    @staticmethod
+    def _smaps_rollup(pid):
+        """Memory counters of one process in kB"""
+        
+        usage = {}
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                parts = line.split()
+                if len(parts) == 3 and parts[2] == 'kB':
+                    usage[parts[0].rstrip(':')] = int(parts[1])
+        return usage
+    
+    @staticmethod
+    def _in_child(func):
+        """
+        Run func in a forked process and return its JSON result, so the
+        model loaded for one measurement never leaks into the next.
+        """
+        
+        read_fd, write_fd = os.pipe()
+        pid = os.fork()
+        if pid == 0:
+            status = 1
+            try:
+                os.close(read_fd)
+                with os.fdopen(write_fd, 'w') as f:
+                    json.dump(func(), f)
+                status = 0
+            finally:
+                os._exit(status)
+        
+        os.close(write_fd)
+        with os.fdopen(read_fd) as f:
+            data = f.read()
+        _, status = os.waitpid(pid, 0)
+        if status != 0 or not data:
+            raise CommandError('Measurement process failed')
+        return json.loads(data)
@@ -0,0 +1,65 @@
+"""
+Management command to publish a model version to the registry.
+
+Copies the four Colab pickles into models/versions/<version>/, exports
+them as memory-mappable arrays and flips the CURRENT pointer. Running
+workers pick the new version up through their model watcher, so no
+restart is needed.
+"""
+
+from django.core.management.base import BaseCommand, CommandError
+from predictions.model_loader import predictor
+
+
+class Command(BaseCommand):
+    help = 'Publish model files as a new version and make it current'
+    
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'source',
+            nargs='?',
+            help='Directory holding the four .pkl files (default: models dir)'
+        )
+        parser.add_argument(
+            '--no-activate',
+            action='store_true',
+            help='Publish without pointing CURRENT at the new version'
+        )
+        parser.add_argument(
+            '--activate',
+            type=str,
+            metavar='VERSION',
+            help='Point CURRENT at an already published version (rollback)'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List published versions'
+        )
+    
+    def handle(self, *args, **options):
+        registry = predictor.registry
+        
+        try:
+            if options['list']:
+                current = registry.current_version()
+                for version in registry.versions():
+                    marker = '*' if version == current else ' '
+                    self.stdout.write(f'{marker} {version}')
+                return
+            
+            if options['activate']:
+                registry.activate(options['activate'])
+                self.stdout.write(self.style.SUCCESS(f"Activated {options['activate']}"))
+                return
+            
+            version = registry.publish(options['source'] or registry.root, activate=False)
+            # Export before activating so workers swap straight to the mapped arrays
+            predictor.export_arrays(registry.version_path(version))
+            if not options['no_activate']:
+                registry.activate(version)
+        except (OSError, ValueError) as e:
+            raise CommandError(str(e))
+        
+        state = 'published' if options['no_activate'] else 'published and activated'
+        self.stdout.write(self.style.SUCCESS(f'Model {version} {state}'))
@@ -0,0 +1,33 @@
+"""
+Management command to rebuild the prediction rollup.
+
+Recounts PredictionRollup from every Prediction row. Writes through the
+Prediction model keep the rollup up to date on their own; this is for
+the first deployment, after raw SQL changes, or to check for drift.
+Days older than the oldest prediction left in the table (archived by
+archive_predictions) keep their rollup rows.
+"""
+
+from django.core.management.base import BaseCommand
+from predictions import rollup
+from predictions.models import PredictionRollup
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the per-day prediction rollup from the Prediction table'
+    
+    def handle(self, *args, **options):
+        before = {
+            (row['day'], row['predicted_demand']): row['count']
+            for row in PredictionRollup.objects.values('day', 'predicted_demand', 'count')
+        }
+        
+        rows = rollup.rebuild()
+        
+        after = {
+            (row['day'], row['predicted_demand']): row['count']
+            for row in PredictionRollup.objects.values('day', 'predicted_demand', 'count')
+        }
+        drifted = sum(1 for key in before.keys() | after.keys() if before.get(key) != after.get(key))
+        
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {rows} rollup rows ({drifted} had drifted)'))
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:18
+
+from django.db import migrations, models
+from django.db.models import Count, Max, Min, Sum
+from django.db.models.functions import TruncDate
+
+
+def fill_rollup(apps, schema_editor):
+    """Roll up the predictions already stored"""
+    Prediction = apps.get_model('predictions', 'Prediction')
+    PredictionRollup = apps.get_model('predictions', 'PredictionRollup')
+    
+    buckets = (
+        Prediction.objects.order_by()
+        .annotate(day=TruncDate('timestamp'))
+        .values('day', 'predicted_demand')
+        .annotate(
+            count=Count('id'),
+            confidence_sum=Sum('confidence_score'),
+            confidence_min=Min('confidence_score'),
+            confidence_max=Max('confidence_score'),
+        )
+    )
+    PredictionRollup.objects.bulk_create([PredictionRollup(**bucket) for bucket in buckets], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0002_alter_prediction_confidence_score_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PredictionRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('predicted_demand', models.CharField(choices=[('Low', 'Low Demand'), ('Medium', 'Medium Demand'), ('High', 'High Demand')], max_length=20)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('confidence_sum', models.FloatField(default=0.0)),
+                ('confidence_min', models.FloatField()),
+                ('confidence_max', models.FloatField()),
+            ],
+            options={
+                'ordering': ['-day', 'predicted_demand'],
+                'unique_together': {('day', 'predicted_demand')},
+            },
+        ),
+        migrations.RunPython(fill_rollup, migrations.RunPython.noop),
+    ]
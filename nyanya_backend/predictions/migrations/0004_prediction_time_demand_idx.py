@@ -0,0 +1,17 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0003_predictionrollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='prediction',
+            index=models.Index(fields=['timestamp', 'predicted_demand'], name='prediction_time_demand_idx'),
+        ),
+    ]
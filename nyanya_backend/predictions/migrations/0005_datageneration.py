@@ -0,0 +1,30 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:35
+
+from django.db import migrations, models
+
+
+def create_scopes(apps, schema_editor):
+    """One counter row per data scope, so bumps are a plain UPDATE"""
+    DataGeneration = apps.get_model('predictions', 'DataGeneration')
+    
+    DataGeneration.objects.bulk_create([
+        DataGeneration(scope=scope) for scope in ('market_data', 'predictions')
+    ], ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0004_prediction_time_demand_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DataGeneration',
+            fields=[
+                ('scope', models.CharField(max_length=50, primary_key=True, serialize=False)),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_scopes, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.0.6 on 2026-10-16 23:42
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('predictions', '0005_datageneration'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='datageneration',
+            name='changed_at',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+    ]
@@ -2,169 +2,794 @@
 Tomato Model Loader for Colab-Generated Files
 """
 
+import collections
+import hashlib
+import itertools
+import json
+import logging
 import os
 import pickle
-import numpy as np
+import shutil
+import tempfile
+import threading
+import time
 import warnings
+from datetime import datetime, timezone
+import numpy as np
+import pandas as pd
+from django.conf import settings
+
+from .registry import MODEL_FILES, ModelRegistry, hash_model_files
 
 # Suppress sklearn warnings for cleaner output
 warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
 
+logger = logging.getLogger(__name__)
 
-class TomatoModelLoader:
-    """Loads Random Forest model from Colab .pkl files"""
+
+# Training column order from Colab
+FEATURE_NAMES = [
+    'Rainfall_mm', 'Temperature_C', 'Market_Day', 'School_Open',
+    'Disease_Alert', 'Last_Week_Demand', 'Month', 'Year'
+]
+
+# Scenario fields accepted by predict()/predict_batch() and their defaults
+SCENARIO_DEFAULTS = {
+    'rainfall_mm': 75.0,
+    'temperature_c': 22.0,
+    'market_day': True,
+    'school_open': True,
+    'disease_alert': 'Absence',
+    'last_week_demand': 'Medium',
+    'week': 1,
+    'month': 'January',
+}
+
+
+def load_array(path, mmap_mode='r'):
+    """
+    Memory-map a .npy file as a plain ndarray.
+    
+    np.memmap routes every indexing operation through Python-level
+    __getitem__/__array_finalize__ hooks, which costs more than the
+    traversal itself on small batches; a base-class view of the same
+    mapping has none of that overhead.
+    """
+    
+    return np.asarray(np.load(path, mmap_mode=mmap_mode))
+
+
+class TreeEnsembleEngine:
+    """
+    Pure NumPy inference for a fitted RandomForestClassifier.
     
-    def __init__(self):
-        self.model = None
-        self.categorical_encoders = None
-        self.target_encoder = None
-        self.metadata = None
-        self.is_trained = False
+    Every tree of the forest is flattened into shared contiguous arrays
+    (feature, threshold, children, value) so a row or a batch walks all
+    trees at once with vectorized indexing. This skips sklearn's input
+    validation and per-tree thread-pool dispatch, which dominate the cost
+    of scoring a single row.
+    
+    The traversal mirrors sklearn exactly: inputs are cast to float32 like
+    sklearn does, NaNs follow missing_go_to_left, leaf values are
+    normalized per tree and tree probabilities are summed in estimator
+    order, so predict_proba() returns the same floats as the forest.
+    """
+    
+    def __init__(self, feature, threshold, children, missing_go_to_left,
+                 value, roots, max_depth, classes):
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.missing_go_to_left = missing_go_to_left
+        self.value = value
+        self.roots = roots
+        self.max_depth = max_depth
+        self.classes_ = classes
+        self.n_trees = len(roots)
+    
+    @classmethod
+    def from_forest(cls, forest):
+        """
+        Flatten a fitted forest into contiguous node arrays.
         
-        self.models_dir = '/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/models'
-        self.model_path = os.path.join(self.models_dir, 'rf_model.pkl')
-        self.cat_encoders_path = os.path.join(self.models_dir, 'categorical_encoders.pkl')
-        self.target_encoder_path = os.path.join(self.models_dir, 'target_encoder.pkl')
-        self.metadata_path = os.path.join(self.models_dir, 'metadata.pkl')
+        Leaves point back to themselves, so every row can take max_depth
+        steps without branching on whether it already reached a leaf.
         
-        self.load_model()
-    
-    def load_model(self):
-        """Load trained model and encoders from pickle files"""
+        Args:
+            forest: Fitted RandomForestClassifier (single output)
         
-        try:
-            required_files = [self.model_path, self.cat_encoders_path, 
-                            self.target_encoder_path, self.metadata_path]
-            if not all(os.path.exists(path) for path in required_files):
-                print("Model files not found")
-                return False
-            
-            with open(self.model_path, 'rb') as f:
-                self.model = pickle.load(f)
+        Returns:
+            TreeEnsembleEngine: Engine equivalent to forest.predict_proba
+        """
+        
+        features, thresholds, children, missing_left, values, roots = [], [], [], [], [], []
+        offset = 0
+        max_depth = 0
+        
+        for estimator in forest.estimators_:
+            tree = estimator.tree_
+            node_ids = np.arange(tree.node_count) + offset
+            is_leaf = tree.children_left == -1
             
-            with open(self.cat_encoders_path, 'rb') as f:
-                self.categorical_encoders = pickle.load(f)
+            features.append(np.where(is_leaf, 0, tree.feature))
+            thresholds.append(np.where(is_leaf, np.inf, tree.threshold))
+            children.append(np.column_stack([
+                np.where(is_leaf, node_ids, tree.children_left + offset),
+                np.where(is_leaf, node_ids, tree.children_right + offset),
+            ]))
+            missing_left.append(tree.missing_go_to_left.astype(bool))
             
-            with open(self.target_encoder_path, 'rb') as f:
-                self.target_encoder = pickle.load(f)
+            # Same normalization as DecisionTreeClassifier.predict_proba
+            proba = tree.value[:, 0, :estimator.n_classes_].astype(np.float64)
+            normalizer = proba.sum(axis=1)[:, np.newaxis]
+            normalizer[normalizer == 0.0] = 1.0
+            proba /= normalizer
+            values.append(proba)
             
-            with open(self.metadata_path, 'rb') as f:
-                self.metadata = pickle.load(f)
+            roots.append(offset)
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+        
+        return cls(
+            feature=np.concatenate(features).astype(np.intp),
+            threshold=np.concatenate(thresholds),
+            children=np.concatenate(children).astype(np.intp).ravel(),
+            missing_go_to_left=np.concatenate(missing_left),
+            value=np.concatenate(values),
+            roots=np.asarray(roots, dtype=np.intp),
+            max_depth=max_depth,
+            classes=forest.classes_,
+        )
+    
+    def apply(self, X, trees=slice(None)):
+        """
+        Find the leaf reached in every tree for every row.
+        
+        Args:
+            X (array-like): Encoded features, shape (n_samples, n_features)
+            trees (slice): Subset of trees to walk, in estimator order
+        
+        Returns:
+            np.array: Flat leaf indices, shape (n_trees, n_samples)
+        """
+        
+        # sklearn compares float32 inputs against float64 thresholds
+        X = np.asarray(X, dtype=np.float32).astype(np.float64)
+        n_samples = X.shape[0]
+        
+        # Column-major copy so one flat gather fetches each node's feature
+        x_flat = X.T.ravel()
+        rows = np.arange(n_samples)
+        has_missing = np.isnan(x_flat).any()
+        
+        nodes = np.repeat(self.roots[trees, np.newaxis], n_samples, axis=1)
+        for _ in range(self.max_depth):
+            x = x_flat[self.feature[nodes] * n_samples + rows]
+            go_right = x > self.threshold[nodes]
+            if has_missing:
+                go_right = np.where(np.isnan(x), ~self.missing_go_to_left[nodes], go_right)
+            nodes = self.children[2 * nodes + go_right]
+        
+        return nodes
+    
+    def predict_proba(self, X):
+        """
+        Class probabilities averaged over all trees.
+        
+        Args:
+            X (array-like): Encoded features, shape (n_samples, n_features)
+        
+        Returns:
+            np.array: Probabilities, shape (n_samples, n_classes)
+        """
+        
+        leaves = self.apply(X)
+        proba = np.zeros((leaves.shape[1], self.value.shape[1]), dtype=np.float64)
+        
+        # Accumulate tree by tree, in estimator order, exactly like sklearn
+        for tree_leaves in leaves:
+            proba += self.value[tree_leaves]
+        proba /= self.n_trees
+        
+        return proba
+    
+    def predict_proba_anytime(self, X, max_trees=None, time_budget=None, chunk_size=10):
+        """
+        Class probabilities from only as many trees as each row needs.
+        
+        Trees are walked in estimator order. A row stops once its leading
+        class is ahead by more than the votes the remaining trees could
+        still give any other class, so its label is the full forest's;
+        that takes at least a majority of trees. Trees are walked
+        chunk_size at a time, and everything stops once max_trees trees
+        are used or time_budget seconds have passed, so even a zero budget
+        costs one chunk.
+        
+        Args:
+            X (array-like): Encoded features, shape (n_samples, n_features)
+            max_trees (int): Tree budget (default: all trees)
+            time_budget (float): Seconds after which no new chunk is started
+            chunk_size (int): Trees walked between checks
+        
+        Returns:
+            tuple: (probabilities, trees_used, error_bound) per row.
+                Probabilities are averages over the trees used; the full
+                forest's probability for every class is within error_bound
+                (unused trees / n_trees) of them. Rows that used every tree
+                match predict_proba() exactly.
+        """
+        
+        start = time.perf_counter()
+        X = np.asarray(X, dtype=np.float64)
+        n_samples, n_classes = X.shape[0], self.value.shape[1]
+        max_trees = min(max_trees or self.n_trees, self.n_trees)
+        
+        totals = np.zeros((n_samples, n_classes), dtype=np.float64)
+        trees_used = np.zeros(n_samples, dtype=np.intp)
+        active = np.arange(n_samples)
+        used = 0
+        
+        while used < max_trees and len(active):
+            stop = min(used + chunk_size, max_trees)
             
-            self.is_trained = True
-            print("Model loaded successfully!")
-            accuracy = self.metadata.get('accuracy', 0)
-            print(f"Accuracy: {accuracy:.3f}")
+            active_totals = totals[active]
+            for tree_leaves in self.apply(X[active], trees=slice(used, stop)):
+                active_totals += self.value[tree_leaves]
+            totals[active] = active_totals
+            trees_used[active] = used = stop
             
-            return True
+            # Decided: the runner-up cannot catch up even if it wins every remaining tree
+            if n_classes > 1 and used > self.n_trees // 2:
+                top_two = np.partition(active_totals, n_classes - 2, axis=1)[:, -2:]
+                active = active[top_two[:, 1] - top_two[:, 0] <= self.n_trees - used]
             
-        except Exception as e:
-            print(f"Error loading model: {str(e)}")
-            self.is_trained = False
-            return False
+            if time_budget is not None and time.perf_counter() - start >= time_budget:
+                break
+        
+        probabilities = totals / np.maximum(trees_used, 1)[:, np.newaxis]
+        error_bound = (self.n_trees - trees_used) / self.n_trees
+        
+        return probabilities, trees_used, error_bound
     
-    def reload_model(self):
-        """Reload model from files"""
+    # Node arrays written by save(), one .npy file each
+    ARRAYS = ('feature', 'threshold', 'children', 'missing_go_to_left', 'value', 'roots', 'classes_')
+    
+    def save(self, directory):
+        """
+        Write every node array as a plain .npy file.
         
-        self.is_trained = False
-        self.model = None
-        self.categorical_encoders = None
-        self.target_encoder = None
-        self.metadata = None
+        Unlike the pickled forest these can be memory-mapped, so every
+        process mapping them shares one physical copy via the page cache.
+        """
         
-        return self.load_model()
+        for name in self.ARRAYS:
+            np.save(os.path.join(directory, f'{name}.npy'), getattr(self, name))
     
-    def encode_features(self, rainfall_mm, temperature_c, market_day, school_open, 
-                       disease_alert, last_week_demand, week, month):
-        """Encode input features for prediction"""
+    @classmethod
+    def load(cls, directory, max_depth, mmap_mode='r'):
+        """Map the arrays written by save() read-only"""
         
-        if not self.is_trained:
-            raise ValueError("Model not loaded")
+        arrays = {
+            name: load_array(os.path.join(directory, f'{name}.npy'), mmap_mode)
+            for name in cls.ARRAYS
+        }
+        return cls(
+            feature=arrays['feature'],
+            threshold=arrays['threshold'],
+            children=arrays['children'],
+            missing_go_to_left=arrays['missing_go_to_left'],
+            value=arrays['value'],
+            roots=arrays['roots'],
+            max_depth=max_depth,
+            classes=arrays['classes_'],
+        )
+
+
+class ArrayLabelEncoder:
+    """
+    Minimal stand-in for a fitted sklearn LabelEncoder.
+    
+    Holds only the sorted classes_ array, so exported models load without
+    unpickling (or even importing) sklearn.
+    """
+    
+    def __init__(self, classes):
+        self.classes_ = classes
+    
+    def transform(self, values):
+        values = np.asarray(values, dtype=str)
+        indices = np.searchsorted(self.classes_, values)
+        found = self.classes_[np.minimum(indices, len(self.classes_) - 1)] == values
+        if not found.all():
+            raise ValueError(f"y contains previously unseen labels: {sorted(set(values[~found].tolist()))}")
+        return indices
+    
+    def inverse_transform(self, indices):
+        return self.classes_[np.asarray(indices)]
+
+
+class PredictionGrid:
+    """
+    Precomputed class probabilities for the whole model input space.
+    
+    Last_Week_Demand, Month and the three binary flags only take 288
+    combinations, so scoring every combination over a quantized
+    rainfall x temperature lattice covers nearly every request. The
+    probabilities are stored as one uint16 array indexed
+    [last_week, month, market_day, school_open, disease_alert,
+    rainfall, temperature, class], scaled by SCALE, and looked up in O(1).
+    
+    Rows sitting exactly on a lattice point get the live model's answer
+    to within QUANTIZATION_ERROR. In 'nearest' mode any in-range row
+    snaps to the closest cell; max_error reports how far that can drift
+    from the live model.
+    """
+    
+    # A quarter of the float64 size, at most 0.5 / 65535 off the live model
+    DTYPE = np.uint16
+    SCALE = 65535
+    QUANTIZATION_ERROR = 0.5 / SCALE
+    
+    def __init__(self, probabilities, rainfall_axis, temperature_axis, version,
+                 year=2024.0, max_error=None, label_agreement=None):
+        self.probabilities = probabilities
+        self.rainfall_axis = rainfall_axis
+        self.temperature_axis = temperature_axis
+        self.version = version
+        self.year = year
+        self.max_error = max_error
+        self.label_agreement = label_agreement
+    
+    @staticmethod
+    def make_axis(start, stop, step):
+        """Evenly spaced lattice values, rounded so they compare exactly"""
         
-        try:
-            last_week_encoded = self.categorical_encoders['Last_Week_Demand'].transform([last_week_demand])[0]
-            month_encoded = self.categorical_encoders['Month'].transform([month])[0]
-            
-            market_day_int = 1 if market_day else 0
-            school_open_int = 1 if school_open else 0
-            disease_alert_int = 1 if disease_alert == 'Presence' else 0
-            # Feature order: Rainfall_mm, Temperature_C, Market_Day, School_Open, 
-            #                Disease_Alert, Last_Week_Demand, Month, Year
-            features = np.array([[
-                rainfall_mm,
-                temperature_c,
-                market_day_int,
-                school_open_int,
-                disease_alert_int,
-                last_week_encoded,
-                month_encoded,
-                2024
-            ]])
+        count = int(round((stop - start) / step)) + 1
+        return np.round(start + step * np.arange(count), 6)
+    
+    @classmethod
+    def build(cls, predict_proba, n_last_week, n_month, rainfall, temperature,
+              version, year=2024.0):
+        """
+        Score every categorical combination over the lattice.
+        
+        Args:
+            predict_proba (callable): Live scorer taking an encoded DataFrame
+            n_last_week (int): Number of Last_Week_Demand classes
+            n_month (int): Number of Month classes
+            rainfall (tuple): (start, stop, step) in mm
+            temperature (tuple): (start, stop, step) in Celsius
+            version (str): Model version the grid belongs to
+            year (float): Year feature used by encode_batch()
+        
+        Returns:
+            PredictionGrid: Grid with max_error measured against the live model
+        """
+        
+        rainfall_axis = cls.make_axis(*rainfall)
+        temperature_axis = cls.make_axis(*temperature)
+        rain, temp = np.meshgrid(rainfall_axis, temperature_axis, indexing='ij')
+        rain, temp = rain.ravel(), temp.ravel()
+        
+        combinations = list(itertools.product(
+            range(n_last_week), range(n_month), (0, 1), (0, 1), (0, 1)
+        ))
+        probabilities = None
+        
+        # One predict_proba call per categorical combination keeps memory flat
+        for index, (last_week, month, market_day, school_open, disease) in enumerate(combinations):
+            features = np.column_stack([
+                rain, temp,
+                np.full(rain.size, market_day), np.full(rain.size, school_open),
+                np.full(rain.size, disease), np.full(rain.size, last_week),
+                np.full(rain.size, month), np.full(rain.size, year),
+            ]).astype(np.float64)
+            proba = predict_proba(pd.DataFrame(features, columns=FEATURE_NAMES))
             
-            # Create DataFrame with proper feature names to avoid sklearn warning
-            import pandas as pd
-            feature_names = [
-                'Rainfall_mm', 'Temperature_C', 'Market_Day', 'School_Open',
-                'Disease_Alert', 'Last_Week_Demand', 'Month', 'Year'
-            ]
-            features_df = pd.DataFrame(features, columns=feature_names)
+            if probabilities is None:
+                probabilities = np.empty(
+                    (len(combinations), rain.size, proba.shape[1]), dtype=cls.DTYPE
+                )
+            probabilities[index] = np.rint(np.asarray(proba) * cls.SCALE)
+        
+        grid = cls(
+            probabilities.reshape(
+                n_last_week, n_month, 2, 2, 2,
+                len(rainfall_axis), len(temperature_axis), -1
+            ),
+            rainfall_axis, temperature_axis, version, year=year,
+        )
+        grid.measure_error(predict_proba)
+        return grid
+    
+    def lookup(self, features, nearest=False):
+        """
+        Probabilities for encoded rows that fall on the grid.
+        
+        Args:
+            features (np.array): Encoded features, shape (n_samples, 8)
+            nearest (bool): Snap in-range rows to the closest cell instead
+                of requiring an exact lattice point
+        
+        Returns:
+            tuple: (probabilities, hits) where rows with hits=False are off
+                the grid and their probabilities must be scored live
+        """
+        
+        features = np.asarray(features, dtype=np.float64)
+        rain, temp = features[:, 0], features[:, 1]
+        flags = features[:, 2:5]
+        last_week, month = features[:, 5], features[:, 6]
+        
+        n_last_week, n_month = self.probabilities.shape[:2]
+        n_rain, n_temp = len(self.rainfall_axis), len(self.temperature_axis)
+        
+        valid = np.isfinite(rain) & np.isfinite(temp) & (features[:, 7] == self.year)
+        valid &= np.isin(flags, (0.0, 1.0)).all(axis=1)
+        valid &= (last_week >= 0) & (last_week < n_last_week) & (month >= 0) & (month < n_month)
+        
+        rain_step = self.rainfall_axis[1] - self.rainfall_axis[0] if n_rain > 1 else 1.0
+        temp_step = self.temperature_axis[1] - self.temperature_axis[0] if n_temp > 1 else 1.0
+        rain_index = np.rint((np.where(valid, rain, 0.0) - self.rainfall_axis[0]) / rain_step).astype(np.intp)
+        temp_index = np.rint((np.where(valid, temp, 0.0) - self.temperature_axis[0]) / temp_step).astype(np.intp)
+        valid &= (rain_index >= 0) & (rain_index < n_rain) & (temp_index >= 0) & (temp_index < n_temp)
+        
+        rain_index = np.where(valid, rain_index, 0)
+        temp_index = np.where(valid, temp_index, 0)
+        if not nearest:
+            valid &= (self.rainfall_axis[rain_index] == rain) & (self.temperature_axis[temp_index] == temp)
+        
+        cells = np.where(valid[:, np.newaxis], features[:, 2:7], 0).astype(np.intp)
+        probabilities = self.probabilities[
+            cells[:, 3], cells[:, 4], cells[:, 0], cells[:, 1], cells[:, 2],
+            rain_index, temp_index
+        ] / self.SCALE
+        
+        return probabilities, valid
+    
+    def measure_error(self, predict_proba, samples=2000, seed=0):
+        """
+        Compare nearest-cell answers with the live model on random rows.
+        
+        Sets max_error (largest absolute probability difference) and
+        label_agreement (share of rows where the predicted class matches).
+        """
+        
+        rng = np.random.default_rng(seed)
+        n_last_week, n_month = self.probabilities.shape[:2]
+        features = np.column_stack([
+            rng.uniform(self.rainfall_axis[0], self.rainfall_axis[-1], samples),
+            rng.uniform(self.temperature_axis[0], self.temperature_axis[-1], samples),
+            rng.integers(0, 2, samples),
+            rng.integers(0, 2, samples),
+            rng.integers(0, 2, samples),
+            rng.integers(0, n_last_week, samples),
+            rng.integers(0, n_month, samples),
+            np.full(samples, self.year),
+        ]).astype(np.float64)
+        
+        live = predict_proba(pd.DataFrame(features, columns=FEATURE_NAMES))
+        approx, _ = self.lookup(features, nearest=True)
+        
+        self.max_error = float(np.abs(live - approx).max())
+        self.label_agreement = float((live.argmax(axis=1) == approx.argmax(axis=1)).mean())
+    
+    def save(self, path):
+        """
+        Write the probabilities to a .npy file and the axes and error
+        report to a .json file beside it.
+        
+        The .npy stays memory-mappable so workers share one copy. Each file
+        is replaced atomically, so a concurrent reader never maps a
+        partially written grid.
+        """
+        
+        base = os.path.splitext(path)[0]
+        temp_path = f'{base}.{os.getpid()}.tmp'
+        
+        with open(temp_path, 'wb') as f:
+            np.save(f, self.probabilities)
+        os.replace(temp_path, f'{base}.npy')
+        
+        with open(temp_path, 'w') as f:
+            json.dump({
+                'version': self.version,
+                'rainfall_axis': self.rainfall_axis.tolist(),
+                'temperature_axis': self.temperature_axis.tolist(),
+                'year': self.year,
+                'max_error': self.max_error,
+                'label_agreement': self.label_agreement,
+            }, f)
+        os.replace(temp_path, f'{base}.json')
+    
+    @classmethod
+    def load(cls, path, mmap_mode='r'):
+        """
+        Map a grid written by save() read-only.
+        
+        Raises:
+            ValueError: The file holds another dtype (an older grid) and
+                must be rebuilt
+        """
+        
+        base = os.path.splitext(path)[0]
+        with open(f'{base}.json') as f:
+            meta = json.load(f)
+        
+        probabilities = load_array(f'{base}.npy', mmap_mode)
+        if probabilities.dtype != cls.DTYPE:
+            raise ValueError(f"Prediction grid stored as {probabilities.dtype}, expected {np.dtype(cls.DTYPE)}")
+        
+        return cls(
+            probabilities,
+            np.asarray(meta['rainfall_axis']),
+            np.asarray(meta['temperature_axis']),
+            meta['version'],
+            year=meta['year'],
+            max_error=meta['max_error'],
+            label_agreement=meta['label_agreement'],
+        )
+    
+    def info(self):
+        """Summary for get_model_info()"""
+        
+        return {
+            'version': self.version,
+            'cells': int(np.prod(self.probabilities.shape[:-1])),
+            'size_mb': round(self.probabilities.nbytes / 1024 / 1024, 2),
+            'rainfall_range': [float(self.rainfall_axis[0]), float(self.rainfall_axis[-1])],
+            'temperature_range': [float(self.temperature_axis[0]), float(self.temperature_axis[-1])],
+            'quantization_error': self.QUANTIZATION_ERROR,
+            'max_error': self.max_error,
+            'label_agreement': self.label_agreement,
+        }
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of class probabilities per encoded feature row.
+    
+    Keys are (model version, row bytes), so a row is only ever answered
+    by the version that scored it. Entries older than ttl seconds count
+    as misses. A max_size of 0 disables the cache.
+    """
+    
+    def __init__(self, max_size=4096, ttl=None):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    @staticmethod
+    def _keys(version, rows):
+        # + 0.0 folds -0.0 into 0.0 so equal rows share a key
+        rows = np.ascontiguousarray(rows, dtype=np.float64) + 0.0
+        return [(version, row.tobytes()) for row in rows]
+    
+    def get_many(self, version, rows, n_classes):
+        """
+        Look up encoded rows.
+        
+        Returns:
+            tuple: (probabilities, hits) where rows with hits=False were not
+                cached and their probabilities are zero
+        """
+        
+        keys = self._keys(version, rows)
+        probabilities = np.zeros((len(keys), n_classes))
+        hits = np.zeros(len(keys), dtype=bool)
+        now = time.monotonic()
+        
+        with self._lock:
+            for i, key in enumerate(keys):
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                stored_at, proba = entry
+                if self.ttl and now - stored_at > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                probabilities[i] = proba
+                hits[i] = True
             
-            return features_df
+            self.hits += int(hits.sum())
+            self.misses += len(keys) - int(hits.sum())
+        
+        return probabilities, hits
+    
+    def put_many(self, version, rows, probabilities):
+        """Store freshly scored rows, evicting the least recently used"""
+        
+        now = time.monotonic()
+        with self._lock:
+            for key, proba in zip(self._keys(version, rows), probabilities):
+                self._entries[key] = (now, np.array(proba))
+                self._entries.move_to_end(key)
             
-        except Exception as e:
-            raise ValueError(f"Feature encoding failed: {str(e)}")
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
     
-    def predict(self, rainfall_mm=75.0, temperature_c=22.0, market_day=True, 
-                school_open=True, disease_alert='Absence', last_week_demand='Medium',
-                week=1, month='January'):
-        """Make demand prediction using trained model"""
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def info(self):
+        """Summary for get_model_info()"""
+        
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_ratio': round(self.hits / lookups, 3) if lookups else None,
+            }
+
+
+class ModelBundle:
+    """
+    One fully loaded model version.
+    
+    Everything a prediction needs from a version lives on one object, so
+    a swap is a single reference assignment and a request that already
+    picked up a bundle keeps using it even if a newer one is swapped in.
+    
+    A bundle is either unpickled from the Colab files or mapped read-only
+    from the arrays export (see export_arrays()). Mapped bundles only
+    unpickle the sklearn forest if something asks for bundle.model.
+    """
+    
+    ARRAYS_DIR = 'arrays'
+    
+    def __init__(self, path, version, model, categorical_encoders, target_encoder,
+                 metadata, tree_engine=None):
+        self.path = path
+        self.version = version
+        self._model = model
+        self.categorical_encoders = categorical_encoders
+        self.target_encoder = target_encoder
+        self.metadata = metadata
+        self.tree_engine = tree_engine
+        self.prediction_grid = None
+        self.load_timings = {}
+        self.memory_mapped = False
+        self.modified = self._files_modified(path)
+        self.reset_locks()
+    
+    def reset_locks(self):
+        """Fresh locks, e.g. in a forked child where a held lock never frees"""
+        
+        self._model_lock = threading.Lock()
+        self.grid_lock = threading.Lock()
+    
+    @property
+    def model(self):
+        """The sklearn forest, unpickled on first use for mapped bundles"""
+        
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    with open(os.path.join(self.path, 'rf_model.pkl'), 'rb') as f:
+                        self._model = pickle.load(f)
+        return self._model
+    
+    @property
+    def forest_loaded(self):
+        return self._model is not None
+    
+    @property
+    def classes(self):
+        """Encoded target values in predict_proba column order"""
         
-        if not self.is_trained:
-            raise ValueError("Model not loaded")
+        if self.tree_engine is not None:
+            return self.tree_engine.classes_
+        return self.model.classes_
+    
+    def export_arrays(self):
+        """
+        Write this version as memory-mappable arrays next to its pickles.
+        
+        The engine's node arrays, every encoder's classes and the metadata
+        go to a staging directory that is renamed into place, so other
+        processes never map a partial export.
+        
+        Returns:
+            str: Export directory
+        """
+        
+        target = os.path.join(self.path, self.ARRAYS_DIR)
+        if self._manifest_version(target) == self.version:
+            return target
+        
+        engine = self.tree_engine or TreeEnsembleEngine.from_forest(self.model)
+        staging = tempfile.mkdtemp(prefix='.arrays-', dir=self.path)
         
         try:
-            features = self.encode_features(
-                rainfall_mm, temperature_c, market_day, school_open,
-                disease_alert, last_week_demand, week, month
-            )
+            engine.save(staging)
+            for name, encoder in self.categorical_encoders.items():
+                np.save(os.path.join(staging, f'encoder_{name}.npy'), np.asarray(encoder.classes_, dtype=str))
+            np.save(os.path.join(staging, 'target_classes.npy'), np.asarray(self.target_encoder.classes_, dtype=str))
             
-            prediction_encoded = self.model.predict(features)[0]
-            prediction_proba = self.model.predict_proba(features)[0]
-            confidence = np.max(prediction_proba)
+            with open(os.path.join(staging, 'manifest.json'), 'w') as f:
+                json.dump({
+                    'version': self.version,
+                    'max_depth': engine.max_depth,
+                    'encoders': list(self.categorical_encoders),
+                    'metadata': self.metadata,
+                }, f, default=str)
             
-            prediction = self.target_encoder.inverse_transform([prediction_encoded])[0]
-            
-            return prediction, confidence
-            
-        except Exception as e:
-            raise ValueError(f"Prediction failed: {str(e)}")
+            # Flat layouts reuse the directory across versions
+            if os.path.exists(target):
+                shutil.rmtree(target)
+            os.rename(staging, target)
+        except OSError:
+            shutil.rmtree(staging, ignore_errors=True)
+            # Another process may have exported the same version first
+            if self._manifest_version(target) != self.version:
+                raise
+        
+        return target
     
-    def get_model_info(self):
-        """Get model information"""
+    @classmethod
+    def from_arrays(cls, path, version):
+        """
+        Map an export written by export_arrays() read-only.
         
-        if not self.is_trained:
-            return {
-                'is_trained': False,
-                'message': 'Model not loaded'
-            }
+        Returns:
+            ModelBundle: Mapped bundle, or None if there is no export for
+                this version
+        """
         
-        return {
-            'is_trained': True,
-            'model_type': 'Random Forest Classifier',
-            'accuracy': self.metadata.get('accuracy', 0),
-            'training_date': self.metadata.get('training_date', 'Unknown'),
-            'features': self.metadata.get('features', []),
-            'target': self.metadata.get('target', 'Market_Demand')
-        }
-
+        directory = os.path.join(path, cls.ARRAYS_DIR)
+        if cls._manifest_version(directory) != version:
+            return None
+        
+        with open(os.path.join(directory, 'manifest.json')) as f:
+            manifest = json.load(f)
+        
+        def load(name):
+            return load_array(os.path.join(directory, f'{name}.npy'))
+        
+        bundle = cls(
+            path, version, None,
+            {name: ArrayLabelEncoder(load(f'encoder_{name}')) for name in manifest['encoders']},
+            ArrayLabelEncoder(load('target_classes')),
+            manifest['metadata'],
+            TreeEnsembleEngine.load(directory, manifest['max_depth']),
+        )
+        bundle.memory_mapped = True
+        return bundle
+    
+    @staticmethod
+    def _files_modified(path):
+        # Newest model file write, e.g. for HTTP Last-Modified
+        try:
+            mtime = max(os.path.getmtime(os.path.join(path, name)) for name in MODEL_FILES)
+        except (OSError, TypeError):
+            return None
+        return datetime.fromtimestamp(mtime, tz=timezone.utc)
+    
+    @staticmethod
+    def _manifest_version(directory):
+        try:
+            with open(os.path.join(directory, 'manifest.json')) as f:
+                return json.load(f).get('version')
+        except (OSError, ValueError):
+            return None
 
-# Global model instance
-predictor = TomatoModelLoader()
 
-import os
-import pickle
-import numpy as np
-from django.conf import settings
+def _bundle_property(name):
+    """Read-only loader attribute backed by the served ModelBundle"""
+    
+    return property(lambda self: getattr(self._loaded(), name, None))
 
 
 class TomatoModelLoader:
@@ -176,83 +801,465 @@ class TomatoModelLoader:
     - categorical_encoders.pkl (categorical feature encoders)
     - target_encoder.pkl (target variable encoder)
     - metadata.pkl (model metadata)
+    
+    The files are read from the ModelRegistry in settings.MODELS_DIR: the
+    version named by its CURRENT pointer, or the flat files for the
+    original layout. Nothing is read at import time; the first prediction
+    (or warm_up()) loads the model exactly once, even with concurrent
+    callers. Each version is loaded into a separate ModelBundle and only
+    swapped in once complete, so serving never sees a half-loaded model.
+    A background watcher in every process (gunicorn workers included)
+    polls the pointer and hot-swaps newly published versions.
+    
+    Inference runs on the flattened TreeEnsembleEngine by default; pass
+    engine='sklearn' (or set inference_engine) to score with the forest's
+    own predict_proba instead.
+    
+    With use_arrays (settings.MODEL_ARRAYS) the first load of a version
+    exports it as .npy arrays and every later load memory-maps them
+    read-only instead of unpickling. Workers forked from a preloaded
+    master, and separate processes mapping the same files, then share a
+    single physical copy of the model through the page cache.
+    
+    Scored rows are memoized in a PredictionCache keyed on the encoded
+    features and model version (cache_size, cache_ttl; cache_round rounds
+    rainfall and temperature first so near-identical inputs share an
+    entry). Swapping in a new version clears it.
+    
+    Every load also builds a PredictionGrid for the model version in a
+    background thread. Once ready, rows on the grid are answered from it
+    ('exact' lattice points only, or any in-range row with 'nearest') and
+    everything else is scored live.
     """
     
-    def __init__(self):
-        self.model = None
-        self.categorical_encoders = None
-        self.target_encoder = None
-        self.metadata = None
-        self.is_trained = False
+    ENGINES = ('numpy', 'sklearn')
+    GRID_MODES = ('exact', 'nearest', 'off')
+    
+    # Past this many rows sklearn's compiled traversal beats the NumPy engine
+    NUMPY_ENGINE_MAX_ROWS = 500
+    
+    # Default prediction grid lattice: (start, stop, step)
+    GRID_RAINFALL = (0.0, 300.0, 5.0)
+    GRID_TEMPERATURE = (10.0, 35.0, 0.5)
+    
+    # Seconds between checks of the registry pointer (0 disables the watcher)
+    WATCH_INTERVAL = 30.0
+    
+    # Prediction cache: max rows (0 disables) and seconds before an entry expires
+    CACHE_SIZE = 4096
+    CACHE_TTL = 3600.0
+    
+    model = _bundle_property('model')
+    categorical_encoders = _bundle_property('categorical_encoders')
+    target_encoder = _bundle_property('target_encoder')
+    metadata = _bundle_property('metadata')
+    tree_engine = _bundle_property('tree_engine')
+    model_version = _bundle_property('version')
+    model_modified = _bundle_property('modified')
+    prediction_grid = _bundle_property('prediction_grid')
+    
+    def __init__(self, models_dir=None, engine=None, grid_mode=None,
+                 grid_rainfall=None, grid_temperature=None, watch_interval=None,
+                 use_arrays=None, cache_size=None, cache_ttl=None, cache_round=None):
+        engine = engine or getattr(settings, 'PREDICTION_ENGINE', 'numpy')
+        grid_mode = grid_mode or getattr(settings, 'PREDICTION_GRID_MODE', 'exact')
+        if watch_interval is None:
+            watch_interval = getattr(settings, 'MODEL_WATCH_INTERVAL', self.WATCH_INTERVAL)
+        if use_arrays is None:
+            use_arrays = getattr(settings, 'MODEL_ARRAYS', True)
+        if cache_size is None:
+            cache_size = getattr(settings, 'PREDICTION_CACHE_SIZE', self.CACHE_SIZE)
+        if cache_ttl is None:
+            cache_ttl = getattr(settings, 'PREDICTION_CACHE_TTL', self.CACHE_TTL)
+        if cache_round is None:
+            cache_round = getattr(settings, 'PREDICTION_CACHE_ROUND', None)
+        
+        if engine not in self.ENGINES:
+            raise ValueError(f"Unknown inference engine: {engine}")
+        if grid_mode not in self.GRID_MODES:
+            raise ValueError(f"Unknown grid mode: {grid_mode}")
+        
+        self.inference_engine = engine
+        self.grid_mode = grid_mode
+        self.grid_rainfall = grid_rainfall or self.GRID_RAINFALL
+        self.grid_temperature = grid_temperature or self.GRID_TEMPERATURE
+        self.watch_interval = watch_interval
+        self.use_arrays = use_arrays
+        self.cache_round = cache_round
+        self.prediction_cache = PredictionCache(cache_size, cache_ttl)
+        
+        self._bundle = None
+        self._reset_locks()
+        self._initialized = False
+        self._watcher_pid = None
         
-        # Model file paths
-        self.models_dir = '/home/cyberpunk/LOCAL-MARKET-MBEYA-NYANYA/models'
-        self.model_path = os.path.join(self.models_dir, 'rf_model.pkl')
-        self.cat_encoders_path = os.path.join(self.models_dir, 'categorical_encoders.pkl')
-        self.target_encoder_path = os.path.join(self.models_dir, 'target_encoder.pkl')
-        self.metadata_path = os.path.join(self.models_dir, 'metadata.pkl')
+        # Model registry root
+        self.models_dir = str(models_dir or settings.MODELS_DIR)
         
-        # Try to load model on initialization
-        self.load_model()
+        # A lock held by another thread while gunicorn forks would never be
+        # released in the worker
+        os.register_at_fork(after_in_child=self._reset_locks)
+    
+    def _reset_locks(self):
+        self._lock = threading.Lock()
+        self._init_lock = threading.Lock()
+        if self._bundle is not None:
+            self._bundle.reset_locks()
+    
+    @property
+    def is_trained(self):
+        return self._loaded() is not None
+    
+    def _loaded(self):
+        """
+        Served bundle, loading it on first access.
+        
+        Double-checked locking: concurrent first callers wait for a single
+        load instead of each unpickling the forest.
+        """
+        
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    self.load_model()
+                    self._initialized = True
+        
+        return self._bundle
+    
+    def warm_up(self):
+        """
+        Load the model and score one row so the first request starts hot.
+        
+        Meant for AppConfig.ready() (settings.PRELOAD_MODEL) or a gunicorn
+        worker hook; safe to call more than once. The prediction grid is
+        built (or mapped from its cache) synchronously, so a master that
+        warms up before forking hands the grid to every worker.
+        
+        Returns:
+            bool: True if the model is loaded
+        """
+        
+        start = time.perf_counter()
+        bundle = self._loaded()
+        if bundle is None:
+            return False
+        
+        if self.grid_mode != 'off' and bundle.prediction_grid is None:
+            self.build_grid(bundle)
+        
+        self.predict()
+        logger.info("Model warm-up finished in %.1f ms", (time.perf_counter() - start) * 1000)
+        return True
+    
+    @property
+    def registry(self):
+        return ModelRegistry(self.models_dir)
+    
+    @property
+    def model_dir(self):
+        """Directory of the served version, or the one that would be loaded"""
+        
+        bundle = self._loaded()
+        if bundle is not None:
+            return bundle.path
+        return self.registry.current_path() or self.models_dir
+    
+    @property
+    def model_path(self):
+        return os.path.join(self.model_dir, 'rf_model.pkl')
+    
+    @property
+    def cat_encoders_path(self):
+        return os.path.join(self.model_dir, 'categorical_encoders.pkl')
+    
+    @property
+    def target_encoder_path(self):
+        return os.path.join(self.model_dir, 'target_encoder.pkl')
+    
+    @property
+    def metadata_path(self):
+        return os.path.join(self.model_dir, 'metadata.pkl')
     
     def load_model(self):
         """
-        Load the trained model and encoders from pickle files.
+        Load the registry's current version and swap it in.
+        
+        The new version is fully loaded into a side ModelBundle first; if
+        anything fails the previously served model stays in place.
         
         Returns:
             bool: True if model loaded successfully, False otherwise
         """
-        try:
-            # Check if model files exist
-            required_files = [self.model_path, self.cat_encoders_path, self.target_encoder_path, self.metadata_path]
-            if not all(os.path.exists(path) for path in required_files):
-                print("Model files not found. Train model in Google Colab first.")
+        
+        with self._lock:
+            path = self.registry.current_path()
+            if path is None:
+                logger.warning("Model files not found in %s. Train model in Google Colab first.", self.models_dir)
                 return False
             
-            # Load model
-            with open(self.model_path, 'rb') as f:
-                self.model = pickle.load(f)
-            
-            # Load categorical encoders
-            with open(self.cat_encoders_path, 'rb') as f:
-                self.categorical_encoders = pickle.load(f)
-            
-            # Load target encoder
-            with open(self.target_encoder_path, 'rb') as f:
-                self.target_encoder = pickle.load(f)
-            
-            # Load metadata
-            with open(self.metadata_path, 'rb') as f:
-                self.metadata = pickle.load(f)
-            
-            self.is_trained = True
-            print("Model loaded successfully!")
-            accuracy = self.metadata.get('accuracy', 0)
-            print(f"Accuracy: {accuracy:.3f}")
-            print(f"Training date: {self.metadata.get('training_date', 'Unknown')}")
-            
-            return True
+            try:
+                bundle = self._load_bundle(path)
+            except Exception as e:
+                logger.error("Error loading model from %s: %s", path, e)
+                return False
             
-        except Exception as e:
-            print(f"Error loading model: {str(e)}")
-            self.is_trained = False
-            return False
+            self._bundle = bundle
+            self._initialized = True
+            # Old-version entries can no longer be hit; free them
+            self.prediction_cache.clear()
+        
+        timings = ', '.join(f'{name} {ms:.1f} ms' for name, ms in bundle.load_timings.items())
+        logger.info(
+            "Model %s loaded in %.1f ms (%s). Accuracy: %.3f, training date: %s",
+            bundle.version, sum(bundle.load_timings.values()), timings,
+            bundle.metadata.get('accuracy', 0), bundle.metadata.get('training_date', 'Unknown')
+        )
+        
+        self._start_grid_build(bundle)
+        
+        return True
     
     def reload_model(self):
         """
         Reload the model from files (useful after updating model files).
         
+        The current model keeps serving until the new one is ready.
+        
         Returns:
             bool: True if model reloaded successfully, False otherwise
         """
-        self.is_trained = False
-        self.model = None
-        self.categorical_encoders = None
-        self.target_encoder = None
-        self.metadata = None
         
         return self.load_model()
     
+    def export_arrays(self, path=None):
+        """
+        Export a version for memory-mapped loading.
+        
+        Args:
+            path (str): Version directory (default: registry's current one)
+        
+        Returns:
+            str: Arrays directory inside the version directory
+        """
+        
+        path = path or self.registry.current_path()
+        if path is None:
+            raise ValueError(f"Model files not found in {self.models_dir}")
+        
+        return self._load_bundle(path).export_arrays()
+    
+    def _load_bundle(self, path):
+        """
+        Load one version into a new ModelBundle.
+        
+        Maps the version's arrays export when there is one; otherwise reads
+        the four pickles and (with use_arrays) exports them for next time.
+        """
+        
+        # Model version is the hash of all four files
+        timings = {}
+        start = time.perf_counter()
+        version = hash_model_files(path)
+        timings['hash'] = (time.perf_counter() - start) * 1000
+        
+        if self.use_arrays:
+            start = time.perf_counter()
+            bundle = ModelBundle.from_arrays(path, version)
+            if bundle is not None:
+                timings['arrays'] = (time.perf_counter() - start) * 1000
+                bundle.load_timings = timings
+                return bundle
+        
+        loaded = {}
+        for name in MODEL_FILES:
+            start = time.perf_counter()
+            with open(os.path.join(path, name), 'rb') as f:
+                loaded[name] = pickle.load(f)
+            timings[name] = (time.perf_counter() - start) * 1000
+        
+        # Flatten the forest for the NumPy engine; sklearn stays available
+        start = time.perf_counter()
+        try:
+            tree_engine = TreeEnsembleEngine.from_forest(loaded['rf_model.pkl'])
+        except Exception as e:
+            logger.warning("NumPy engine unavailable, using sklearn: %s", e)
+            tree_engine = None
+        timings['tree_engine'] = (time.perf_counter() - start) * 1000
+        
+        bundle = ModelBundle(
+            path, version, loaded['rf_model.pkl'],
+            loaded['categorical_encoders.pkl'], loaded['target_encoder.pkl'],
+            loaded['metadata.pkl'], tree_engine
+        )
+        bundle.load_timings = timings
+        
+        if self.use_arrays and tree_engine is not None:
+            start = time.perf_counter()
+            try:
+                bundle.export_arrays()
+            except Exception as e:
+                logger.warning("Model arrays not exported from %s: %s", path, e)
+            timings['export_arrays'] = (time.perf_counter() - start) * 1000
+        
+        return bundle
+    
+    def _current(self):
+        """Bundle serving this call; starts this process's watcher on first use"""
+        
+        if self._watcher_pid != os.getpid():
+            self.start_watcher()
+        
+        bundle = self._loaded()
+        if bundle is None:
+            raise ValueError("Model not loaded. Train model in Google Colab first.")
+        return bundle
+    
+    def start_watcher(self):
+        """
+        Start polling the registry pointer in this process.
+        
+        Threads do not survive fork(), so every gunicorn worker starts its
+        own watcher; calling this again in the same process is a no-op.
+        """
+        
+        with self._lock:
+            if self._watcher_pid == os.getpid():
+                return
+            self._watcher_pid = os.getpid()
+        
+        if self.watch_interval <= 0:
+            return
+        
+        threading.Thread(target=self._watch, name='model-watcher', daemon=True).start()
+    
+    def _watch(self):
+        while True:
+            time.sleep(self.watch_interval)
+            try:
+                self.check_for_update()
+            except Exception as e:
+                logger.error("Model watcher error: %s", e)
+    
+    def check_for_update(self):
+        """
+        Hot-swap the registry's current version if it is not the one served.
+        
+        Published versions never change, so in the registry layout a new
+        path is the only signal. The flat layout has one path, so files
+        overwritten in place are noticed by their modification time
+        instead; that swap is not atomic (a half-copied set fails to load
+        and is retried on the next poll), which publish_model avoids.
+        
+        Returns:
+            bool: True if a new version was swapped in
+        """
+        
+        path = self.registry.current_path()
+        if path is None:
+            return False
+        
+        bundle = self._loaded()
+        if bundle is not None and bundle.path == path:
+            if self.registry.current_version() is not None:
+                return False
+            if bundle.modified == ModelBundle._files_modified(path):
+                return False
+        
+        return self.load_model()
+    
+    def grid_path(self, bundle=None):
+        """Cache file for a model version and the configured grid lattice"""
+        
+        bundle = bundle or self._current()
+        lattice = hashlib.sha256(
+            repr((self.grid_rainfall, self.grid_temperature)).encode()
+        ).hexdigest()[:8]
+        return os.path.join(bundle.path, f'prediction_grid_{bundle.version}_{lattice}.npy')
+    
+    def _start_grid_build(self, bundle):
+        """Build the prediction grid without blocking model loading"""
+        
+        if self.grid_mode == 'off':
+            return
+        
+        threading.Thread(
+            target=self.build_grid, args=(bundle,), name='prediction-grid', daemon=True
+        ).start()
+    
+    def build_grid(self, bundle=None):
+        """
+        Build the prediction grid for a model version, mapping the cached
+        .npy for that version when present.
+        
+        Concurrent callers for the same bundle (warm_up() and the
+        background build) wait for one build instead of racing.
+        
+        Args:
+            bundle (ModelBundle): Version to build for (default: served one)
+        
+        Returns:
+            PredictionGrid: The grid now attached to the bundle, or None
+        """
+        
+        bundle = bundle or self._loaded()
+        if bundle is None:
+            return None
+        
+        with bundle.grid_lock:
+            if bundle.prediction_grid is not None:
+                return bundle.prediction_grid
+            return self._build_grid(bundle)
+    
+    def _build_grid(self, bundle):
+        path = self.grid_path(bundle)
+        grid = None
+        
+        try:
+            try:
+                grid = PredictionGrid.load(path)
+            except (OSError, ValueError, KeyError):
+                pass
+            if grid is not None and grid.version != bundle.version:
+                grid = None
+            
+            if grid is None:
+                grid = PredictionGrid.build(
+                    lambda features: self._predict_proba(bundle, features),
+                    n_last_week=len(bundle.categorical_encoders['Last_Week_Demand'].classes_),
+                    n_month=len(bundle.categorical_encoders['Month'].classes_),
+                    rainfall=self.grid_rainfall,
+                    temperature=self.grid_temperature,
+                    version=bundle.version,
+                )
+                try:
+                    grid.save(path)
+                    self._remove_stale_grids(bundle, path)
+                except OSError as e:
+                    logger.warning("Prediction grid not cached: %s", e)
+        
+        except Exception as e:
+            logger.error("Error building prediction grid: %s", e)
+            return None
+        
+        bundle.prediction_grid = grid
+        logger.info("Prediction grid %s ready (max error %.3f)", bundle.version, grid.max_error)
+        return grid
+    
+    def _remove_stale_grids(self, bundle, path):
+        """
+        Delete the grids cached beside the model for other versions or
+        lattices, which no worker on this configuration will map again.
+        """
+        
+        keep = os.path.splitext(os.path.basename(path))[0]
+        for name in os.listdir(bundle.path):
+            base, extension = os.path.splitext(name)
+            if base.startswith('prediction_grid_') and base != keep and extension in ('.npy', '.json'):
+                try:
+                    os.remove(os.path.join(bundle.path, name))
+                except OSError as e:
+                    logger.warning("Could not remove stale prediction grid %s: %s", name, e)
+    
     def encode_features(self, rainfall_mm, temperature_c, market_day, school_open, 
                        disease_alert, last_week_demand, week, month):
         """
@@ -269,42 +1276,83 @@ class TomatoModelLoader:
             month (str): Month name
         
         Returns:
-            np.array: Encoded features ready for prediction
+            pd.DataFrame: Single encoded row ready for prediction
         """
         
-        if not self.is_trained:
-            raise ValueError("Model not loaded. Train model in Google Colab first.")
+        return self.encode_batch([{
+            'rainfall_mm': rainfall_mm,
+            'temperature_c': temperature_c,
+            'market_day': market_day,
+            'school_open': school_open,
+            'disease_alert': disease_alert,
+            'last_week_demand': last_week_demand,
+            'week': week,
+            'month': month,
+        }])
+    
+    def encode_batch(self, scenarios):
+        """
+        Encode many scenarios in one vectorized pass.
+        
+        Args:
+            scenarios: List of dicts, pandas DataFrame or NumPy structured array
+                whose fields match the predict() keyword arguments. Missing
+                fields fall back to the predict() defaults.
+        
+        Returns:
+            pd.DataFrame: Encoded features in training column order
+        """
+        
+        return self._encode(self._current(), scenarios)
+    
+    def _encode(self, bundle, scenarios):
+        """Encode scenarios with one model version's encoders"""
         
         try:
-            # Encode categorical features - Note: Disease_Alert is not in encoders since it wasn't categorical in your data
-            last_week_encoded = self.categorical_encoders['Last_Week_Demand'].transform([last_week_demand])[0]
-            month_encoded = self.categorical_encoders['Month'].transform([month])[0]
-            
-            # Convert boolean to int
-            market_day_int = 1 if market_day else 0
-            school_open_int = 1 if school_open else 0
+            frame = self._scenario_frame(scenarios)
             
-            # Convert disease_alert to int (since it wasn't encoded in Colab)
-            disease_alert_int = 1 if disease_alert == 'Presence' else 0
-            
-            # Create feature array (must match training order from Colab)
-            # Order: Rainfall_mm, Temperature_C, Market_Day, School_Open, Disease_Alert, Last_Week_Demand, Month, Year
-            features = np.array([[
-                rainfall_mm,             # Rainfall_mm
-                temperature_c,           # Temperature_C
-                market_day_int,          # Market_Day
-                school_open_int,         # School_Open
-                disease_alert_int,       # Disease_Alert (not encoded, just binary)
-                last_week_encoded,       # Last_Week_Demand_encoded
-                month_encoded,           # Month_encoded
-                2024                     # Year (using 2024 as default)
-            ]])
+            # One LabelEncoder call per categorical column for the whole batch
+            last_week_encoded = bundle.categorical_encoders['Last_Week_Demand'].transform(
+                frame['last_week_demand'].to_numpy()
+            )
+            month_encoded = bundle.categorical_encoders['Month'].transform(
+                frame['month'].to_numpy()
+            )
             
-            return features
+            # Disease_Alert is binary, it was not encoded in Colab
+            features = np.column_stack([
+                frame['rainfall_mm'].to_numpy(dtype=float),
+                frame['temperature_c'].to_numpy(dtype=float),
+                frame['market_day'].astype(bool).to_numpy(dtype=float),
+                frame['school_open'].astype(bool).to_numpy(dtype=float),
+                (frame['disease_alert'] == 'Presence').to_numpy(dtype=float),
+                last_week_encoded,
+                month_encoded,
+                np.full(len(frame), 2024.0),  # Year (using 2024 as default)
+            ])
             
+            return pd.DataFrame(features, columns=FEATURE_NAMES)
+        
         except Exception as e:
             raise ValueError(f"Feature encoding failed: {str(e)}")
     
+    @staticmethod
+    def _scenario_frame(scenarios):
+        """Normalize batch input into a DataFrame with every scenario field"""
+        
+        if isinstance(scenarios, pd.DataFrame):
+            frame = scenarios.copy()
+        elif isinstance(scenarios, np.ndarray) and scenarios.dtype.names:
+            frame = pd.DataFrame.from_records(scenarios)
+        else:
+            frame = pd.DataFrame.from_records(list(scenarios))
+        
+        for field, default in SCENARIO_DEFAULTS.items():
+            if field not in frame.columns:
+                frame[field] = default
+        
+        return frame
+    
     def predict(self, rainfall_mm=75.0, temperature_c=22.0, market_day=True, 
                 school_open=True, disease_alert='Absence', last_week_demand='Medium',
                 week=1, month='January'):
@@ -325,29 +1373,205 @@ class TomatoModelLoader:
             tuple: (predicted_demand, confidence_score)
         """
         
-        if not self.is_trained:
-            raise ValueError("Model not loaded. Train model in Google Colab first.")
+        return self.predict_batch([{
+            'rainfall_mm': rainfall_mm,
+            'temperature_c': temperature_c,
+            'market_day': market_day,
+            'school_open': school_open,
+            'disease_alert': disease_alert,
+            'last_week_demand': last_week_demand,
+            'week': week,
+            'month': month,
+        }])[0]
+    
+    def predict_batch(self, scenarios):
+        """
+        Make demand predictions for many scenarios with one forest pass.
+        
+        Labels and confidences both come from a single predict_proba call,
+        so a batch of N rows costs one traversal of the forest instead of 2N.
+        Rows already in the prediction cache skip the forest entirely.
+        
+        Args:
+            scenarios: List of dicts, pandas DataFrame or NumPy structured array
+                (see encode_batch)
+        
+        Returns:
+            list: (predicted_demand, confidence_score) tuples in input order
+        """
+        
+        # Encoders, forest and grid all come from the same model version
+        bundle = self._current()
         
         try:
-            # Encode features
-            features = self.encode_features(
-                rainfall_mm, temperature_c, market_day, school_open,
-                disease_alert, last_week_demand, week, month
-            )
+            features = self._encode_rounded(bundle, scenarios)
+            if features.empty:
+                return []
             
-            # Make prediction
-            prediction_encoded = self.model.predict(features)[0]
-            prediction_proba = self.model.predict_proba(features)[0]
-            confidence = np.max(prediction_proba)
+            probabilities = self._cached_proba(bundle, features)
+            predictions, confidences = self._decode(bundle, probabilities)
             
-            # Decode prediction back to original labels
-            prediction = self.target_encoder.inverse_transform([prediction_encoded])[0]
+            return list(zip(predictions.tolist(), confidences.tolist()))
+        
+        except Exception as e:
+            raise ValueError(f"Prediction failed: {str(e)}")
+    
+    def predict_fast(self, max_trees=None, time_budget_ms=None, **scenario):
+        """
+        Anytime prediction of one scenario (see predict_batch_fast()).
+        
+        Args:
+            max_trees (int): Tree budget (default: all trees)
+            time_budget_ms (float): Time budget for walking trees
+            **scenario: Same keyword arguments as predict()
+        
+        Returns:
+            dict: predicted_demand, confidence_score, trees_used, error_bound
+        """
+        
+        return self.predict_batch_fast([scenario], max_trees, time_budget_ms)[0]
+    
+    def predict_batch_fast(self, scenarios, max_trees=None, time_budget_ms=None):
+        """
+        Anytime predictions for latency-sensitive callers (what-if sliders).
+        
+        Trees are walked in a fixed order and each row stops as soon as its
+        leading class can no longer be overtaken, or when the tree or time
+        budget runs out. Labels of rows that stopped early are exact;
+        confidences are within error_bound of the full forest's. Cached
+        rows are answered exactly. Without the NumPy engine every row
+        uses the full forest.
+        
+        Args:
+            scenarios: Same as predict_batch()
+            max_trees (int): Tree budget (default: all trees)
+            time_budget_ms (float): Time budget for walking trees
+        
+        Returns:
+            list: Dicts of predicted_demand, confidence_score, trees_used
+                and error_bound, in input order
+        """
+        
+        bundle = self._current()
+        
+        try:
+            features = self._encode_rounded(bundle, scenarios)
+            if features.empty:
+                return []
+            
+            rows = features.to_numpy(dtype=np.float64)
+            n_trees = bundle.tree_engine.n_trees if bundle.tree_engine is not None else len(bundle.model.estimators_)
+            trees_used = np.full(len(rows), n_trees)
+            error_bound = np.zeros(len(rows))
             
-            return prediction, confidence
+            if self.prediction_cache.max_size:
+                probabilities, hits = self.prediction_cache.get_many(bundle.version, rows, len(bundle.classes))
+            else:
+                probabilities, hits = np.zeros((len(rows), len(bundle.classes))), np.zeros(len(rows), dtype=bool)
             
+            if not hits.all():
+                if bundle.tree_engine is None:
+                    probabilities[~hits] = bundle.model.predict_proba(features[~hits])
+                else:
+                    probabilities[~hits], trees_used[~hits], error_bound[~hits] = (
+                        bundle.tree_engine.predict_proba_anytime(
+                            rows[~hits],
+                            max_trees=max_trees,
+                            time_budget=time_budget_ms / 1000 if time_budget_ms is not None else None,
+                        )
+                    )
+            
+            predictions, confidences = self._decode(bundle, probabilities)
+            
+            return [
+                {
+                    'predicted_demand': prediction,
+                    'confidence_score': confidence,
+                    'trees_used': int(used),
+                    'error_bound': float(bound),
+                }
+                for prediction, confidence, used, bound in zip(
+                    predictions.tolist(), confidences.tolist(), trees_used, error_bound
+                )
+            ]
+        
         except Exception as e:
             raise ValueError(f"Prediction failed: {str(e)}")
     
+    def _encode_rounded(self, bundle, scenarios):
+        """Encode scenarios, rounding rainfall and temperature for the cache"""
+        
+        features = self._encode(bundle, scenarios)
+        if self.cache_round is not None:
+            features[['Rainfall_mm', 'Temperature_C']] = features[['Rainfall_mm', 'Temperature_C']].round(self.cache_round)
+        return features
+    
+    @staticmethod
+    def _decode(bundle, probabilities):
+        """Labels and confidences of the most likely class per row"""
+        
+        best = probabilities.argmax(axis=1)
+        confidences = probabilities[np.arange(len(best)), best]
+        
+        # Decode predictions back to original labels
+        return bundle.target_encoder.inverse_transform(bundle.classes[best]), confidences
+    
+    def predict_proba(self, features):
+        """
+        Class probabilities for encoded features on the active engine.
+        
+        Args:
+            features (pd.DataFrame): Output of encode_batch()
+        
+        Returns:
+            np.array: Probabilities, shape (n_samples, n_classes)
+        """
+        
+        return self._predict_proba(self._current(), features)
+    
+    def _predict_proba(self, bundle, features):
+        """Live scoring on one model version with the active engine"""
+        
+        # Large batches only go to sklearn if the forest is already in
+        # memory; a mapped bundle is not unpickled just to be faster
+        if (self.inference_engine == 'numpy' and bundle.tree_engine is not None
+                and (len(features) <= self.NUMPY_ENGINE_MAX_ROWS or not bundle.forest_loaded)):
+            return bundle.tree_engine.predict_proba(features.to_numpy())
+        
+        return bundle.model.predict_proba(features)
+    
+    def _cached_proba(self, bundle, features):
+        """Serve repeated rows from the prediction cache, scoring the rest"""
+        
+        cache = self.prediction_cache
+        if not cache.max_size:
+            return self._grid_proba(bundle, features)
+        
+        rows = features.to_numpy(dtype=np.float64)
+        probabilities, hits = cache.get_many(bundle.version, rows, len(bundle.classes))
+        
+        if not hits.all():
+            fresh = self._grid_proba(bundle, features[~hits])
+            probabilities[~hits] = fresh
+            cache.put_many(bundle.version, rows[~hits], fresh)
+        
+        return probabilities
+    
+    def _grid_proba(self, bundle, features):
+        """Serve rows from the prediction grid, scoring off-grid rows live"""
+        
+        grid = bundle.prediction_grid
+        if self.grid_mode == 'off' or grid is None:
+            return self._predict_proba(bundle, features)
+        
+        probabilities, hits = grid.lookup(
+            features.to_numpy(), nearest=self.grid_mode == 'nearest'
+        )
+        if not hits.all():
+            probabilities[~hits] = self._predict_proba(bundle, features[~hits])
+        
+        return probabilities
+    
     def get_model_info(self):
         """
         Get information about the loaded model.
@@ -355,21 +1579,34 @@ class TomatoModelLoader:
         Returns:
             dict: Model information including accuracy, training date, etc.
         """
-        if not self.is_trained:
+        bundle = self._loaded()
+        if bundle is None:
             return {
                 'is_trained': False,
                 'message': 'Model not loaded. Train in Google Colab first.'
             }
         
+        grid = bundle.prediction_grid
+        
         return {
             'is_trained': True,
             'model_type': 'Random Forest Classifier',
-            'accuracy': self.metadata.get('accuracy', 0),
-            'training_date': self.metadata.get('training_date', 'Unknown'),
-            'features': self.metadata.get('features', []),
-            'target': self.metadata.get('target', 'Market_Demand')
+            'accuracy': bundle.metadata.get('accuracy', 0),
+            'training_date': bundle.metadata.get('training_date', 'Unknown'),
+            'features': bundle.metadata.get('features', []),
+            'target': bundle.metadata.get('target', 'Market_Demand'),
+            'inference_engine': 'numpy' if (
+                self.inference_engine == 'numpy' and bundle.tree_engine is not None
+            ) else 'sklearn',
+            'model_version': bundle.version,
+            'model_path': bundle.path,
+            'memory_mapped': bundle.memory_mapped,
+            'load_timings_ms': {name: round(ms, 1) for name, ms in bundle.load_timings.items()},
+            'grid_mode': self.grid_mode,
+            'prediction_grid': grid.info() if grid is not None else None,
+            'prediction_cache': self.prediction_cache.info()
         }
 
 
-# Global model instance
+# Global model instance (loaded lazily on first use)
 predictor = TomatoModelLoader()
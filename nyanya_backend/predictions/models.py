@@ -2,10 +2,73 @@
 Prediction Models
 """
 
-from django.db import models
+from django.db import models, transaction
 from django.utils import timezone
 
 
+DEMAND_CHOICES = [
+    ('Low', 'Low Demand'),
+    ('Medium', 'Medium Demand'),
+    ('High', 'High Demand'),
+]
+
+
+class PredictionQuerySet(models.QuerySet):
+    """
+    Bulk writes that keep PredictionRollup in step and bump the
+    'predictions' data generation, in the same transaction.
+    
+    bulk_update() goes through update(), so it is covered as well.
+    """
+    
+    def bulk_create(self, objs, *args, **kwargs):
+        from . import response_cache, rollup
+        
+        with transaction.atomic(using=self.db):
+            objs = super().bulk_create(objs, *args, **kwargs)
+            rollup.add(objs)
+            response_cache.bump('predictions')
+        return objs
+    
+    def update(self, **kwargs):
+        from . import response_cache, rollup
+        
+        if not rollup.FIELDS & set(kwargs):
+            with transaction.atomic(using=self.db):
+                response_cache.bump('predictions')
+                return super().update(**kwargs)
+        
+        with transaction.atomic(using=self.db):
+            response_cache.bump('predictions')
+            pks = list(self.values_list('pk', flat=True))
+            days = set(self.dates('timestamp', 'day'))
+            updated = super().update(**kwargs)
+            days |= set(Prediction.objects.filter(pk__in=pks).dates('timestamp', 'day'))
+            rollup.rebuild(days)
+        return updated
+    
+    def delete(self):
+        from . import response_cache, rollup
+        
+        with transaction.atomic(using=self.db):
+            response_cache.bump('predictions')
+            days = set(self.dates('timestamp', 'day'))
+            deleted = super().delete()
+            rollup.rebuild(days)
+        return deleted
+    
+    def delete_archived(self):
+        """
+        Delete rows that were archived (predictions.retention) and leave
+        their rollup buckets as they are, so the dashboard keeps counting them.
+        """
+        from . import response_cache
+        
+        with transaction.atomic(using=self.db):
+            response_cache.bump('predictions')
+            return super().delete()
+
+
 class Prediction(models.Model):
     """Model to store prediction results"""
     
@@ -15,19 +78,83 @@ class Prediction(models.Model):
     
     predicted_demand = models.CharField(
         max_length=20,
-        choices=[
-            ('Low', 'Low Demand'),
-            ('Medium', 'Medium Demand'),
-            ('High', 'High Demand'),
-        ]
+        choices=DEMAND_CHOICES
     )
     
     confidence_score = models.FloatField()
     rainfall_mm = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True)
     temperature_c = models.DecimalField(max_digits=5, decimal_places=2, null=True, blank=True)
     
+    objects = PredictionQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-timestamp']
-        
+        indexes = [
+            # Time ranges (history, retention, rollup rebuilds) and the
+            # default ordering, with the demand bucket alongside
+            models.Index(fields=['timestamp', 'predicted_demand'], name='prediction_time_demand_idx'),
+        ]
+    
     def __str__(self):
         return f"Week {self.week}, {self.year} - {self.predicted_demand} ({self.confidence_score:.2f})"
+    
+    def save(self, *args, **kwargs):
+        from . import rollup
+        
+        with transaction.atomic():
+            if self._state.adding:
+                super().save(*args, **kwargs)
+                rollup.add([self])
+            else:
+                # An edit may move the row to another bucket; recount both days
+                previous = Prediction.objects.filter(pk=self.pk).values_list('timestamp', flat=True).first()
+                super().save(*args, **kwargs)
+                rollup.rebuild({rollup.day_of(self.timestamp)} | ({rollup.day_of(previous)} if previous else set()))
+    
+    def delete(self, *args, **kwargs):
+        from . import rollup
+        
+        with transaction.atomic():
+            deleted = super().delete(*args, **kwargs)
+            rollup.rebuild({rollup.day_of(self.timestamp)})
+        return deleted
+
+
+class PredictionRollup(models.Model):
+    """
+    Prediction counts and confidence per day and predicted demand.
+    
+    Maintained by every Prediction write (see predictions.rollup), so
+    dashboard metrics read a few rows per day instead of every prediction.
+    """
+    
+    day = models.DateField()
+    predicted_demand = models.CharField(max_length=20, choices=DEMAND_CHOICES)
+    
+    count = models.PositiveIntegerField(default=0)
+    confidence_sum = models.FloatField(default=0.0)
+    confidence_min = models.FloatField()
+    confidence_max = models.FloatField()
+    
+    class Meta:
+        ordering = ['-day', 'predicted_demand']
+        unique_together = ['day', 'predicted_demand']
+    
+    def __str__(self):
+        return f"{self.day} {self.predicted_demand}: {self.count}"
+
+
+class DataGeneration(models.Model):
+    """
+    Counter bumped whenever the data behind a scope ('market_data',
+    'predictions') changes; cached dashboard responses and their ETag /
+    Last-Modified validators are derived from it (see
+    predictions.response_cache).
+    """
+    
+    scope = models.CharField(max_length=50, primary_key=True)
+    value = models.BigIntegerField(default=0)
+    changed_at = models.DateTimeField(default=timezone.now)
+    
+    def __str__(self):
+        return f"{self.scope}: {self.value}"
@@ -0,0 +1,198 @@
+"""
+Write-Behind Prediction Log
+
+Every prediction a user asks the predict endpoint for is recorded as a
+Prediction row without an INSERT on the request path: the view appends
+to a bounded in-process buffer and a flusher thread writes it with
+bulk_create() (which also updates the PredictionRollup) when it holds
+flush_rows records or flush_interval seconds have passed, whichever
+comes first. The buffer is flushed once more when the worker shuts down
+(gunicorn's worker_exit hook, atexit otherwise).
+
+Only predictions a user asked for are recorded, not every prediction
+served. The dashboard's fixed current-week scenario and its simulation
+replays are computed on every dashboard load (and would bump the
+'predictions' data generation the dashboard responses are cached on),
+so logging them would count the dashboard's own polling as demand in
+the cards and tips computed from Prediction and keep invalidating the
+cached dashboard.
+
+When the database falls behind and the buffer is full, new records are
+dropped rather than blocking requests or growing memory; the counters in
+stats() report how many.
+"""
+
+import atexit
+import collections
+import logging
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+
+from .models import Prediction
+
+
+logger = logging.getLogger(__name__)
+
+
+class PredictionLog:
+    """
+    Bounded buffer of served predictions, flushed in bulk in the background.
+    
+    Configured by settings.PREDICTION_LOG, PREDICTION_LOG_MAX_RECORDS,
+    PREDICTION_LOG_FLUSH_ROWS and PREDICTION_LOG_FLUSH_INTERVAL. Disabled,
+    record() does nothing.
+    """
+    
+    def __init__(self, enabled=None, max_records=None, flush_rows=None, flush_interval=None):
+        if enabled is None:
+            enabled = getattr(settings, 'PREDICTION_LOG', True)
+        if max_records is None:
+            max_records = getattr(settings, 'PREDICTION_LOG_MAX_RECORDS', 10000)
+        if flush_rows is None:
+            flush_rows = getattr(settings, 'PREDICTION_LOG_FLUSH_ROWS', 500)
+        if flush_interval is None:
+            flush_interval = getattr(settings, 'PREDICTION_LOG_FLUSH_INTERVAL', 5.0)
+        
+        self.enabled = enabled
+        self.max_records = max_records
+        self.flush_rows = flush_rows
+        self.flush_interval = flush_interval
+        
+        self._counter_lock = threading.Lock()
+        self.recorded = 0
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+        self.flushes = 0
+        self.last_flush_ms = None
+        
+        self._reset()
+        # The flusher thread does not survive fork(); each worker starts
+        # its own on first use, with an empty buffer
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.close)
+    
+    def _reset(self):
+        self._buffer = collections.deque()
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._flusher_pid = None
+    
+    def record(self, predicted_demand, confidence_score, week, year=None,
+               rainfall_mm=None, temperature_c=None):
+        """
+        Queue one served prediction; never blocks on the database.
+        
+        Returns:
+            bool: False if the record was dropped (buffer full or disabled)
+        """
+        
+        if not self.enabled:
+            return False
+        
+        now = timezone.now()
+        prediction = Prediction(
+            timestamp=now,
+            week=week,
+            year=year or now.year,
+            predicted_demand=predicted_demand,
+            confidence_score=float(confidence_score),
+            rainfall_mm=rainfall_mm,
+            temperature_c=temperature_c,
+        )
+        
+        with self._lock:
+            if len(self._buffer) >= self.max_records:
+                self.dropped += 1
+                return False
+            self._buffer.append(prediction)
+            self.recorded += 1
+            full = len(self._buffer) >= self.flush_rows
+        
+        self._start_flusher()
+        if full:
+            self._wake.set()
+        return True
+    
+    def flush(self):
+        """
+        Write everything buffered now, in the calling thread.
+        
+        Returns:
+            int: Rows written
+        """
+        
+        with self._flush_lock:
+            with self._lock:
+                batch = list(self._buffer)
+                self._buffer.clear()
+            if not batch:
+                return 0
+            
+            start = time.perf_counter()
+            try:
+                Prediction.objects.bulk_create(batch, batch_size=self.flush_rows)
+            except Exception as e:
+                # Dropping keeps memory bounded while the database is down
+                logger.error("Prediction log flush of %d records failed: %s", len(batch), e)
+                with self._counter_lock:
+                    self.failed += len(batch)
+                return 0
+            
+            with self._counter_lock:
+                self.written += len(batch)
+                self.flushes += 1
+                self.last_flush_ms = (time.perf_counter() - start) * 1000
+            return len(batch)
+    
+    def close(self):
+        """Final flush on shutdown"""
+        
+        if self.enabled and self._buffer:
+            self.flush()
+    
+    def stats(self):
+        """JSON-safe counters of this process's log"""
+        
+        with self._counter_lock:
+            return {
+                'enabled': self.enabled,
+                'buffered': len(self._buffer),
+                'max_records': self.max_records,
+                'recorded': self.recorded,
+                'written': self.written,
+                'dropped': self.dropped,
+                'failed': self.failed,
+                'flushes': self.flushes,
+                'last_flush_ms': round(self.last_flush_ms, 3) if self.last_flush_ms is not None else None,
+            }
+    
+    def _start_flusher(self):
+        if self._flusher_pid == os.getpid():
+            return
+        
+        with self._lock:
+            if self._flusher_pid == os.getpid():
+                return
+            threading.Thread(target=self._run, name='prediction-log', daemon=True).start()
+            self._flusher_pid = os.getpid()
+    
+    def _run(self):
+        while True:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            finally:
+                # This thread holds its own connection; drop it if it went stale
+                close_old_connections()
+
+
+# Global log for the prediction views
+prediction_log = PredictionLog()
@@ -0,0 +1,159 @@
+"""
+Versioned Model Registry
+
+Layout under the models directory:
+    versions/<version>/   the four model pickles of one version
+    CURRENT               name of the version being served
+
+Publishing copies the files into a new version directory first and only
+then replaces CURRENT with os.replace(), so readers see either the old or
+the new version, never a partially copied one. A directory without
+CURRENT keeps working as a single flat version (the original layout).
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+
+
+MODEL_FILES = (
+    'rf_model.pkl',
+    'categorical_encoders.pkl',
+    'target_encoder.pkl',
+    'metadata.pkl',
+)
+
+
+def hash_model_files(path):
+    """
+    Version id of a set of model files.
+    
+    Args:
+        path (str): Directory holding the four model pickles
+    
+    Returns:
+        str: First 12 hex digits of the SHA-256 over all files, in order
+    """
+    
+    digest = hashlib.sha256()
+    for name in MODEL_FILES:
+        with open(os.path.join(path, name), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:12]
+
+
+def has_model_files(path):
+    """True if the directory holds all four model pickles"""
+    
+    return all(os.path.exists(os.path.join(path, name)) for name in MODEL_FILES)
+
+
+class ModelRegistry:
+    """Versioned model directory with an atomic CURRENT pointer"""
+    
+    POINTER = 'CURRENT'
+    
+    def __init__(self, root):
+        self.root = str(root)
+        self.versions_dir = os.path.join(self.root, 'versions')
+        self.pointer_path = os.path.join(self.root, self.POINTER)
+    
+    def version_path(self, version):
+        return os.path.join(self.versions_dir, version)
+    
+    def current_version(self):
+        """
+        Version named by CURRENT.
+        
+        Returns:
+            str: Active version, or None for the flat layout
+        """
+        
+        try:
+            with open(self.pointer_path) as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+    
+    def current_path(self):
+        """
+        Directory of the version that should be served.
+        
+        Returns:
+            str: Version directory, the root itself for the flat layout,
+                or None if no complete model is available
+        """
+        
+        version = self.current_version()
+        path = self.version_path(version) if version else self.root
+        return path if has_model_files(path) else None
+    
+    def versions(self):
+        """Published versions, oldest first"""
+        
+        if not os.path.isdir(self.versions_dir):
+            return []
+        
+        versions = [
+            name for name in os.listdir(self.versions_dir)
+            if not name.startswith('.') and has_model_files(self.version_path(name))
+        ]
+        return sorted(versions, key=lambda name: os.path.getmtime(self.version_path(name)))
+    
+    def publish(self, source_dir, activate=True):
+        """
+        Copy model files into a new version directory.
+        
+        Files are staged in a hidden directory and renamed into place, so a
+        version directory is either complete or absent.
+        
+        Args:
+            source_dir (str): Directory holding the four model pickles
+            activate (bool): Point CURRENT at the new version
+        
+        Returns:
+            str: Version id (content hash, so republishing is a no-op)
+        """
+        
+        if not has_model_files(source_dir):
+            raise ValueError(f"Model files missing in {source_dir}")
+        
+        version = hash_model_files(source_dir)
+        target = self.version_path(version)
+        
+        if not os.path.exists(target):
+            os.makedirs(self.versions_dir, exist_ok=True)
+            staging = tempfile.mkdtemp(prefix='.staging-', dir=self.versions_dir)
+            try:
+                for name in MODEL_FILES:
+                    shutil.copy2(os.path.join(source_dir, name), os.path.join(staging, name))
+                os.rename(staging, target)
+            except OSError:
+                shutil.rmtree(staging, ignore_errors=True)
+                # Another publisher may have won the race with the same files
+                if not has_model_files(target):
+                    raise
+        
+        if activate:
+            self.activate(version)
+        
+        return version
+    
+    def activate(self, version):
+        """
+        Atomically point CURRENT at a published version.
+        
+        Args:
+            version (str): Version id under versions/
+        """
+        
+        if not has_model_files(self.version_path(version)):
+            raise ValueError(f"Unknown model version: {version}")
+        
+        temp_path = f'{self.pointer_path}.{os.getpid()}.tmp'
+        with open(temp_path, 'w') as f:
+            f.write(version + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.pointer_path)
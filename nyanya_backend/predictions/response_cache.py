@@ -0,0 +1,476 @@
+"""
+Dashboard Response Cache
+
+Dashboard payloads are computed from data that changes weekly at most
+(MarketData) or when predictions are logged, so their responses are
+cached (settings.RESPONSE_CACHE_ALIAS) under a key made of:
+
+- the endpoint and its query parameters
+- the generation of each data scope it reads ('market_data',
+  'predictions'): a counter in DataGeneration, bumped in the same
+  transaction as every write to that data
+- the served model version, for endpoints that predict
+- today's date, as the metric windows and the current week move with it
+
+A write makes every response that depends on it unreachable at once,
+without deleting any keys; stale entries expire after
+settings.RESPONSE_CACHE_TIMEOUT.
+
+The key doubles as a strong ETag, and Last-Modified is the latest of the
+scopes' last bump, the model files' write time and the start of today.
+Both are known before the view runs, so a request whose If-None-Match
+(or, without one, If-Modified-Since) still matches gets a 304 without
+the payload being built or read from the cache.
+
+Generations are bumped by post_save/post_delete on MarketData and
+Prediction, by the PredictionQuerySet bulk methods, and by the
+market_data_changed / market_data_loaded signals of bulk loads (ingest,
+fetch, sync, snapshot restore). They live in the database rather than in
+the cache, so a bump made by a management command or another worker
+reaches every worker, whatever the cache backend; reading them is one
+query per request.
+
+Misses are computed once: concurrent identical requests in a worker
+wait for the first one (SingleFlight), and with
+settings.RESPONSE_CACHE_LOCK_TIMEOUT workers sharing a cache take a lock
+in it so only one of them computes. With
+settings.RESPONSE_CACHE_STALE_SECONDS, a request arriving that long at
+most after a write gets the previous response while a background thread
+computes the new one (stale-while-revalidate).
+
+Computing a response must never write to a scope it is keyed on, or
+every miss would invalidate itself: the dashboard endpoints score their
+fixed scenarios without logging them (see predictions.prediction_log).
+"""
+
+import collections
+import functools
+import hashlib
+import logging
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import connections, transaction
+from django.db.models import F
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.http import HttpRequest
+from django.utils import timezone
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import http_date, quote_etag
+from rest_framework.request import Request
+from rest_framework.response import Response
+
+from .models import DataGeneration, Prediction
+from market_data.models import MarketData
+from market_data.signals import market_data_changed, market_data_loaded
+
+
+logger = logging.getLogger(__name__)
+
+SCOPES = ('market_data', 'predictions')
+PREFIX = 'dashboard:'
+
+# Seconds between checks while another worker computes a response
+LOCK_POLL_INTERVAL = 0.05
+
+_local = threading.local()
+
+
+class ResponseCacheStats:
+    """Per-endpoint hit, miss and 304 counters of this process"""
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.hits = collections.Counter()
+        self.misses = collections.Counter()
+        self.not_modified = collections.Counter()
+        self.coalesced = collections.Counter()
+        self.stale = collections.Counter()
+    
+    def record(self, endpoint, hit):
+        with self._lock:
+            (self.hits if hit else self.misses)[endpoint] += 1
+    
+    def record_not_modified(self, endpoint):
+        with self._lock:
+            self.not_modified[endpoint] += 1
+    
+    def record_coalesced(self, endpoint):
+        with self._lock:
+            self.coalesced[endpoint] += 1
+    
+    def record_stale(self, endpoint):
+        with self._lock:
+            self.stale[endpoint] += 1
+    
+    def snapshot(self):
+        with self._lock:
+            endpoints = self.hits.keys() | self.misses.keys() | self.not_modified.keys() | self.stale.keys()
+            return {
+                endpoint: {
+                    'hits': self.hits[endpoint],
+                    'misses': self.misses[endpoint],
+                    'not_modified': self.not_modified[endpoint],
+                    'coalesced': self.coalesced[endpoint],
+                    'stale': self.stale[endpoint],
+                    'hit_ratio': _ratio(self.hits[endpoint], self.hits[endpoint] + self.misses[endpoint]),
+                }
+                for endpoint in sorted(endpoints)
+            }
+
+
+class SingleFlight:
+    """
+    At most one call per key at a time in this process; callers that
+    arrive while it runs wait for it and share its result.
+    """
+    
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+    
+    def running(self, key):
+        with self._lock:
+            return key in self._calls
+    
+    def do(self, key, func):
+        """
+        Call func(), or wait for the call already running for key.
+        
+        Returns:
+            tuple: (result, shared) where shared is True if another
+                caller computed the result
+        """
+        
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+        
+        try:
+            call.result = func()
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result, False
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+stats = ResponseCacheStats()
+flights = SingleFlight()
+
+
+def generations():
+    """Current generation of every scope"""
+    
+    return {scope: value for scope, (value, _) in _read(SCOPES).items()}
+
+
+def bump(*scopes):
+    """
+    Increment the generation of scopes, in the caller's transaction.
+    
+    Within a transaction each scope is bumped once, however many rows it
+    writes (a queryset delete sends post_delete per row).
+    """
+    
+    connection = transaction.get_connection()
+    bumped = _bumped_scopes()
+    for scope in scopes:
+        if connection.in_atomic_block:
+            marker = bumped.get(scope)
+            if marker is not None and marker() is not None:
+                continue
+            marker = _Bumped(scope)
+            transaction.on_commit(marker)
+            bumped[scope] = weakref.ref(marker)
+        
+        now = timezone.now()
+        if not DataGeneration.objects.filter(scope=scope).update(value=F('value') + 1, changed_at=now):
+            DataGeneration.objects.get_or_create(scope=scope, defaults={'value': 1, 'changed_at': now})
+
+
+class _Bumped:
+    """
+    on_commit marker of one bump, held by this module only weakly.
+    
+    Django runs it when the transaction commits, and discards it (freeing
+    it) when the atomic block that made the bump rolls back; either way
+    the next write of the scope bumps again. While it is alive, the bump
+    commits together with any later write of the transaction.
+    """
+    
+    def __init__(self, scope):
+        self.scope = scope
+    
+    def __call__(self):
+        bumped = _bumped_scopes()
+        marker = bumped.get(self.scope)
+        if marker is not None and marker() is self:
+            del bumped[self.scope]
+
+
+def _bumped_scopes():
+    # Scope -> weak reference to the marker of its bump in this thread's transaction
+    if not hasattr(_local, 'bumped'):
+        _local.bumped = {}
+    return _local.bumped
+
+
+def cached_response(*scopes, model=False):
+    """
+    Cache a DRF function view's 200 responses (applied under @api_view)
+    and answer conditional GETs for them.
+    
+    Args:
+        scopes (str): Data scopes the response is computed from
+        model (bool): The response depends on the served model
+    """
+    
+    def decorator(view):
+        endpoint = view.__name__
+        
+        @functools.wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if not getattr(settings, 'RESPONSE_CACHE', True):
+                return view(request, *args, **kwargs)
+            
+            # A later write in this transaction must bump again, or a
+            # response computed from part of its writes would stay current
+            _bumped_scopes().clear()
+            current = _read(scopes)
+            key = _key(endpoint, scopes, current, model, request)
+            etag = quote_etag(key)
+            last_modified = _last_modified(current, model)
+            
+            not_modified = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if not_modified is not None:
+                stats.record_not_modified(endpoint)
+                return _validated(not_modified, etag, last_modified)
+            
+            cache = caches[getattr(settings, 'RESPONSE_CACHE_ALIAS', 'default')]
+            data = cache.get(PREFIX + key)
+            if data is not None:
+                stats.record(endpoint, hit=True)
+                return _validated(Response(data), etag, last_modified)
+            
+            def fill(request=request):
+                return _fill(cache, endpoint, key, last_modified, request, lambda: view(request, *args, **kwargs))
+            
+            stale = _stale(cache, endpoint, request, last_modified)
+            if stale is not None:
+                stale_key, stale_modified, data = stale
+                stats.record_stale(endpoint)
+                _revalidate(key, functools.partial(fill, _detached(request)))
+                stale_etag = quote_etag(stale_key)
+                response = get_conditional_response(
+                    request, etag=stale_etag, last_modified=stale_modified, response=Response(data)
+                )
+                return _validated(response, stale_etag, stale_modified)
+            
+            stats.record(endpoint, hit=False)
+            response, shared = flights.do(key, fill)
+            if shared:
+                # Computed by a concurrent request; this one only waited
+                stats.record_coalesced(endpoint)
+                response = Response(response.data, status=response.status_code)
+            if response.status_code != 200:
+                return response
+            return _validated(response, etag, last_modified)
+        
+        return wrapper
+    
+    return decorator
+
+
+def _fill(cache, endpoint, key, last_modified, request, compute):
+    """
+    Compute and store a missed response, once across workers.
+    
+    With settings.RESPONSE_CACHE_LOCK_TIMEOUT, a worker that finds
+    another one holding the key's lock in the shared cache waits for its
+    result (until the lock is released or times out) instead of
+    computing the same response.
+    """
+    
+    timeout = getattr(settings, 'RESPONSE_CACHE_LOCK_TIMEOUT', 30)
+    lock = f'{PREFIX}lock:{key}'
+    locked = bool(timeout) and cache.add(lock, True, timeout)
+    if timeout and not locked:
+        data = _wait_for(cache, key, lock, timeout)
+        if data is not None:
+            stats.record_coalesced(endpoint)
+            return Response(data)
+    
+    try:
+        response = compute()
+        if response.status_code == 200:
+            cache_timeout = getattr(settings, 'RESPONSE_CACHE_TIMEOUT', 86400)
+            cache.set_many({
+                PREFIX + key: response.data,
+                _stale_key(endpoint, request): (key, last_modified),
+            }, cache_timeout)
+        return response
+    finally:
+        if locked:
+            cache.delete(lock)
+
+
+def _wait_for(cache, key, lock, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        found = cache.get_many([PREFIX + key, lock])
+        if PREFIX + key in found:
+            return found[PREFIX + key]
+        if lock not in found:
+            return None
+        time.sleep(LOCK_POLL_INTERVAL)
+    return None
+
+
+def _stale(cache, endpoint, request, last_modified):
+    """
+    The previous response to the same request, if it may still be served.
+    
+    Within settings.RESPONSE_CACHE_STALE_SECONDS of the write (or model
+    swap, or midnight) that superseded it, the last computed response is
+    served while a background thread computes the new one.
+    
+    Returns:
+        tuple: (cache key, Last-Modified, data) of the stale response, or None
+    """
+    
+    window = getattr(settings, 'RESPONSE_CACHE_STALE_SECONDS', 0)
+    if not window or time.time() - last_modified > window:
+        return None
+    
+    pointer = cache.get(_stale_key(endpoint, request))
+    if pointer is None:
+        return None
+    stale_key, stale_modified = pointer
+    data = cache.get(PREFIX + stale_key)
+    if data is None:
+        return None
+    return stale_key, stale_modified, data
+
+
+def _stale_key(endpoint, request):
+    # The latest response to a request, whatever the data generations
+    parts = [endpoint, *(f'{name}={value}' for name, value in sorted(request.GET.items()))]
+    return f'{PREFIX}stale:' + hashlib.sha1('|'.join(parts).encode()).hexdigest()
+
+
+def _detached(request):
+    """
+    A new GET request with only the path and query parameters of one
+    being answered, for a refresh that outlives it.
+    
+    The server may close or reuse the original request once its stale
+    response is sent; views only read request.GET.
+    """
+    
+    copy = HttpRequest()
+    copy.method = 'GET'
+    copy.path = copy.path_info = request.path
+    copy.GET = request.GET.copy()
+    copy.META['QUERY_STRING'] = request.META.get('QUERY_STRING', '')
+    return Request(copy)
+
+
+def _revalidate(key, fill):
+    if flights.running(key):
+        return
+    threading.Thread(target=_refresh, args=(key, fill), name='response-revalidate', daemon=True).start()
+
+
+def _refresh(key, fill):
+    try:
+        flights.do(key, fill)
+    except Exception:
+        logger.exception("Revalidating cached response %s failed", key)
+    finally:
+        connections.close_all()
+
+
+def _read(scopes):
+    # (generation, last bump) of scopes, in one query
+    if not scopes:
+        return {}
+    found = {
+        scope: (value, changed_at)
+        for scope, value, changed_at in DataGeneration.objects.filter(scope__in=scopes).values_list('scope', 'value', 'changed_at')
+    }
+    return {scope: found.get(scope, (0, None)) for scope in scopes}
+
+
+def _key(endpoint, scopes, current, model, request):
+    from .model_loader import predictor
+    
+    parts = [
+        endpoint,
+        timezone.localdate().isoformat(),
+        predictor.model_version if model else '',
+        *(f'{scope}={current[scope][0]}' for scope in scopes),
+        *(f'{name}={value}' for name, value in sorted(request.GET.items())),
+    ]
+    return hashlib.sha1('|'.join(map(str, parts)).encode()).hexdigest()
+
+
+def _last_modified(current, model):
+    # Responses also change with the date and the served model
+    from .model_loader import predictor
+    
+    today = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    times = [today, *(changed_at for _, changed_at in current.values() if changed_at is not None)]
+    if model and predictor.model_modified is not None:
+        times.append(predictor.model_modified)
+    return int(max(times).timestamp())
+
+
+def _validated(response, etag, last_modified):
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    # Revalidate on every use instead of trusting a heuristic freshness
+    patch_cache_control(response, no_cache=True)
+    return response
+
+
+def _ratio(part, total):
+    return round(part / total, 3) if total else None
+
+
+@receiver([post_save, post_delete], sender=MarketData)
+def _market_data_written(sender, **kwargs):
+    bump('market_data')
+
+
+@receiver([post_save, post_delete], sender=Prediction)
+def _prediction_written(sender, **kwargs):
+    bump('predictions')
+
+
+@receiver([market_data_changed, market_data_loaded])
+def _market_data_loaded(sender, **kwargs):
+    bump('market_data')
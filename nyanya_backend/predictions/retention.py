@@ -0,0 +1,245 @@
+"""
+Prediction Retention and Archival
+
+Keeps the Prediction table to a recent window. Rows older than
+settings.PREDICTION_RETENTION_DAYS (whole days, in the rollup's time
+zone) are moved to gzip-compressed NDJSON files, one per month, under
+settings.PREDICTION_ARCHIVE_DIR:
+    
+    2025-01.ndjson.gz    one JSON object per prediction, every field
+
+- each run adds its rows to a month's file as a new gzip member; the
+  file is rewritten to a temporary name and renamed over the old one,
+  so a crash never leaves a half-written archive
+- rows are deleted only after their archive file is in place, in
+  batches, and without touching PredictionRollup: the dashboard counts
+  keep covering archived days
+- a crash between the two steps leaves rows in both places; readers
+  drop the duplicates by id, and the next run archives them again
+
+predictions_between() reads a date range from the archives and the
+table together, so callers do not need to know where the rows live.
+"""
+
+import gzip
+import json
+import logging
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from pathlib import Path
+
+from django.conf import settings
+from django.utils import timezone
+
+from .models import Prediction
+from .rollup import day_of
+
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIX = '.ndjson.gz'
+
+# Serialized fields, by attribute name
+FIELDS = [field.attname for field in Prediction._meta.concrete_fields]
+
+
+class ArchiveReport:
+    """What one archival run moved"""
+    
+    def __init__(self, cutoff):
+        self.cutoff = cutoff
+        self.archived = 0
+        self.deleted = 0
+        self.months = {}
+        self.elapsed = 0.0
+
+
+def archive_dir():
+    return Path(getattr(settings, 'PREDICTION_ARCHIVE_DIR', Path(settings.BASE_DIR) / 'archive' / 'predictions'))
+
+
+def retention_cutoff(days=None, now=None):
+    """
+    Start of the oldest day that is kept in the table.
+    
+    Args:
+        days (int): Days kept (default: settings.PREDICTION_RETENTION_DAYS)
+        now (datetime): Reference time (default: timezone.now())
+    
+    Returns:
+        datetime: Aware midnight; rows before it are archived
+    """
+    
+    if days is None:
+        days = getattr(settings, 'PREDICTION_RETENTION_DAYS', 180)
+    today = day_of(now or timezone.now())
+    return timezone.make_aware(datetime.combine(today - timedelta(days=days), datetime.min.time()))
+
+
+def archive_predictions(before=None, batch_size=5000, dry_run=False):
+    """
+    Move predictions older than the retention window to the monthly archives.
+    
+    Args:
+        before (datetime): Archive rows with an earlier timestamp
+            (default: retention_cutoff())
+        batch_size (int): Rows read and deleted per query
+        dry_run (bool): Only count what would be archived
+    
+    Returns:
+        ArchiveReport: Rows archived and deleted, per month
+    """
+    
+    start = time.perf_counter()
+    report = ArchiveReport(before or retention_cutoff())
+    expired = Prediction.objects.filter(timestamp__lt=report.cutoff).order_by()
+    
+    if dry_run:
+        for timestamp in expired.values_list('timestamp', flat=True).iterator(chunk_size=batch_size):
+            month = _month_of(timestamp)
+            report.months[month] = report.months.get(month, 0) + 1
+        report.archived = sum(report.months.values())
+        report.elapsed = time.perf_counter() - start
+        return report
+    
+    directory = archive_dir()
+    directory.mkdir(parents=True, exist_ok=True)
+    
+    months = sorted({
+        (day.year, day.month)
+        for day in expired.dates('timestamp', 'month')
+    })
+    for year, month in months:
+        label = f'{year:04d}-{month:02d}'
+        month_start = timezone.make_aware(datetime(year, month, 1))
+        month_end = timezone.make_aware(datetime(year + month // 12, month % 12 + 1, 1))
+        rows = expired.filter(timestamp__gte=month_start, timestamp__lt=month_end)
+        
+        ids = []
+        with tempfile.SpooledTemporaryFile(max_size=1 << 24) as member:
+            with gzip.GzipFile(fileobj=member, mode='wb') as out:
+                for row in rows.order_by('id').values(*FIELDS).iterator(chunk_size=batch_size):
+                    out.write(json.dumps(row, default=_encode).encode() + b'\n')
+                    ids.append(row['id'])
+            if not ids:
+                continue
+            member.seek(0)
+            _append_member(directory / f'{label}{ARCHIVE_SUFFIX}', member)
+        report.archived += len(ids)
+        report.months[label] = len(ids)
+        
+        # The archive is in place; now the rows can go
+        for offset in range(0, len(ids), batch_size):
+            deleted, _ = Prediction.objects.filter(id__in=ids[offset:offset + batch_size]).delete_archived()
+            report.deleted += deleted
+        logger.debug("Archived %d predictions from %s", len(ids), label)
+    
+    report.elapsed = time.perf_counter() - start
+    return report
+
+
+def archived_months():
+    """Months with an archive file, as 'YYYY-MM' strings in order"""
+    
+    directory = archive_dir()
+    if not directory.is_dir():
+        return []
+    return sorted(path.name[:-len(ARCHIVE_SUFFIX)] for path in directory.glob(f'*{ARCHIVE_SUFFIX}'))
+
+
+def read_archive(month):
+    """
+    Predictions archived for one month.
+    
+    Args:
+        month (str): 'YYYY-MM'
+    
+    Yields:
+        Prediction: Unsaved instances with their original id, each id once
+    """
+    
+    fields = [Prediction._meta.get_field(name) for name in FIELDS]
+    seen = set()
+    with gzip.open(archive_dir() / f'{month}{ARCHIVE_SUFFIX}', 'rt') as f:
+        for line in f:
+            row = json.loads(line)
+            if row['id'] in seen:
+                continue
+            seen.add(row['id'])
+            yield Prediction(**{field.attname: field.to_python(row.get(field.attname)) for field in fields})
+
+
+def predictions_between(start, end):
+    """
+    Predictions with start <= timestamp < end, archived or not.
+    
+    Args:
+        start (datetime): Range start (aware)
+        end (datetime): Range end (aware, exclusive)
+    
+    Returns:
+        list: Prediction instances ordered by timestamp; archived ones are
+            unsaved copies
+    """
+    
+    results = {}
+    first, last = _month_of(start), _month_of(end - timedelta(microseconds=1))
+    for month in archived_months():
+        if first <= month <= last:
+            for prediction in read_archive(month):
+                if start <= prediction.timestamp < end:
+                    results[prediction.id] = prediction
+    
+    # Rows still in the table win over archived copies of themselves
+    for prediction in Prediction.objects.filter(timestamp__gte=start, timestamp__lt=end):
+        results[prediction.id] = prediction
+    
+    return sorted(results.values(), key=lambda prediction: (prediction.timestamp, prediction.id))
+
+
+def _encode(value):
+    # Full precision, unlike DjangoJSONEncoder (which keeps milliseconds)
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    raise TypeError(f'{type(value).__name__} is not JSON serializable')
+
+
+def _month_of(timestamp):
+    day = day_of(timestamp)
+    return f'{day.year:04d}-{day.month:02d}'
+
+
+def _append_member(path, member):
+    """
+    Add a gzip member to an archive file atomically.
+    
+    Concatenated gzip members read back as one stream, so the existing
+    file is copied as-is rather than recompressed.
+    """
+    
+    fd, tmp = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.name}.')
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            if path.exists():
+                with open(path, 'rb') as existing:
+                    _copy(existing, out)
+            _copy(member, out)
+            out.flush()
+            os.fsync(out.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        os.remove(tmp)
+        raise
+
+
+def _copy(source, target):
+    while True:
+        block = source.read(1 << 20)
+        if not block:
+            break
+        target.write(block)
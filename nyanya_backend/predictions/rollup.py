@@ -0,0 +1,157 @@
+"""
+Prediction Rollup Maintenance
+
+PredictionRollup keeps one row per (day, predicted_demand) with the
+count, confidence sum and confidence min/max of the predictions in it.
+Days are calendar days in the current time zone (settings.TIME_ZONE),
+the same buckets TruncDate uses.
+
+- add() folds newly written predictions in with atomic increments (one
+  UPDATE per bucket touched), so concurrent writers never lose counts
+- rebuild() recounts whole days from Prediction; used for edits and
+  deletes (a minimum or maximum cannot be decremented) and by the
+  rebuild_prediction_rollup command. Days whose predictions were
+  archived keep their buckets
+
+Both run inside the caller's transaction (Prediction.save/delete and the
+PredictionQuerySet bulk methods), so the rollup never disagrees with the
+committed predictions.
+"""
+
+from datetime import datetime, timedelta
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum, Value
+from django.db.models.functions import Greatest, Least, TruncDate
+from django.utils import timezone
+
+from .models import Prediction, PredictionRollup
+
+
+# Prediction fields the rollup depends on
+FIELDS = {'timestamp', 'predicted_demand', 'confidence_score'}
+
+# Days recounted per query by rebuild()
+DAYS_PER_QUERY = 100
+
+
+def day_of(timestamp):
+    """Rollup day of a prediction timestamp"""
+    
+    if timezone.is_aware(timestamp):
+        timestamp = timezone.localtime(timestamp)
+    return timestamp.date()
+
+
+def on_days(days):
+    """
+    Q matching predictions whose rollup day is one of days.
+    
+    One timestamp range per day rather than timestamp__date__in, which
+    wraps the column in a date cast that no index can serve.
+    """
+    
+    q = Q(pk__in=[])
+    for day in sorted(set(days)):
+        start, end = (
+            timezone.make_aware(datetime.combine(bound, datetime.min.time()))
+            for bound in (day, day + timedelta(days=1))
+        )
+        q |= Q(timestamp__gte=start, timestamp__lt=end)
+    return q
+
+
+def add(predictions):
+    """
+    Count newly created predictions into their buckets.
+    
+    Args:
+        predictions (iterable): Prediction instances just inserted
+    """
+    
+    buckets = {}
+    for prediction in predictions:
+        key = (day_of(prediction.timestamp), prediction.predicted_demand)
+        confidence = float(prediction.confidence_score)
+        if key in buckets:
+            count, total, low, high = buckets[key]
+            buckets[key] = (count + 1, total + confidence, min(low, confidence), max(high, confidence))
+        else:
+            buckets[key] = (1, confidence, confidence, confidence)
+    
+    if not buckets:
+        return
+    
+    with transaction.atomic():
+        # Make sure every bucket exists, then increment it in place
+        PredictionRollup.objects.bulk_create([
+            PredictionRollup(day=day, predicted_demand=demand, confidence_min=low, confidence_max=high)
+            for (day, demand), (_, _, low, high) in buckets.items()
+        ], ignore_conflicts=True)
+        
+        for (day, demand), (count, total, low, high) in buckets.items():
+            PredictionRollup.objects.filter(day=day, predicted_demand=demand).update(
+                count=F('count') + count,
+                confidence_sum=F('confidence_sum') + total,
+                confidence_min=Least('confidence_min', Value(low)),
+                confidence_max=Greatest('confidence_max', Value(high)),
+            )
+
+
+def rebuild(days=None):
+    """
+    Recount buckets from the Prediction table.
+    
+    Days before the oldest prediction still in the table are left alone:
+    their rows may have been archived (predictions.retention), and then
+    the rollup is the only count of them left in the database.
+    
+    Args:
+        days (iterable): Days to recount (None: every day from the oldest
+            prediction in the table on)
+    
+    Returns:
+        int: Rollup rows written
+    """
+    
+    if days is None:
+        oldest = Prediction.objects.order_by('timestamp').values_list('timestamp', flat=True).first()
+        if oldest is None:
+            return 0
+        return _recount(Prediction.objects.all(), PredictionRollup.objects.filter(day__gte=day_of(oldest)))
+    
+    # A bounded number of day ranges per query (SQLite limits expression depth)
+    days = sorted(set(days))
+    with transaction.atomic():
+        return sum(
+            _recount(
+                Prediction.objects.filter(on_days(days[offset:offset + DAYS_PER_QUERY])),
+                PredictionRollup.objects.filter(day__in=days[offset:offset + DAYS_PER_QUERY]),
+            )
+            for offset in range(0, len(days), DAYS_PER_QUERY)
+        )
+
+
+def _recount(predictions, rollups):
+    """Replace rollups with buckets counted from predictions"""
+    
+    buckets = (
+        predictions
+        .order_by()
+        .annotate(day=TruncDate('timestamp'))
+        .values('day', 'predicted_demand')
+        .annotate(
+            count=Count('id'),
+            confidence_sum=Sum('confidence_score'),
+            confidence_min=Min('confidence_score'),
+            confidence_max=Max('confidence_score'),
+        )
+    )
+    
+    with transaction.atomic():
+        rollups.delete()
+        created = PredictionRollup.objects.bulk_create(
+            [PredictionRollup(**bucket) for bucket in buckets],
+            batch_size=1000,
+        )
+    return len(created)
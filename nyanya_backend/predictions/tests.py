@@ -0,0 +1,1436 @@
+"""
+Prediction Tests
+"""
+
+import asyncio
+import os
+import pickle
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import warnings
+from datetime import timedelta
+from decimal import Decimal
+from pathlib import Path
+from unittest import mock, skipUnless
+
+import numpy as np
+import pandas as pd
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection, models, transaction
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date
+from market_data.models import MarketData
+from market_data.signals import market_data_loaded
+
+from .batching import PredictionBatcher
+from .model_loader import (
+    FEATURE_NAMES, ArrayLabelEncoder, PredictionCache, PredictionGrid, TomatoModelLoader,
+    TreeEnsembleEngine, predictor,
+)
+from .registry import MODEL_FILES, ModelRegistry, hash_model_files
+from .prediction_log import PredictionLog, prediction_log
+from . import response_cache, retention, rollup
+from .models import DataGeneration, Prediction, PredictionRollup
+
+
+MODELS_DIR = Path(settings.BASE_DIR).parent / 'models'
+DATA_FILE = Path(settings.BASE_DIR).parent / 'docs' / 'data' / 'combined_file.csv'
+
+
+@skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+class TreeEnsembleEngineTests(SimpleTestCase):
+    """The NumPy engine must reproduce sklearn's probabilities exactly"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+        with open(MODELS_DIR / 'rf_model.pkl', 'rb') as f:
+            cls.forest = pickle.load(f)
+        cls.engine = TreeEnsembleEngine.from_forest(cls.forest)
+    
+    def assert_parity(self, rows):
+        frame = pd.DataFrame(rows, columns=FEATURE_NAMES)
+        np.testing.assert_array_equal(
+            self.engine.predict_proba(frame.to_numpy()),
+            self.forest.predict_proba(frame)
+        )
+    
+    def test_single_row(self):
+        self.assert_parity([[75.0, 23.0, 1, 1, 0, 2, 4, 2024]])
+    
+    def test_random_batch(self):
+        rng = np.random.default_rng(0)
+        n = 5000
+        self.assert_parity(np.column_stack([
+            rng.uniform(0, 300, n).round(1),
+            rng.uniform(10, 35, n).round(2),
+            rng.integers(0, 2, n),
+            rng.integers(0, 2, n),
+            rng.integers(0, 2, n),
+            rng.integers(0, 3, n),
+            rng.integers(0, 12, n),
+            rng.integers(1995, 2026, n),
+        ]).astype(float))
+    
+    def test_split_thresholds(self):
+        # Values sitting exactly on (and just past) every split threshold
+        thresholds = self.engine.threshold[np.isfinite(self.engine.threshold)]
+        features = self.engine.feature[np.isfinite(self.engine.threshold)]
+        rows = np.tile([75.0, 23.0, 1, 1, 0, 2, 4, 2024], (2 * len(thresholds), 1))
+        rows[np.arange(len(thresholds)), features] = thresholds
+        rows[len(thresholds) + np.arange(len(thresholds)), features] = np.nextafter(thresholds, np.inf)
+        self.assert_parity(rows)
+    
+    def test_missing_values(self):
+        self.assert_parity([
+            [np.nan, 23.0, 1, 1, 0, 2, 4, 2024],
+            [80.0, np.nan, 0, 1, 1, 0, 7, 2024],
+        ])
+    
+    def test_anytime_early_exit(self):
+        rng = np.random.default_rng(2)
+        rows = np.column_stack([
+            rng.uniform(0, 300, 2000).round(1),
+            rng.uniform(10, 35, 2000).round(2),
+            rng.integers(0, 2, (2000, 3)),
+            rng.integers(0, 3, 2000),
+            rng.integers(0, 12, 2000),
+            np.full(2000, 2024),
+        ]).astype(float)
+        full = self.engine.predict_proba(rows)
+        
+        probabilities, trees_used, error_bound = self.engine.predict_proba_anytime(rows)
+        
+        # Early exit never changes the label, stays within its error bound
+        # and is exact for rows that needed every tree
+        np.testing.assert_array_equal(probabilities.argmax(axis=1), full.argmax(axis=1))
+        self.assertTrue((np.abs(probabilities - full) <= error_bound[:, np.newaxis] + 1e-12).all())
+        everything = trees_used == self.engine.n_trees
+        np.testing.assert_array_equal(probabilities[everything], full[everything])
+        self.assertLess(trees_used.mean(), self.engine.n_trees)
+    
+    def test_anytime_tree_budget(self):
+        rows = np.array([[75.0, 23.0, 1, 1, 0, 2, 4, 2024]])
+        
+        probabilities, trees_used, error_bound = self.engine.predict_proba_anytime(rows, max_trees=10)
+        
+        self.assertEqual(trees_used[0], 10)
+        self.assertAlmostEqual(error_bound[0], 1 - 10 / self.engine.n_trees)
+        self.assertLessEqual(np.abs(probabilities - self.engine.predict_proba(rows)).max(), error_bound[0])
+    
+    def test_anytime_zero_time_budget(self):
+        rows = np.array([[75.0, 23.0, 1, 1, 0, 2, 4, 2024]])
+        
+        probabilities, trees_used, error_bound = self.engine.predict_proba_anytime(rows, time_budget=0)
+        
+        # One chunk, not the majority a decided label would need
+        self.assertLess(trees_used[0], self.engine.n_trees // 2 + 1)
+        self.assertAlmostEqual(error_bound[0], 1 - trees_used[0] / self.engine.n_trees)
+        self.assertAlmostEqual(probabilities[0].sum(), 1.0)
+    
+    def test_memory_mapped_arrays(self):
+        rng = np.random.default_rng(1)
+        rows = np.column_stack([
+            rng.uniform(0, 300, 500).round(1),
+            rng.uniform(10, 35, 500).round(2),
+            rng.integers(0, 2, (500, 3)),
+            rng.integers(0, 3, 500),
+            rng.integers(0, 12, 500),
+            np.full(500, 2024),
+        ]).astype(float)
+        
+        with tempfile.TemporaryDirectory() as directory:
+            self.engine.save(directory)
+            mapped = TreeEnsembleEngine.load(directory, self.engine.max_depth)
+            self.assertIsInstance(mapped.value.base, np.memmap)
+            np.testing.assert_array_equal(mapped.predict_proba(rows), self.engine.predict_proba(rows))
+            del mapped
+    
+    def test_array_label_encoder(self):
+        with open(MODELS_DIR / 'categorical_encoders.pkl', 'rb') as f:
+            fitted = pickle.load(f)['Month']
+        encoder = ArrayLabelEncoder(np.asarray(fitted.classes_, dtype=str))
+        
+        np.testing.assert_array_equal(encoder.transform(fitted.classes_), fitted.transform(fitted.classes_))
+        np.testing.assert_array_equal(encoder.inverse_transform([0, 11]), fitted.inverse_transform([0, 11]))
+        with self.assertRaises(ValueError):
+            encoder.transform(['Smarch'])
+    
+    @skipUnless(DATA_FILE.exists(), 'combined_file.csv not available')
+    def test_training_data(self):
+        data = pd.read_csv(DATA_FILE)
+        with open(MODELS_DIR / 'categorical_encoders.pkl', 'rb') as f:
+            encoders = pickle.load(f)
+        self.assert_parity(np.column_stack([
+            data['Rainfall_mm'],
+            data['Temperature_C'],
+            data['Market_Day'].str.lower().eq('yes'),
+            data['School_Open'].str.lower().eq('yes'),
+            data['Disease_Alert'].eq('Presence'),
+            encoders['Last_Week_Demand'].transform(data['Last_Week_Demand']),
+            encoders['Month'].transform(data['Month']),
+            data['Year'],
+        ]).astype(float))
+
+
+@skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+class PredictBatchTests(SimpleTestCase):
+    """predict_batch() accepts every batch form and matches predict() row by row"""
+    
+    SCENARIOS = [
+        {'rainfall_mm': 80.0, 'temperature_c': 25.0, 'market_day': True, 'school_open': False,
+         'disease_alert': 'Presence', 'last_week_demand': 'High', 'week': 12, 'month': 'March'},
+        {'rainfall_mm': 12.5, 'temperature_c': 18.0, 'market_day': False, 'school_open': True,
+         'disease_alert': 'Absence', 'last_week_demand': 'Low', 'week': 30, 'month': 'July'},
+        {'rainfall_mm': 150.0, 'temperature_c': 21.5, 'market_day': True, 'school_open': True,
+         'disease_alert': 'Absence', 'last_week_demand': 'Medium', 'week': 48, 'month': 'November'},
+    ]
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+        # Live scoring only, so every row really goes through the batch path
+        cls.loader = TomatoModelLoader(watch_interval=0, grid_mode='off', cache_size=0)
+        cls.expected = [cls.loader.predict(**scenario) for scenario in cls.SCENARIOS]
+    
+    def test_list_of_dicts(self):
+        self.assertEqual(self.loader.predict_batch(self.SCENARIOS), self.expected)
+    
+    def test_dataframe(self):
+        self.assertEqual(self.loader.predict_batch(pd.DataFrame(self.SCENARIOS)), self.expected)
+    
+    def test_structured_array(self):
+        fields = [
+            ('rainfall_mm', 'f8'), ('temperature_c', 'f8'), ('market_day', '?'), ('school_open', '?'),
+            ('disease_alert', 'U8'), ('last_week_demand', 'U6'), ('week', 'i8'), ('month', 'U9'),
+        ]
+        rows = np.array([tuple(scenario[name] for name, _ in fields) for scenario in self.SCENARIOS], dtype=fields)
+        
+        self.assertEqual(self.loader.predict_batch(rows), self.expected)
+    
+    def test_missing_fields_use_predict_defaults(self):
+        self.assertEqual(self.loader.predict_batch([{}, {'week': 5}]), [self.loader.predict()] * 2)
+    
+    def test_empty_batch(self):
+        self.assertEqual(self.loader.predict_batch([]), [])
+        self.assertEqual(self.loader.predict_batch(pd.DataFrame(self.SCENARIOS[:0])), [])
+    
+    def test_unknown_category_fails_the_batch(self):
+        with self.assertRaisesRegex(ValueError, 'Smarch'):
+            self.loader.predict_batch([self.SCENARIOS[0], {**self.SCENARIOS[1], 'month': 'Smarch'}])
+
+
+class PredictionCacheTests(SimpleTestCase):
+    """Memoized rows are keyed on features and version, LRU and TTL bounded"""
+    
+    ROWS = np.array([[75.0, 23.0, 1, 1, 0, 2, 4, 2024], [80.0, 21.5, 0, 1, 0, 1, 7, 2024]])
+    PROBA = np.array([[0.1, 0.2, 0.7], [0.5, 0.25, 0.25]])
+    
+    def test_hits_and_misses(self):
+        cache = PredictionCache(max_size=10)
+        cache.put_many('v1', self.ROWS[:1], self.PROBA[:1])
+        
+        probabilities, hits = cache.get_many('v1', self.ROWS, 3)
+        
+        np.testing.assert_array_equal(hits, [True, False])
+        np.testing.assert_array_equal(probabilities[0], self.PROBA[0])
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+    
+    def test_keyed_on_model_version(self):
+        cache = PredictionCache(max_size=10)
+        cache.put_many('v1', self.ROWS, self.PROBA)
+        
+        self.assertFalse(cache.get_many('v2', self.ROWS, 3)[1].any())
+    
+    def test_least_recently_used_is_evicted(self):
+        cache = PredictionCache(max_size=1)
+        cache.put_many('v1', self.ROWS, self.PROBA)
+        
+        np.testing.assert_array_equal(cache.get_many('v1', self.ROWS, 3)[1], [False, True])
+        self.assertEqual(cache.evictions, 1)
+    
+    def test_expired_entries_miss(self):
+        cache = PredictionCache(max_size=10, ttl=1e-9)
+        cache.put_many('v1', self.ROWS, self.PROBA)
+        
+        self.assertFalse(cache.get_many('v1', self.ROWS, 3)[1].any())
+        self.assertEqual(cache.info()['size'], 0)
+
+
+def linear_proba(features):
+    """Stand-in scorer whose probabilities are two-decimal values like 0.51"""
+    
+    x = features.to_numpy()
+    low = 0.01 * x[:, 0] + 0.1 * x[:, 2] + 0.1 * x[:, 5] + 0.01 * x[:, 6]
+    high = 0.01 * x[:, 1]
+    return np.column_stack([low, high, 1 - low - high])
+
+
+class PredictionGridTests(SimpleTestCase):
+    """Grid answers match the live scorer on the lattice and fall back off it"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.grid = PredictionGrid.build(
+            linear_proba, n_last_week=3, n_month=12,
+            rainfall=(0.0, 20.0, 5.0), temperature=(10.0, 12.0, 0.5), version='v1',
+        )
+    
+    def rows(self, *rows):
+        return np.array(rows, dtype=np.float64)
+    
+    def live(self, rows):
+        return linear_proba(pd.DataFrame(rows, columns=FEATURE_NAMES))
+    
+    def test_build(self):
+        self.assertEqual(self.grid.probabilities.shape, (3, 12, 2, 2, 2, 5, 5, 3))
+        self.assertEqual(self.grid.probabilities.dtype, np.uint16)
+        np.testing.assert_array_equal(self.grid.rainfall_axis, [0.0, 5.0, 10.0, 15.0, 20.0])
+        np.testing.assert_array_equal(self.grid.temperature_axis, [10.0, 10.5, 11.0, 11.5, 12.0])
+    
+    def test_exact_lookup_matches_live(self):
+        rows = self.rows(
+            [20.0, 10.5, 1, 1, 0, 2, 1, 2024],
+            [5.0, 12.0, 0, 1, 1, 0, 11, 2024],
+            [0.0, 10.0, 1, 0, 0, 1, 0, 2024],
+        )
+        
+        probabilities, hits = self.grid.lookup(rows)
+        
+        self.assertTrue(hits.all())
+        np.testing.assert_allclose(probabilities, self.live(rows), rtol=0, atol=PredictionGrid.QUANTIZATION_ERROR)
+        self.assertEqual(round(probabilities[0, 0], 2), 0.51)
+    
+    def test_exact_lookup_misses_off_lattice(self):
+        rows = self.rows([7.4, 10.5, 1, 1, 0, 2, 4, 2024], [5.0, 10.6, 1, 1, 0, 2, 4, 2024])
+        
+        self.assertFalse(self.grid.lookup(rows)[1].any())
+    
+    def test_nearest_lookup_snaps_to_closest_cell(self):
+        rows = self.rows([7.4, 10.6, 1, 1, 0, 2, 4, 2024], [7.6, 11.9, 0, 0, 1, 1, 3, 2024])
+        
+        probabilities, hits = self.grid.lookup(rows, nearest=True)
+        
+        self.assertTrue(hits.all())
+        np.testing.assert_allclose(probabilities, self.live(self.rows(
+            [5.0, 10.5, 1, 1, 0, 2, 4, 2024], [10.0, 12.0, 0, 0, 1, 1, 3, 2024],
+        )), rtol=0, atol=PredictionGrid.QUANTIZATION_ERROR)
+    
+    def test_rows_outside_the_grid_fall_back(self):
+        rows = self.rows(
+            [40.0, 11.0, 1, 1, 0, 2, 4, 2024],    # rainfall out of range
+            [5.0, 9.0, 1, 1, 0, 2, 4, 2024],      # temperature out of range
+            [np.nan, 11.0, 1, 1, 0, 2, 4, 2024],  # missing value
+            [5.0, 11.0, 1, 1, 0, 3, 4, 2024],     # unknown Last_Week_Demand
+            [5.0, 11.0, 1, 1, 0, 2, 12, 2024],    # unknown Month
+            [5.0, 11.0, 2, 1, 0, 2, 4, 2024],     # non-binary flag
+            [5.0, 11.0, 1, 1, 0, 2, 4, 2023],     # another year
+        )
+        
+        for nearest in (False, True):
+            probabilities, hits = self.grid.lookup(rows, nearest=nearest)
+            self.assertFalse(hits.any())
+            self.assertEqual(probabilities.shape, (7, 3))
+    
+    def test_error_report(self):
+        # Snapping moves rainfall by at most 2.5 mm and temperature by 0.25 C
+        self.assertGreater(self.grid.max_error, 0)
+        self.assertLessEqual(self.grid.max_error, 0.01 * 2.5 + 0.01 * 0.25 + PredictionGrid.QUANTIZATION_ERROR)
+        self.assertTrue(0 <= self.grid.label_agreement <= 1)
+        
+        info = self.grid.info()
+        self.assertEqual(info['cells'], 3 * 12 * 8 * 25)
+        self.assertEqual(info['quantization_error'], 0.5 / 65535)
+        self.assertEqual((info['max_error'], info['label_agreement']), (self.grid.max_error, self.grid.label_agreement))
+    
+    def test_save_and_load(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'grid.npy')
+            self.grid.save(path)
+            loaded = PredictionGrid.load(path)
+            
+            np.testing.assert_array_equal(loaded.probabilities, self.grid.probabilities)
+            self.assertEqual((loaded.version, loaded.max_error), ('v1', self.grid.max_error))
+            del loaded
+    
+    def test_other_dtype_is_rebuilt(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = str(Path(directory) / 'grid.npy')
+            PredictionGrid(
+                self.grid.probabilities / PredictionGrid.SCALE, self.grid.rainfall_axis,
+                self.grid.temperature_axis, 'v1',
+            ).save(path)
+            
+            with self.assertRaises(ValueError):
+                PredictionGrid.load(path)
+
+
+class ModelRegistryTests(SimpleTestCase):
+    """Versions are published whole and CURRENT only ever names a complete one"""
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.registry = ModelRegistry(self.root / 'models')
+    
+    def model_files(self, name, content):
+        path = self.root / name
+        path.mkdir()
+        for file_name in MODEL_FILES:
+            (path / file_name).write_bytes(f'{file_name} {content}'.encode())
+        return str(path)
+    
+    def test_flat_layout(self):
+        self.assertIsNone(self.registry.current_path())
+        
+        flat = self.model_files('models', 'flat')
+        
+        self.assertIsNone(self.registry.current_version())
+        self.assertEqual(self.registry.current_path(), flat)
+    
+    def test_publish_and_activate(self):
+        source = self.model_files('incoming', 'v1')
+        
+        version = self.registry.publish(source)
+        
+        self.assertEqual(version, hash_model_files(source))
+        self.assertEqual(self.registry.current_version(), version)
+        self.assertEqual(self.registry.current_path(), self.registry.version_path(version))
+        self.assertEqual(self.registry.versions(), [version])
+        # Republishing the same files is a no-op
+        self.assertEqual(self.registry.publish(source), version)
+        self.assertEqual(os.listdir(self.registry.versions_dir), [version])
+    
+    def test_publish_without_activating(self):
+        first = self.registry.publish(self.model_files('first', 'v1'))
+        second = self.registry.publish(self.model_files('second', 'v2'), activate=False)
+        
+        self.assertEqual(self.registry.current_version(), first)
+        self.assertCountEqual(self.registry.versions(), [first, second])
+    
+    def test_rollback(self):
+        first = self.registry.publish(self.model_files('first', 'v1'))
+        self.registry.publish(self.model_files('second', 'v2'))
+        
+        self.registry.activate(first)
+        
+        self.assertEqual(self.registry.current_version(), first)
+        with self.assertRaises(ValueError):
+            self.registry.activate('unknown')
+        self.assertEqual(self.registry.current_version(), first)
+    
+    def test_pointer_is_replaced_atomically(self):
+        first = self.registry.publish(self.model_files('first', 'v1'))
+        second = self.registry.publish(self.model_files('second', 'v2'), activate=False)
+        
+        with mock.patch('predictions.registry.os.replace', side_effect=OSError('disk full')):
+            with self.assertRaises(OSError):
+                self.registry.activate(second)
+        
+        # The new pointer is written aside; CURRENT still names a whole version
+        self.assertEqual(self.registry.current_version(), first)
+    
+    def test_failed_copy_leaves_no_version(self):
+        first = self.registry.publish(self.model_files('first', 'v1'))
+        copy2 = shutil.copy2
+        
+        def copy_one(source, target):
+            if source.endswith(MODEL_FILES[-1]):
+                raise OSError('disk full')
+            return copy2(source, target)
+        
+        with mock.patch('predictions.registry.shutil.copy2', side_effect=copy_one):
+            with self.assertRaises(OSError):
+                self.registry.publish(self.model_files('second', 'v2'))
+        
+        self.assertEqual(os.listdir(self.registry.versions_dir), [first])
+        self.assertEqual(self.registry.current_version(), first)
+    
+    def test_missing_files_are_rejected(self):
+        source = self.model_files('incoming', 'v1')
+        os.remove(os.path.join(source, 'metadata.pkl'))
+        
+        with self.assertRaises(ValueError):
+            self.registry.publish(source)
+
+
+@skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+class ModelHotSwapTests(SimpleTestCase):
+    """Workers swap to the version CURRENT names without serving a mix of both"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.root = Path(directory.name)
+        self.registry = ModelRegistry(self.root / 'models')
+        self.first = self.registry.publish(self.model_files('first', accuracy=0.9))
+        self.second = self.registry.publish(self.model_files('second', accuracy=0.95), activate=False)
+        
+        self.loader = TomatoModelLoader(
+            models_dir=self.registry.root, watch_interval=0, use_arrays=False,
+            grid_rainfall=(70.0, 80.0, 5.0), grid_temperature=(20.0, 22.0, 0.5),
+        )
+        # Grids are built in the test thread, never behind its back
+        for patcher in (mock.patch.object(self.loader, '_start_grid_build'),
+                        mock.patch('predictions.model_loader.logger')):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.loader.warm_up()
+    
+    def model_files(self, name, accuracy):
+        """The shipped model under a metadata.pkl of its own, so each is a new version"""
+        
+        path = self.root / name
+        path.mkdir()
+        for file_name in MODEL_FILES:
+            shutil.copy2(MODELS_DIR / file_name, path / file_name)
+        with open(MODELS_DIR / 'metadata.pkl', 'rb') as f:
+            metadata = pickle.load(f)
+        with open(path / 'metadata.pkl', 'wb') as f:
+            pickle.dump({**metadata, 'accuracy': accuracy}, f)
+        return str(path)
+    
+    def test_serves_current_version(self):
+        self.assertEqual(self.loader.model_version, self.first)
+        self.assertEqual(self.loader.prediction_grid.version, self.first)
+        self.assertFalse(self.loader.check_for_update())
+    
+    def test_swap_clears_grid_and_prediction_cache(self):
+        self.loader.predict(rainfall_mm=75.0, temperature_c=21.0)
+        self.assertGreater(self.loader.prediction_cache.info()['size'], 0)
+        old_grid = self.loader.prediction_grid
+        
+        self.registry.activate(self.second)
+        self.assertTrue(self.loader.check_for_update())
+        
+        self.assertEqual(self.loader.model_version, self.second)
+        self.assertEqual(self.loader.metadata['accuracy'], 0.95)
+        self.assertEqual(self.loader.prediction_cache.info()['size'], 0)
+        # The old version's grid is never served for the new one
+        self.assertIsNone(self.loader.prediction_grid)
+        self.assertEqual(old_grid.version, self.first)
+        self.assertEqual(self.loader.build_grid().version, self.second)
+    
+    def test_rollback(self):
+        self.registry.activate(self.second)
+        self.loader.check_for_update()
+        
+        self.registry.activate(self.first)
+        
+        self.assertTrue(self.loader.check_for_update())
+        self.assertEqual(self.loader.model_version, self.first)
+        self.assertEqual(self.loader.metadata['accuracy'], 0.9)
+    
+    def test_failed_load_keeps_serving(self):
+        with open(os.path.join(self.registry.version_path(self.second), 'rf_model.pkl'), 'wb') as f:
+            f.write(b'not a pickle')
+        self.registry.activate(self.second)
+        
+        with mock.patch('predictions.model_loader.logger') as logger:
+            self.assertFalse(self.loader.check_for_update())
+        
+        logger.error.assert_called_once()
+        self.assertEqual(self.loader.model_version, self.first)
+        self.assertEqual(len(self.loader.predict_batch([{'week': 1}, {'week': 2}])), 2)
+
+
+@skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+class ModelLoadingTests(SimpleTestCase):
+    """The model is read from MODELS_DIR once, on first use or warm_up()"""
+    
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        warnings.filterwarnings('ignore', category=UserWarning, module='sklearn')
+    
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.models_dir = directory.name
+        for file_name in MODEL_FILES:
+            shutil.copy2(MODELS_DIR / file_name, self.models_dir)
+        
+        patcher = mock.patch('predictions.model_loader.logger')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def loader(self, **options):
+        return TomatoModelLoader(**{
+            'models_dir': self.models_dir, 'watch_interval': 0, 'use_arrays': False,
+            'grid_rainfall': (70.0, 80.0, 5.0), 'grid_temperature': (20.0, 22.0, 0.5), **options,
+        })
+    
+    def test_models_dir_setting(self):
+        with override_settings(MODELS_DIR=Path(self.models_dir)):
+            loader = TomatoModelLoader(watch_interval=0, grid_mode='off')
+        
+        self.assertEqual(loader.models_dir, self.models_dir)
+        self.assertEqual(loader.model_path, os.path.join(self.models_dir, 'rf_model.pkl'))
+        self.assertTrue(loader.is_trained)
+        self.assertEqual(loader.model_dir, self.models_dir)
+    
+    def test_nothing_is_loaded_until_first_use(self):
+        loader = self.loader(grid_mode='off')
+        
+        with mock.patch.object(loader, 'load_model', wraps=loader.load_model) as load_model:
+            self.assertIsNone(loader._bundle)
+            
+            loader.predict()
+            loader.predict()
+        
+        load_model.assert_called_once()
+    
+    def test_concurrent_first_callers_load_once(self):
+        loader = self.loader(grid_mode='off')
+        load_model = loader.load_model
+        
+        def slow_load():
+            # Long enough for every thread to reach _loaded() meanwhile
+            time.sleep(0.1)
+            return load_model()
+        
+        results = []
+        with mock.patch.object(loader, 'load_model', side_effect=slow_load) as patched:
+            threads = [threading.Thread(target=lambda: results.append(loader.predict())) for _ in range(8)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        
+        patched.assert_called_once()
+        self.assertEqual(results, [loader.predict()] * 8)
+    
+    def test_missing_model_files(self):
+        os.remove(os.path.join(self.models_dir, 'rf_model.pkl'))
+        loader = self.loader()
+        
+        self.assertFalse(loader.is_trained)
+        self.assertFalse(loader.warm_up())
+        self.assertFalse(loader.get_model_info()['is_trained'])
+        with self.assertRaises(ValueError):
+            loader.predict()
+    
+    def test_warm_up(self):
+        loader = self.loader()
+        
+        with mock.patch.object(loader, '_start_grid_build'):
+            self.assertTrue(loader.warm_up())
+            # The grid is ready before the first request, not built behind it
+            self.assertEqual(loader.prediction_grid.version, loader.model_version)
+            self.assertEqual(loader.prediction_cache.info()['size'], 1)
+            
+            with mock.patch.object(loader, 'load_model') as load_model:
+                self.assertTrue(loader.warm_up())
+            load_model.assert_not_called()
+    
+    def test_flat_files_overwritten_in_place_are_swapped_in(self):
+        loader = self.loader(grid_mode='off')
+        loader.warm_up()
+        first = loader.model_version
+        self.assertFalse(loader.check_for_update())
+        
+        path = os.path.join(self.models_dir, 'metadata.pkl')
+        with open(path, 'rb') as f:
+            metadata = pickle.load(f)
+        with open(path, 'wb') as f:
+            pickle.dump({**metadata, 'accuracy': 0.5}, f)
+        os.utime(path, (time.time() + 60, time.time() + 60))
+        
+        self.assertTrue(loader.check_for_update())
+        self.assertNotEqual(loader.model_version, first)
+        self.assertEqual(loader.metadata['accuracy'], 0.5)
+        self.assertFalse(loader.check_for_update())
+    
+    def test_saving_a_grid_removes_stale_ones(self):
+        for name in ('prediction_grid_old_12345678.npy', 'prediction_grid_old_12345678.json'):
+            Path(self.models_dir, name).write_bytes(b'')
+        loader = self.loader()
+        
+        with mock.patch.object(loader, '_start_grid_build'):
+            loader.warm_up()
+        
+        grids = sorted(name for name in os.listdir(self.models_dir) if name.startswith('prediction_grid_'))
+        base = os.path.splitext(os.path.basename(loader.grid_path()))[0]
+        self.assertEqual(grids, [f'{base}.json', f'{base}.npy'])
+    
+    def test_preload_setting(self):
+        config = apps.get_app_config('predictions')
+        
+        with mock.patch.object(predictor, 'warm_up') as warm_up:
+            with override_settings(PRELOAD_MODEL=False):
+                config.ready()
+            warm_up.assert_not_called()
+            
+            with override_settings(PRELOAD_MODEL=True):
+                config.ready()
+            warm_up.assert_called_once()
+
+
+class SingleFlightTests(SimpleTestCase):
+    """Concurrent calls for one key share a single computation"""
+    
+    def test_concurrent_callers_share_one_call(self):
+        flights = response_cache.SingleFlight()
+        calls = []
+        started = threading.Event()
+        
+        def compute():
+            calls.append(1)
+            started.set()
+            time.sleep(0.1)
+            return 'payload'
+        
+        results = []
+        leader = threading.Thread(target=lambda: results.append(flights.do('key', compute)))
+        leader.start()
+        started.wait()
+        followers = [threading.Thread(target=lambda: results.append(flights.do('key', compute))) for _ in range(4)]
+        for thread in followers:
+            thread.start()
+        for thread in [leader, *followers]:
+            thread.join()
+        
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(sorted(results), [('payload', False)] + [('payload', True)] * 4)
+        self.assertFalse(flights.running('key'))
+        
+        # Finished calls are not reused
+        self.assertEqual(flights.do('key', lambda: 'again'), ('again', False))
+    
+    def test_errors_reach_every_caller(self):
+        flights = response_cache.SingleFlight()
+        started = threading.Event()
+        errors = []
+        
+        def fail():
+            started.set()
+            time.sleep(0.1)
+            raise ValueError('model missing')
+        
+        def call():
+            try:
+                flights.do('key', fail)
+            except ValueError as e:
+                errors.append(str(e))
+        
+        threads = [threading.Thread(target=call)]
+        threads[0].start()
+        started.wait()
+        threads.append(threading.Thread(target=call))
+        threads[1].start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(errors, ['model missing', 'model missing'])
+
+
+class EchoLoader:
+    """Stands in for the predictor: echoes each row's week, fails on week 0"""
+    
+    def __init__(self):
+        self.batch_sizes = []
+        # Cleared, batches wait in predict_batch() until it is set again
+        self.released = threading.Event()
+        self.released.set()
+    
+    def predict_batch(self, scenarios):
+        self.batch_sizes.append(len(scenarios))
+        self.released.wait()
+        if any(scenario['week'] == 0 for scenario in scenarios):
+            raise ValueError('Prediction failed: bad week')
+        return [(str(scenario['week']), 1.0) for scenario in scenarios]
+
+
+class PredictionBatcherTests(SimpleTestCase):
+    """Concurrent calls share batches and still get their own results"""
+    
+    def setUp(self):
+        self.loader = EchoLoader()
+        self.batcher = PredictionBatcher(self.loader, enabled=True, window_ms=50, max_rows=64)
+    
+    def run_threads(self, weeks, hold=False):
+        """
+        Call predict() from one thread per week.
+        
+        With hold, the first batch is held in the loader until every other
+        call is queued, so the calls are concurrent however the threads
+        get scheduled.
+        """
+        
+        results = {}
+        
+        def call(week):
+            try:
+                results[week] = self.batcher.predict(week=week)
+            except ValueError as e:
+                results[week] = e
+        
+        if hold:
+            self.loader.released.clear()
+        threads = [threading.Thread(target=call, args=(week,)) for week in weeks]
+        for thread in threads:
+            thread.start()
+        
+        deadline = time.monotonic() + 5
+        while not self.loader.released.is_set() and time.monotonic() < deadline:
+            if sum(self.loader.batch_sizes) + self.batcher._queue.qsize() == len(threads):
+                break
+            time.sleep(0.001)
+        self.loader.released.set()
+        
+        for thread in threads:
+            thread.join()
+        return results
+    
+    def test_concurrent_calls_are_coalesced(self):
+        results = self.run_threads(range(1, 33), hold=True)
+        
+        self.assertEqual(results, {week: (str(week), 1.0) for week in range(1, 33)})
+        self.assertLess(len(self.loader.batch_sizes), 32)
+        
+        metrics = self.batcher.metrics.snapshot()
+        self.assertEqual(metrics['requests'], 32)
+        self.assertEqual(metrics['rows'], 32)
+        self.assertGreater(metrics['mean_requests_per_batch'], 1)
+    
+    def test_bad_row_only_fails_its_caller(self):
+        results = self.run_threads(range(0, 8))
+        
+        self.assertIsInstance(results[0], ValueError)
+        self.assertEqual(results[5], ('5', 1.0))
+    
+    def test_max_rows_caps_batch(self):
+        self.batcher.max_rows = 4
+        self.run_threads(range(1, 17))
+        
+        self.assertLessEqual(max(self.loader.batch_sizes), 4)
+    
+    def test_async_callers(self):
+        async def gather():
+            return await asyncio.gather(*(self.batcher.apredict(week=week) for week in range(1, 9)))
+        
+        self.assertEqual(asyncio.run(gather()), [(str(week), 1.0) for week in range(1, 9)])
+        self.assertLess(len(self.loader.batch_sizes), 8)
+    
+    def test_disabled_scores_inline(self):
+        batcher = PredictionBatcher(self.loader, enabled=False)
+        
+        self.assertEqual(batcher.predict_batch([{'week': 3}, {'week': 4}]), [('3', 1.0), ('4', 1.0)])
+        self.assertEqual(batcher.metrics.snapshot()['batches'], 0)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class DashboardCardsTests(TestCase):
+    """dashboard-cards counts and query budget"""
+    
+    def setUp(self):
+        cache.clear()
+    
+    def test_counts_in_one_query(self):
+        now = timezone.now()
+        for days, demand in ((1, 'High'), (3, 'Low'), (10, 'High'), (40, 'Medium'), (90, 'High')):
+            Prediction.objects.create(
+                timestamp=now - timedelta(days=days), week=1, year=2025,
+                predicted_demand=demand, confidence_score=0.8,
+            )
+        
+        # The data generations, then the counts
+        with self.assertNumQueries(2):
+            cards = self.client.get(reverse('dashboard-cards')).json()
+        
+        self.assertEqual(cards['total_predictions']['value'], '5')
+        self.assertEqual(cards['total_predictions']['change'], '+200%')
+        self.assertEqual(cards['weekly_predictions']['value'], '2')
+        self.assertEqual(cards['weekly_predictions']['change'], '+100%')
+        self.assertEqual(cards['high_demand_weeks']['value'], '3')
+    
+    def test_agricultural_tips_read_the_rollup(self):
+        for demand in ('High', 'High', 'High', 'Low'):
+            Prediction.objects.create(week=1, year=2025, predicted_demand=demand, confidence_score=0.9)
+        
+        with self.assertNumQueries(3):
+            tips = self.client.get(reverse('agricultural-tips')).json()['tips']
+        
+        texts = [tip['text'] for tip in tips]
+        self.assertIn('High demand trend (8/10 recent predictions) - consider expanding production', texts)
+        self.assertIn('High prediction confidence (90%) - good time for planning', texts)
+
+
+@skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class DashboardBundleTests(TestCase):
+    """The bundle endpoint against the per-section endpoints"""
+    
+    ENDPOINTS = {
+        'cards': 'dashboard-cards', 'current': 'current-week-prediction', 'chart': 'chart-data',
+        'simulation': 'simulate-weeks', 'status': 'status-cards', 'market_insights': 'market-insights',
+        'business_insights': 'business-insights', 'tips': 'agricultural-tips',
+    }
+    
+    @classmethod
+    def setUpTestData(cls):
+        demands = ['High', 'Medium', 'Low']
+        MarketData.objects.bulk_create([
+            MarketData(
+                year=year, week=week, month='March', rainfall_mm=20 + week * 5, temperature_c=18 + week % 10,
+                market_day=week % 2 == 0, disease_alert='Presence' if week == 30 else 'Absence',
+                last_week_demand=demands[(week + 1) % 3], market_demand=demands[week % 3],
+            )
+            for year in (2024, 2025)
+            for week in range(1, 31)
+        ])
+        for demand in ('High', 'High', 'Low'):
+            Prediction.objects.create(week=1, year=2025, predicted_demand=demand, confidence_score=0.9)
+    
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(response_cache, 'stats', response_cache.ResponseCacheStats())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def test_matches_the_section_endpoints(self):
+        with self.assertNumQueries(4):
+            bundle = self.client.get(reverse('dashboard'), {'end': 25}).json()
+        
+        self.assertEqual(list(bundle), ['cards', 'current', 'chart', 'simulation', 'status', 'market_insights', 'business_insights', 'tips'])
+        for section, name in self.ENDPOINTS.items():
+            expected = self.client.get(reverse(name), {'end': 25} if section == 'simulation' else {}).json()
+            if section == 'tips':
+                expected.pop('last_updated')
+                bundle[section].pop('last_updated')
+            self.assertEqual(bundle[section], expected, section)
+        self.assertEqual(bundle['simulation']['total_frames'], 25)
+    
+    def test_sections(self):
+        with self.assertNumQueries(3):
+            bundle = self.client.get(reverse('dashboard'), {'sections': 'status,cards'}).json()
+        self.assertEqual(list(bundle), ['cards', 'status'])
+        
+        response = self.client.get(reverse('dashboard'), {'sections': 'cards,weather'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('weather', response.json()['error'])
+    
+    def test_simulation_scores_in_one_batch(self):
+        with mock.patch.object(predictor, 'predict_batch', wraps=predictor.predict_batch) as predict_batch:
+            frames = self.client.get(reverse('simulate-weeks'), {'end': 25}).json()['total_frames']
+        
+        self.assertEqual(frames, 25)
+        predict_batch.assert_called_once()
+        self.assertEqual(len(predict_batch.call_args.args[0]), 25)
+    
+    def test_bundle_scores_in_one_batch(self):
+        with mock.patch.object(predictor, 'predict_batch', wraps=predictor.predict_batch) as predict_batch:
+            self.client.get(reverse('dashboard'), {'end': 25})
+        
+        # The current week and every simulated week
+        predict_batch.assert_called_once()
+        self.assertEqual(len(predict_batch.call_args.args[0]), 26)
+    
+    def test_repeat_requests_hit_with_logging_enabled(self):
+        params = {'start': 1, 'end': 50}
+        first = self.client.get(reverse('dashboard'), params)
+        generations = response_cache.generations()
+        # Whatever the request logged reaches the table
+        prediction_log.flush()
+        
+        with self.assertNumQueries(1):
+            second = self.client.get(reverse('dashboard'), params)
+        
+        self.assertEqual(response_cache.stats.snapshot()['dashboard_bundle']['hits'], 1)
+        self.assertEqual(second.json(), first.json())
+        self.assertEqual(second['ETag'], first['ETag'])
+        self.assertEqual(response_cache.generations(), generations)
+    
+    def test_unchanged_bundle_answers_304_with_logging_enabled(self):
+        params = {'start': 1, 'end': 50, 'year': 2025}
+        etag = self.client.get(reverse('dashboard'), params)['ETag']
+        prediction_log.flush()
+        
+        response = self.client.get(reverse('dashboard'), params, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+    
+    def test_simulation_revalidates_against_the_model(self):
+        response = self.client.get(reverse('simulate-weeks'), {'start': 1, 'end': 50})
+        self.assertGreaterEqual(parse_http_date(response['Last-Modified']), int(predictor.model_modified.timestamp()))
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('simulate-weeks'), {'start': 1, 'end': 50}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        
+        with mock.patch.object(type(predictor), 'model_version', 'retrained'):
+            response = self.client.get(reverse('simulate-weeks'), {'start': 1, 'end': 50}, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ALLOWED_HOSTS=['testserver'])
+class ResponseCacheTests(TestCase):
+    """Dashboard responses cached until a write bumps their data generation"""
+    
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch.object(response_cache, 'stats', response_cache.ResponseCacheStats())
+        patcher.start()
+        self.addCleanup(patcher.stop)
+    
+    def cards(self):
+        return self.client.get(reverse('dashboard-cards')).json()['total_predictions']['value']
+    
+    def test_repeat_request_reads_only_the_generations(self):
+        self.assertEqual(self.cards(), '0')
+        with self.assertNumQueries(1):
+            self.assertEqual(self.cards(), '0')
+        
+        self.assertEqual(
+            response_cache.stats.snapshot()['dashboard_cards'],
+            {'hits': 1, 'misses': 1, 'not_modified': 0, 'coalesced': 0, 'stale': 0, 'hit_ratio': 0.5},
+        )
+    
+    def test_unchanged_data_answers_304(self):
+        response = self.client.get(reverse('dashboard-cards'))
+        etag = response['ETag']
+        self.assertRegex(etag, r'^"[0-9a-f]{40}"$')
+        self.assertIn('no-cache', response['Cache-Control'])
+        
+        with self.assertNumQueries(1):
+            response = self.client.get(reverse('dashboard-cards'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        
+        # Other parameters are another representation
+        response = self.client.get(reverse('dashboard-cards'), {'year': 2024}, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        
+        with transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+        response = self.client.get(reverse('dashboard-cards'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        self.assertEqual(response.json()['total_predictions']['value'], '1')
+        self.assertEqual(response_cache.stats.snapshot()['dashboard_cards']['not_modified'], 1)
+    
+    def test_if_modified_since(self):
+        with transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+        last_modified = self.client.get(reverse('agricultural-tips'))['Last-Modified']
+        self.assertEqual(
+            parse_http_date(last_modified),
+            int(DataGeneration.objects.get(scope='predictions').changed_at.timestamp()),
+        )
+        
+        response = self.client.get(reverse('agricultural-tips'), HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+        
+        earlier = http_date(parse_http_date(last_modified) - 1)
+        response = self.client.get(reverse('agricultural-tips'), HTTP_IF_MODIFIED_SINCE=earlier)
+        self.assertEqual(response.status_code, 200)
+    
+    def test_prediction_writes_invalidate(self):
+        self.assertEqual(self.cards(), '0')
+        
+        # Each atomic block stands for a committed transaction
+        with transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+        self.assertEqual(self.cards(), '1')
+        
+        with transaction.atomic():
+            Prediction.objects.bulk_create([
+                Prediction(week=2, year=2025, predicted_demand='Low', confidence_score=0.7) for _ in range(3)
+            ])
+        self.assertEqual(self.cards(), '4')
+        
+        with transaction.atomic():
+            Prediction.objects.filter(week=2).delete()
+        self.assertEqual(self.cards(), '1')
+    
+    def test_rolled_back_write_keeps_the_generation(self):
+        before = response_cache.generations()
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+            raise RuntimeError
+        self.assertEqual(response_cache.generations(), before)
+    
+    def test_one_bump_per_transaction(self):
+        # Runs the on_commit hooks, as a commit would
+        with self.captureOnCommitCallbacks(execute=True):
+            for week in range(1, 6):
+                MarketData.objects.create(year=2025, week=week, rainfall_mm=50, temperature_c=20)
+        before = response_cache.generations()
+        
+        with transaction.atomic():
+            MarketData.objects.filter(year=2025).delete()
+        
+        self.assertEqual(response_cache.generations(), {**before, 'market_data': before['market_data'] + 1})
+    
+    def test_rolled_back_savepoint_bumps_again(self):
+        before = response_cache.generations()['predictions']
+        with transaction.atomic():
+            with self.assertRaises(RuntimeError), transaction.atomic():
+                Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+                raise RuntimeError
+            for _ in range(3):
+                Prediction.objects.create(week=1, year=2025, predicted_demand='Low', confidence_score=0.6)
+        
+        self.assertEqual(response_cache.generations()['predictions'], before + 1)
+    
+    def test_commit_forgets_the_bumped_scopes(self):
+        before = response_cache.generations()['predictions']
+        for _ in range(2):
+            with self.captureOnCommitCallbacks(execute=True):
+                Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+                Prediction.objects.create(week=1, year=2025, predicted_demand='Low', confidence_score=0.6)
+        
+        self.assertEqual(response_cache.generations()['predictions'], before + 2)
+    
+    def test_market_data_writes_leave_prediction_responses_cached(self):
+        self.cards()
+        self.client.get(reverse('status-cards'))
+        
+        with transaction.atomic():
+            MarketData.objects.create(year=2025, week=3, rainfall_mm=50, temperature_c=20)
+        with transaction.atomic():
+            market_data_loaded.send(sender=MarketData, report=None)
+        self.cards()
+        self.client.get(reverse('status-cards'))
+        
+        endpoints = self.client.get(reverse('cache-metrics')).json()['endpoints']
+        self.assertEqual(endpoints['dashboard_cards']['hits'], 1)
+        self.assertEqual(endpoints['status_cards']['misses'], 2)
+    
+    def test_waits_for_the_worker_holding_the_lock(self):
+        key = self.client.get(reverse('dashboard-cards'))['ETag'].strip('"')
+        cache.clear()
+        
+        # Another worker is computing the response, and stores it shortly
+        cache.add(f'dashboard:lock:{key}', True)
+        threading.Timer(0.1, cache.set, [f'dashboard:{key}', {'from': 'other worker'}]).start()
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(reverse('dashboard-cards')).json(), {'from': 'other worker'})
+        
+        # ...or gives up without a result: compute it here
+        cache.clear()
+        cache.add(f'dashboard:lock:{key}', True)
+        threading.Timer(0.1, cache.delete, [f'dashboard:lock:{key}']).start()
+        self.assertEqual(self.cards(), '0')
+        self.assertEqual(response_cache.stats.snapshot()['dashboard_cards']['coalesced'], 1)
+    
+    @override_settings(RESPONSE_CACHE_STALE_SECONDS=60)
+    def test_stale_while_revalidate(self):
+        etag = self.client.get(reverse('dashboard-cards'))['ETag']
+        with transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+        
+        with mock.patch.object(response_cache, '_revalidate') as revalidate:
+            response = self.client.get(reverse('dashboard-cards'))
+            self.assertEqual(response.json()['total_predictions']['value'], '0')
+            self.assertEqual(response['ETag'], etag)
+            self.assertEqual(self.client.get(reverse('dashboard-cards'), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        
+        # The background refresh
+        revalidate.call_args.args[1]()
+        response = self.client.get(reverse('dashboard-cards'), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.json()['total_predictions']['value'], '1')
+        self.assertEqual(response_cache.stats.snapshot()['dashboard_cards']['stale'], 2)
+        
+        with override_settings(RESPONSE_CACHE_STALE_SECONDS=0), transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+        with override_settings(RESPONSE_CACHE_STALE_SECONDS=0):
+            self.assertEqual(self.cards(), '2')
+    
+    @override_settings(RESPONSE_CACHE_STALE_SECONDS=60)
+    def test_revalidates_after_the_request_is_closed(self):
+        params = {'start': '2020-01-01'}
+        self.client.get(reverse('prediction-history'), params)
+        with transaction.atomic():
+            Prediction.objects.create(week=1, year=2025, predicted_demand='High', confidence_score=0.9)
+        
+        with mock.patch.object(response_cache, '_revalidate') as revalidate:
+            response = self.client.get(reverse('prediction-history'), params)
+        self.assertEqual(response.json()['count'], 0)
+        
+        # The server is done with the request before the refresh runs
+        response.wsgi_request.close()
+        response.wsgi_request.__dict__.clear()
+        revalidate.call_args.args[1]()
+        
+        response = self.client.get(reverse('prediction-history'), params)
+        self.assertEqual((response.json()['start'], response.json()['count']), ('2020-01-01', 1))
+        self.assertEqual(response_cache.stats.snapshot()['prediction_history']['hits'], 1)
+    
+    @override_settings(RESPONSE_CACHE=False)
+    def test_disabled(self):
+        self.cards()
+        response = self.client.get(reverse('dashboard-cards'))
+        self.assertNotIn('ETag', response)
+        self.assertEqual(response_cache.stats.snapshot(), {})
+
+
+class PredictionRollupTests(TestCase):
+    """Rollup maintenance on every kind of Prediction write"""
+    
+    def rollup(self):
+        return {
+            (row.day, row.predicted_demand): (row.count, round(row.confidence_sum, 6), row.confidence_min, row.confidence_max)
+            for row in PredictionRollup.objects.all()
+        }
+    
+    def assertRollupMatchesTable(self):
+        maintained = self.rollup()
+        rollup.rebuild()
+        self.assertEqual(maintained, self.rollup())
+    
+    def create(self, days_ago, demand, confidence):
+        return Prediction(
+            timestamp=timezone.now() - timedelta(days=days_ago), week=1, year=2025,
+            predicted_demand=demand, confidence_score=confidence,
+        )
+    
+    def test_tracks_writes(self):
+        first = self.create(0, 'High', 0.9)
+        first.save()
+        Prediction.objects.bulk_create([self.create(0, 'High', 0.7), self.create(0, 'Low', 0.6), self.create(3, 'High', 0.8)])
+        today = timezone.localdate()
+        self.assertEqual(self.rollup()[(today, 'High')], (2, 1.6, 0.7, 0.9))
+        self.assertRollupMatchesTable()
+        
+        first.predicted_demand = 'Medium'
+        first.save()
+        self.assertRollupMatchesTable()
+        
+        Prediction.objects.filter(predicted_demand='Low').update(confidence_score=0.5)
+        self.assertRollupMatchesTable()
+        
+        Prediction.objects.filter(predicted_demand='High').first().delete()
+        Prediction.objects.filter(predicted_demand='Low').delete()
+        self.assertRollupMatchesTable()
+        self.assertEqual(sum(count for count, _, _, _ in self.rollup().values()), 2)
+    
+    def test_rebuild_of_many_days(self):
+        self.create(2, 'Low', 0.4).save()
+        days = [timezone.localdate() - timedelta(days=offset) for offset in range(1500)]
+        self.assertEqual(rollup.rebuild(days), 1)
+        self.assertRollupMatchesTable()
+    
+    def test_rolls_back_with_the_prediction(self):
+        with self.assertRaises(RuntimeError):
+            with transaction.atomic():
+                self.create(0, 'High', 0.9).save()
+                raise RuntimeError
+        
+        self.assertEqual(PredictionRollup.objects.count(), 0)
+
+
+class PredictionLogTests(TestCase):
+    """Write-behind logging of served predictions"""
+    
+    def log(self, **kwargs):
+        # An hour-long interval keeps the flusher thread out of the test
+        return PredictionLog(**{'enabled': True, 'max_records': 100, 'flush_rows': 1000, 'flush_interval': 3600, **kwargs})
+    
+    def test_buffers_until_flushed(self):
+        log = self.log()
+        log.record('High', 0.9, week=5, rainfall_mm=75.0, temperature_c=23.0)
+        log.record('Low', 0.6, week=6, year=2025)
+        self.assertEqual(Prediction.objects.count(), 0)
+        
+        self.assertEqual(log.flush(), 2)
+        self.assertEqual(
+            sorted(Prediction.objects.values_list('week', 'predicted_demand')),
+            [(5, 'High'), (6, 'Low')],
+        )
+        self.assertEqual(sum(PredictionRollup.objects.values_list('count', flat=True)), 2)
+        self.assertEqual(log.stats()['written'], 2)
+        self.assertEqual(log.stats()['buffered'], 0)
+    
+    def test_overflow_is_dropped_and_counted(self):
+        log = self.log(max_records=3)
+        accepted = [log.record('Medium', 0.7, week=week) for week in range(5)]
+        
+        self.assertEqual(accepted, [True, True, True, False, False])
+        self.assertEqual(log.stats()['dropped'], 2)
+        log.close()
+        self.assertEqual(Prediction.objects.count(), 3)
+    
+    @skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_predict_enqueues_without_writing(self):
+        log = self.log()
+        with mock.patch('predictions.views.prediction_log', log):
+            with self.assertNumQueries(0):
+                prediction = self.client.get(reverse('predict-demand'), {'week': 12, 'rainfall_mm': 80}).json()
+            self.assertEqual(log.stats()['buffered'], 1)
+            
+            log.flush()
+        
+        logged = Prediction.objects.get()
+        self.assertEqual(logged.predicted_demand, prediction['predicted_demand'])
+        self.assertEqual((logged.week, logged.rainfall_mm), (12, 80.0))
+    
+    @skipUnless((MODELS_DIR / 'rf_model.pkl').exists(), 'rf_model.pkl not available')
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_dashboard_predictions_are_not_logged(self):
+        cache.clear()
+        log = self.log()
+        with mock.patch('predictions.views.prediction_log', log):
+            for name in ('current-week-prediction', 'simulate-weeks', 'dashboard'):
+                self.assertEqual(self.client.get(reverse(name)).status_code, 200)
+        
+        self.assertEqual(log.stats()['recorded'], 0)
+
+
+class PredictionRetentionTests(TestCase):
+    """Archival of old predictions and reads across archive and table"""
+    
+    def setUp(self):
+        cache.clear()
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        settings_override = override_settings(PREDICTION_ARCHIVE_DIR=Path(tmp.name))
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        
+        self.now = timezone.now()
+        Prediction.objects.bulk_create([
+            Prediction(
+                timestamp=self.now - timedelta(days=days), week=week, year=2025,
+                predicted_demand=demand, confidence_score=0.5 + days / 1000, rainfall_mm='75.50',
+            )
+            for week, (days, demand) in enumerate(((400, 'High'), (380, 'Low'), (200, 'High'), (10, 'Medium')), 1)
+        ])
+        self.rollup = list(PredictionRollup.objects.values_list('day', 'predicted_demand', 'count'))
+    
+    def test_archives_old_rows_and_keeps_the_rollup(self):
+        report = retention.archive_predictions(retention.retention_cutoff(180, now=self.now))
+        
+        self.assertEqual((report.archived, report.deleted), (3, 3))
+        self.assertEqual(list(Prediction.objects.values_list('week', flat=True)), [4])
+        self.assertEqual(len(retention.archived_months()), len(report.months))
+        self.assertEqual(list(PredictionRollup.objects.values_list('day', 'predicted_demand', 'count')), self.rollup)
+        rollup.rebuild()
+        self.assertEqual(list(PredictionRollup.objects.values_list('day', 'predicted_demand', 'count')), self.rollup)
+        
+        history = retention.predictions_between(self.now - timedelta(days=500), self.now)
+        self.assertEqual([prediction.week for prediction in history], [1, 2, 3, 4])
+        self.assertEqual(history[0].rainfall_mm, Decimal('75.50'))
+        self.assertEqual(history[0].timestamp, self.now - timedelta(days=400))
+        
+        # Nothing left to archive; a narrower window appends to the month files
+        self.assertEqual(retention.archive_predictions(retention.retention_cutoff(180, now=self.now)).archived, 0)
+        retention.archive_predictions(self.now)
+        self.assertEqual(Prediction.objects.count(), 0)
+        history = retention.predictions_between(self.now - timedelta(days=500), self.now + timedelta(days=1))
+        self.assertEqual([prediction.week for prediction in history], [1, 2, 3, 4])
+    
+    def test_rows_in_both_places_are_read_once(self):
+        # As after a crash between writing the archive and deleting the rows
+        cutoff = retention.retention_cutoff(180, now=self.now)
+        with mock.patch.object(type(Prediction.objects.all()), 'delete_archived', return_value=(0, {})):
+            self.assertEqual(retention.archive_predictions(cutoff).archived, 3)
+        self.assertEqual(Prediction.objects.count(), 4)
+        
+        retention.archive_predictions(cutoff)
+        self.assertEqual(Prediction.objects.count(), 1)
+        history = retention.predictions_between(self.now - timedelta(days=500), self.now)
+        self.assertEqual([prediction.week for prediction in history], [1, 2, 3, 4])
+    
+    @override_settings(ALLOWED_HOSTS=['testserver'])
+    def test_history_endpoint(self):
+        retention.archive_predictions(retention.retention_cutoff(180, now=self.now))
+        start = timezone.localdate(self.now - timedelta(days=390))
+        
+        history = self.client.get(reverse('prediction-history'), {'start': start.isoformat()}).json()
+        
+        self.assertEqual(history['count'], 3)
+        self.assertEqual([row['predicted_demand'] for row in history['predictions']], ['Low', 'High', 'Medium'])
+        self.assertEqual(self.client.get(reverse('prediction-history'), {'start': 'soon'}).status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every dashboard query over a large dataset; none may fall
+    back to a full scan of its table (SQLite and PostgreSQL).
+    
+    dashboard_cards is left out: it sums the whole rollup on purpose,
+    which grows by three rows a day.
+    """
+    
+    @classmethod
+    def setUpTestData(cls):
+        cls.now = timezone.now()
+        rng = random.Random(20)
+        # Plain bulk insert, then one rollup recount instead of an UPDATE per bucket
+        models.QuerySet(Prediction).bulk_create([
+            Prediction(
+                timestamp=cls.now - timedelta(minutes=rng.randrange(3 * 365 * 24 * 60)), week=rng.randint(1, 52),
+                year=2025, predicted_demand=rng.choice(['Low', 'Medium', 'High']), confidence_score=rng.random(),
+            )
+            for _ in range(10000)
+        ], batch_size=2000)
+        rollup.rebuild()
+        MarketData.objects.bulk_create([
+            MarketData(
+                year=year, week=week, month='January', rainfall_mm=75, temperature_c=23,
+                last_week_demand='Medium', market_demand='High',
+            )
+            for year in range(1900, 2100)
+            for week in range(1, 53)
+        ], batch_size=2000)
+        
+        # Planner statistics, as production has them
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+    
+    def assertIndexed(self, queryset):
+        table = queryset.model._meta.db_table
+        plan = queryset.explain()
+        # Walking a whole index in order is only fine when a LIMIT stops it
+        limited = queryset.query.high_mark is not None
+        if connection.vendor == 'postgresql':
+            full_scan = f'Seq Scan on {table}' in plan or (not limited and 'Index Cond' not in plan)
+        else:
+            # SQLite: SEARCH uses index bounds, SCAN reads every row (in index order with USING)
+            full_scan = any(
+                not (limited and 'USING' in detail)
+                for detail in re.findall(rf'\bSCAN {table}\b(.*)', plan)
+            )
+        self.assertFalse(full_scan, f'Full scan of {table}:\n{plan}')
+    
+    def test_market_data_queries(self):
+        # Latest weeks (chart_data, status_cards, business insights, tips)
+        self.assertIndexed(MarketData.objects.order_by('-year', '-week')[:12])
+        # simulate_weeks
+        self.assertIndexed(MarketData.objects.filter(year=2025, week__gte=1, week__lte=20).order_by('week'))
+    
+    def test_prediction_queries(self):
+        month_ago = self.now - timedelta(days=30)
+        # History and archival ranges
+        self.assertIndexed(Prediction.objects.filter(timestamp__gte=month_ago, timestamp__lt=self.now))
+        self.assertIndexed(Prediction.objects.filter(timestamp__lt=month_ago).order_by().dates('timestamp', 'month'))
+        # Oldest prediction and rollup rebuilds of a few days
+        self.assertIndexed(Prediction.objects.order_by('timestamp')[:1])
+        days = [timezone.localdate() - timedelta(days=offset) for offset in (1, 3, 8)]
+        self.assertIndexed(Prediction.objects.filter(rollup.on_days(days)).order_by().values('predicted_demand'))
+    
+    def test_rollup_queries(self):
+        week_ago = timezone.localdate() - timedelta(days=7)
+        # agricultural_tips and rollup.add()
+        self.assertIndexed(PredictionRollup.objects.filter(day__gt=week_ago))
+        self.assertIndexed(PredictionRollup.objects.filter(day=week_ago, predicted_demand='High'))
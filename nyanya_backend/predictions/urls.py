@@ -9,7 +9,13 @@ from . import views
 
 urlpatterns = [
     # Dashboard essentials only
+    path('dashboard/', views.dashboard_bundle, name='dashboard'),
     path('current-week/', views.current_week_prediction, name='current-week-prediction'),
+    path('predict/', views.predict_demand, name='predict-demand'),
+    path('batching-metrics/', views.batching_metrics, name='batching-metrics'),
+    path('cache-metrics/', views.response_cache_metrics, name='cache-metrics'),
+    path('model-info/', views.model_info, name='model-info'),
+    path('history/', views.prediction_history, name='prediction-history'),
     path('dashboard-cards/', views.dashboard_cards, name='dashboard-cards'),
     path('chart-data/', views.chart_data, name='chart-data'),
     path('simulate/', views.simulate_weeks, name='simulate-weeks'),
@@ -80,6 +80,8 @@ if 'simulation_playing' not in st.session_state:
     st.session_state.simulation_playing = False
 if 'simulation_frame' not in st.session_state:
     st.session_state.simulation_frame = 0
+if 'api_responses' not in st.session_state:
+    st.session_state.api_responses = {}
 
 def load_html_page():
     """Load and modify the HTML landing page to hide the original Get Started button"""
@@ -336,12 +338,37 @@ def show_auth_page():
                     else:
                         st.error("Registration failed")
 
+def get_json(url, params=None):
+    """GET a JSON API response, revalidating the copy from the previous rerun"""
+    key = (url, tuple(sorted((params or {}).items())))
+    cached = st.session_state.api_responses.get(key)
+    
+    # The backend answers 304 Not Modified while these still match
+    headers = {}
+    if cached:
+        if cached['etag']:
+            headers['If-None-Match'] = cached['etag']
+        if cached['last_modified']:
+            headers['If-Modified-Since'] = cached['last_modified']
+    
+    response = requests.get(url, params=params, headers=headers)
+    if response.status_code == 304 and cached:
+        return cached['data']
+    response.raise_for_status()
+    data = response.json()
+    
+    if 'ETag' in response.headers or 'Last-Modified' in response.headers:
+        st.session_state.api_responses[key] = {
+            'etag': response.headers.get('ETag'),
+            'last_modified': response.headers.get('Last-Modified'),
+            'data': data
+        }
+    return data
+
 def fetch_agricultural_tips():
     """Fetch agricultural tips from backend API"""
     try:
-        response = requests.get(f"{API_BASE_URL}/predictions/agricultural-tips/")
-        response.raise_for_status()
-        return response.json()
+        return get_json(f"{API_BASE_URL}/predictions/agricultural-tips/")
     except Exception as e:
         st.error(f"Error fetching agricultural tips: {e}")
         # Fallback tips
@@ -355,48 +382,19 @@ def fetch_agricultural_tips():
         }
 
 def fetch_dashboard_data():
-    """Fetch all dashboard data from APIs"""
+    """Fetch all dashboard data in one request to the dashboard bundle API"""
+    sections = ['cards', 'current', 'chart', 'simulation', 'status', 'market_insights', 'business_insights', 'tips']
     try:
-        cards_response = requests.get(f"{API_BASE_URL}/predictions/dashboard-cards/")
-        cards_data = cards_response.json() if cards_response.status_code == 200 else {}
-        
-        current_response = requests.get(f"{API_BASE_URL}/predictions/current-week/")
-        current_data = current_response.json() if current_response.status_code == 200 else {}
-        
-        chart_response = requests.get(f"{API_BASE_URL}/predictions/chart-data/")
-        chart_data = chart_response.json() if chart_response.status_code == 200 else {}
-        
         # Get more frames for better animation
-        simulation_response = requests.get(f"{API_BASE_URL}/predictions/simulate/?start=1&end=50&year=2025")
-        simulation_data = simulation_response.json() if simulation_response.status_code == 200 else {}
-        
-        status_response = requests.get(f"{API_BASE_URL}/predictions/status-cards/")
-        status_data = status_response.json() if status_response.status_code == 200 else {}
-        
-        # New APIs for charts
-        market_insights_response = requests.get(f"{API_BASE_URL}/predictions/market-insights/")
-        market_insights_data = market_insights_response.json() if market_insights_response.status_code == 200 else {}
-        
-        business_insights_response = requests.get(f"{API_BASE_URL}/predictions/business-insights/")
-        business_insights_data = business_insights_response.json() if business_insights_response.status_code == 200 else {}
-        
-        # Fetch agricultural tips
-        tips_response = requests.get(f"{API_BASE_URL}/predictions/agricultural-tips/")
-        tips_data = tips_response.json() if tips_response.status_code == 200 else {}
+        bundle = get_json(
+            f"{API_BASE_URL}/predictions/dashboard/",
+            params={'start': 1, 'end': 50, 'year': 2025}
+        )
         
-        return {
-            'cards': cards_data,
-            'current': current_data,
-            'chart': chart_data,
-            'simulation': simulation_data,
-            'status': status_data,
-            'market_insights': market_insights_data,
-            'business_insights': business_insights_data,
-            'tips': tips_data
-        }
+        return {section: bundle.get(section, {}) for section in sections}
     except Exception as e:
         st.error(f"Error fetching data: {str(e)}")
-        return {'cards': {}, 'current': {}, 'chart': {}, 'simulation': {}, 'status': {}, 'market_insights': {}, 'business_insights': {}, 'tips': {}}
+        return {section: {} for section in sections}
 
 def create_small_donut_chart(data):
     """Create a small donut chart for cards"""